@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+from benchmarks.suite import Suite
+from benchmarks.workload import Workload
+from utils.utils import Log
+
+# Usage: python benchmark.py [<benchmark>...] [--quick] [--repeat <n>] [--output <file>] [--baseline <file>] [--threshold <ratio>]
+#                            [--nodes <n>] [--lands <n>] [--transfers <ratio>] [--stakes <ratio>] [--length <n>] [--block-size <n>] [--seed <n>]
+# <benchmark> runs the benchmarks whose name starts with it (for example Blockchain or Node.mint), all of them by default
+# --quick runs smaller scaling curves with fewer iterations
+# --output writes the results as JSON, --baseline compares them with results written before and exits with status 1
+# if a benchmark is slower than in the baseline by more than --threshold (0.25 by default)
+# The workload options set the parameters of the generated workload (see Workload), each benchmark varies one of them
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", metavar="<file>")
+    parser.add_argument("--baseline", metavar="<file>")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--lands", type=int, default=1000)
+    parser.add_argument("--transfers", type=float, default=0.3)
+    parser.add_argument("--stakes", type=float, default=0.1)
+    parser.add_argument("--length", type=int, default=100)
+    parser.add_argument("--block-size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    # Only the progress of the benchmarks is logged, the events of the network would be timed as well
+    Log.setLevel("off")
+    Log.setLevel("info", "BENCHMARK")
+
+    workload = Workload(
+        arguments.nodes, arguments.lands, arguments.transfers, arguments.stakes,
+        arguments.length, arguments.block_size, arguments.seed
+    )
+    suite = Suite(workload, arguments.quick, arguments.repeat)
+    suite.run(arguments.benchmarks)
+    suite.printResults()
+    if arguments.output is not None:
+        suite.save(arguments.output)
+        Log.info(f"Results written to {arguments.output}", "BENCHMARK")
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = suite.compare(suite.results, baseline, arguments.threshold)
+        if len(regressions) > 0:
+            Log.setLevel("error")
+            Log.error(f"{len(regressions)} benchmarks are slower than the baseline by more than {arguments.threshold:.0%}")
+            Log.flush()
+            sys.exit(1)
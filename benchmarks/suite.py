@@ -0,0 +1,289 @@
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from typing import Callable
+
+from termcolor import colored
+from tabulate import tabulate
+
+from benchmarks.workload import Workload
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from blockchain.merkle_tree import MerkleTree
+from network.async_network import AsyncNetwork
+from network.election import Election
+from network.mempool import Mempool
+from network.network import Network
+from network.node import Node
+from utils.utils import Log
+
+# The Suite class times the hot paths of the network on generated workloads (see Workload)
+#
+# Every benchmark is run for every value of the parameter it scales with (its scaling curve):
+#   Network.broadcastTransaction: Number of nodes
+#   Network.broadcastTransactions, AsyncNetwork.broadcastTransactions: Number of nodes, timed per transaction so that the
+#   throughput of both kinds of network can be compared
+#   Node.getValidator: Number of peers, with an empty election cache (cold) and with the result cached
+#   Node.mint, Block.hashBlock, MerkleTree.getMerkleRoot: Number of transactions in the pool or block
+#   Blockchain queries: Length of the blockchain
+# A measurement runs the operation a number of times and is repeated, each repetition on a new setup. The best and the
+# median time per operation over the repetitions are reported. The garbage collector is disabled while timing, as in timeit
+#
+# Results are written as JSON: the environment, the workload parameters, a result per measurement and a curve per benchmark
+# Results can be compared with a baseline written earlier, a benchmark whose best time grew by more than the threshold is a regression
+class Suite:
+    VERSION = 1
+
+    SWEEPS = {
+        "nodes": [2, 8, 32],
+        "peers": [10, 100, 1000],
+        "transactions": [10, 100, 1000],
+        "length": [100, 1000, 10000]
+    }
+    QUICK_SWEEPS = {
+        "nodes": [2, 8],
+        "peers": [10, 100],
+        "transactions": [10, 100],
+        "length": [100, 1000]
+    }
+    ITERATIONS = 1000
+    QUICK_ITERATIONS = 100
+    QUERIES = [
+        "getLength", "hasTransaction", "getTransaction", "getLandHistory", "getLandOwner", "getLandOwners",
+        "getBlockFromHeight", "getLastBlock", "getStakes", "getAges", "getBalance", "getAllBalances"
+    ]
+
+    def __init__(self, workload: Workload, quick: bool = False, repeat: int = 5) -> None:
+        self.workload = workload
+        self.sweeps = Suite.QUICK_SWEEPS if quick else Suite.SWEEPS
+        self.iterations = Suite.QUICK_ITERATIONS if quick else Suite.ITERATIONS
+        self.repeat = repeat
+        self.results: list[dict] = []
+        self.benchmarks: dict[str, Callable[[], None]] = {
+            "Network.broadcastTransaction": self.benchmarkBroadcast,
+            "Network.broadcastTransactions": lambda: self.benchmarkBroadcasts(Network),
+            "AsyncNetwork.broadcastTransactions": lambda: self.benchmarkBroadcasts(AsyncNetwork),
+            "Node.getValidator": self.benchmarkValidator,
+            "Node.mint": self.benchmarkMint,
+            "Block.hashBlock": self.benchmarkHash,
+            "MerkleTree.getMerkleRoot": self.benchmarkMerkleRoot,
+            "Blockchain": self.benchmarkQueries
+        }
+
+    # Runs the benchmarks whose name starts with one of the given prefixes (all of them if there is none)
+    def run(self, prefixes: list[str] | None = None) -> list[dict]:
+        for name, benchmark in self.benchmarks.items():
+            if not prefixes or any(name.startswith(prefix) or prefix.startswith(name) for prefix in prefixes):
+                benchmark()
+        if prefixes:
+            self.results = [
+                result for result in self.results if any(result["benchmark"].startswith(prefix) for prefix in prefixes)
+            ]
+        return self.results
+
+    # Times an operation
+    # setup is called before every repetition and returns the operation, which is called with the numbers 0 to iterations - 1
+    # size is the number of operations done by every call (for example the transactions of a batch)
+    def measure(
+        self, name: str, parameter: str, value: int, setup: Callable[[], Callable[[int], object]], iterations: int, size: int = 1
+    ) -> None:
+        times = []
+        for _ in range(self.repeat):
+            operation = setup()
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for iteration in range(iterations):
+                    operation(iteration)
+                times.append((time.perf_counter() - start) / (iterations * size))
+            finally:
+                gc.enable()
+
+        best = min(times)
+        self.results.append({
+            "benchmark": name,
+            "parameter": parameter,
+            "value": value,
+            "iterations": iterations * size,
+            "repeat": self.repeat,
+            "best": best,
+            "median": statistics.median(times),
+            "operationsPerSecond": 1 / best if best > 0 else None
+        })
+        Log.info(f"{name} ({parameter}={value}): {Suite.formatTime(best)} per operation", "BENCHMARK")
+
+    # Broadcasts new transactions to a network, the nodes mint blocks following the block policy (see BlockPolicy)
+    def benchmarkBroadcast(self) -> None:
+        for nodes in self.sweeps["nodes"]:
+            def setup() -> Callable[[int], object]:
+                workload = self.workload.vary(nodes=nodes)
+                network = workload.createNetwork(workload.createBlockchain())
+                transactions = workload.generateTransactions(self.iterations)
+                return lambda iteration: network.broadcastTransaction(transactions[iteration])
+            self.measure("Network.broadcastTransaction", "nodes", nodes, setup, self.iterations)
+
+    # Broadcasts a list of new transactions at once, as the throughput command does
+    # The transactions are pipelined through the actors of an AsyncNetwork while a Network handles them one after the other
+    def benchmarkBroadcasts(self, networkClass: type[Network]) -> None:
+        for nodes in self.sweeps["nodes"]:
+            def setup() -> Callable[[int], object]:
+                workload = self.workload.vary(nodes=nodes)
+                network = workload.createNetwork(workload.createBlockchain(), networkClass)
+                transactions = workload.generateTransactions(self.iterations)
+                return lambda iteration: network.broadcastTransactions(transactions)
+            self.measure(f"{networkClass.__name__}.broadcastTransactions", "nodes", nodes, setup, 1, self.iterations)
+
+    def benchmarkValidator(self) -> None:
+        for peers in self.sweeps["peers"]:
+            workload = self.workload.vary(nodes=peers)
+            node = workload.createNetwork(workload.createBlockchain()).nodes[workload.nodeIds[0]]
+
+            def cold(iteration: int) -> str:
+                Election.cache.clear()
+                return node.getValidator(workload.nodeIds)
+            self.measure("Node.getValidator", "peers", peers, lambda: cold, self.iterations)
+            self.measure("Node.getValidator (cached)", "peers", peers, lambda: lambda iteration: node.getValidator(workload.nodeIds), self.iterations)
+
+    # Mints a block of all the transactions of a full pool
+    def benchmarkMint(self) -> None:
+        for transactions in self.sweeps["transactions"]:
+            def setup() -> Callable[[int], object]:
+                workload = self.workload.vary()
+                blockchain = workload.createBlockchain()
+                node = Node(workload.nodeIds[0], blockchain, Mempool())
+                for transaction in workload.generateTransactions(transactions):
+                    node.transactionPool.add(transaction, blockchain)
+                return lambda iteration: node.mint(verbose=False)
+            self.measure("Node.mint", "transactions", transactions, setup, 1)
+
+    def benchmarkHash(self) -> None:
+        for transactions in self.sweeps["transactions"]:
+            workload = self.workload.vary()
+            block = Block.createBlock(1, Block.genesis(), workload.nodeIds[0], workload.generateTransactions(transactions))
+            self.measure("Block.hashBlock", "transactions", transactions, lambda: lambda iteration: Block.hashBlock(block), self.iterations)
+
+    def benchmarkMerkleRoot(self) -> None:
+        for transactions in self.sweeps["transactions"]:
+            data = self.workload.vary().generateTransactions(transactions)
+            iterations = max(1, self.iterations // transactions)
+            self.measure("MerkleTree.getMerkleRoot", "transactions", transactions, lambda: lambda iteration: MerkleTree.getMerkleRoot(data), iterations)
+
+    # Runs every query on blockchains of increasing length, with arguments drawn from the blockchain
+    def benchmarkQueries(self) -> None:
+        for length in self.sweeps["length"]:
+            workload = self.workload.vary(length=length)
+            blockchain = workload.createBlockchain()
+            generator = random.Random(workload.seed)
+            transactionIds = [
+                transaction.id for block in blockchain.chain for transaction in block.data
+            ]
+            transactionIds = [generator.choice(transactionIds) for _ in range(self.iterations)]
+            landIds = [generator.choice(workload.ownedLands) for _ in range(self.iterations)] if workload.ownedLands else [""] * self.iterations
+            nodeIds = [generator.choice(workload.nodeIds) for _ in range(self.iterations)]
+            heights = [generator.randrange(blockchain.getLength()) for _ in range(self.iterations)]
+            peers = workload.nodeIds
+
+            queries: dict[str, Callable[[Blockchain, int], object]] = {
+                "getLength": lambda blockchain, iteration: blockchain.getLength(),
+                "hasTransaction": lambda blockchain, iteration: blockchain.hasTransaction(transactionIds[iteration]),
+                "getTransaction": lambda blockchain, iteration: blockchain.getTransaction(transactionIds[iteration]),
+                "getLandHistory": lambda blockchain, iteration: blockchain.getLandHistory(landIds[iteration]),
+                "getLandOwner": lambda blockchain, iteration: blockchain.getLandOwner(landIds[iteration]),
+                "getLandOwners": lambda blockchain, iteration: blockchain.getLandOwners(),
+                "getBlockFromHeight": lambda blockchain, iteration: blockchain.getBlockFromHeight(heights[iteration]),
+                "getLastBlock": lambda blockchain, iteration: blockchain.getLastBlock(),
+                "getStakes": lambda blockchain, iteration: blockchain.getStakes(peers),
+                "getAges": lambda blockchain, iteration: blockchain.getAges(peers),
+                "getBalance": lambda blockchain, iteration: blockchain.getBalance(nodeIds[iteration]),
+                "getAllBalances": lambda blockchain, iteration: blockchain.getAllBalances()
+            }
+            for name in Suite.QUERIES:
+                query = queries[name]
+                self.measure(f"Blockchain.{name}", "length", length, lambda: lambda iteration: query(blockchain, iteration), self.iterations)
+
+    # Returns the results along with the environment, the workload and the scaling curve of every benchmark
+    def getReport(self) -> dict:
+        curves: dict[str, dict] = {}
+        for result in self.results:
+            curve = curves.setdefault(result["benchmark"], {"parameter": result["parameter"], "values": [], "best": []})
+            curve["values"].append(result["value"])
+            curve["best"].append(result["best"])
+        return {
+            "version": Suite.VERSION,
+            "time": time.time(),
+            "environment": {
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "processors": os.cpu_count()
+            },
+            "workload": self.workload.getParameters(),
+            "iterations": self.iterations,
+            "repeat": self.repeat,
+            "results": self.results,
+            "curves": curves
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.getReport(), file, indent=2)
+
+    def printResults(self) -> None:
+        rows = [
+            [result["benchmark"], f"{result['parameter']}={result['value']}", Suite.formatTime(result["best"]),
+             Suite.formatTime(result["median"]), f"{result['operationsPerSecond']:,.0f}" if result["operationsPerSecond"] else "-"]
+            for result in self.results
+        ]
+        Log.output(tabulate(rows, headers=[
+            colored("Benchmark", attrs=['bold']),
+            colored("Scale", attrs=['bold']),
+            colored("Best", attrs=['bold']),
+            colored("Median", attrs=['bold']),
+            colored("Operations/s", attrs=['bold'])
+        ], tablefmt="simple"))
+
+    # Compares the results with the results of a baseline report
+    # Returns the measurements whose best time grew by more than threshold (0.25 for 25%), and prints the comparison
+    @staticmethod
+    def compare(results: list[dict], baseline: dict, threshold: float) -> list[dict]:
+        baselineResults = {
+            (result["benchmark"], result["parameter"], result["value"]): result for result in baseline["results"]
+        }
+        regressions = []
+        rows = []
+        for result in results:
+            previous = baselineResults.get((result["benchmark"], result["parameter"], result["value"]))
+            if previous is None or previous["best"] <= 0:
+                continue
+            change = result["best"] / previous["best"] - 1
+            status = ""
+            if change > threshold:
+                regressions.append(result)
+                status = colored("regression", 'red', attrs=['bold'])
+            elif change < -threshold:
+                status = colored("improvement", 'green', attrs=['bold'])
+            rows.append([
+                result["benchmark"], f"{result['parameter']}={result['value']}", Suite.formatTime(previous["best"]),
+                Suite.formatTime(result["best"]), f"{change:+.1%}", status
+            ])
+        Log.output(tabulate(rows, headers=[
+            colored("Benchmark", attrs=['bold']),
+            colored("Scale", attrs=['bold']),
+            colored("Baseline", attrs=['bold']),
+            colored("Best", attrs=['bold']),
+            colored("Change", attrs=['bold']),
+            colored("Status", attrs=['bold'])
+        ], tablefmt="simple"))
+        return regressions
+
+    @staticmethod
+    def formatTime(seconds: float) -> str:
+        for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+            if seconds >= scale:
+                return f"{seconds / scale:.2f}{unit}"
+        return f"{seconds / 1e-9:.0f}ns"
@@ -0,0 +1,129 @@
+import random
+
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from blockchain.transaction import Transaction
+from network.election import Election
+from network.mempool import Mempool
+from network.network import Network
+from network.node import Node
+
+# The Workload class generates land registry workloads for the benchmarks
+#
+# Parameters
+#   nodes: Number of nodes, named node-<n>, which all receive BALANCE coins in the first block
+#   lands: Number of lands which are registered, named land-<n>. Once they are all registered only transfers and stakes are generated
+#   transfers, stakes: Share of the transactions which are land transfers and stakes, the rest are land registrations
+#   length, blockSize: Number of blocks of the generated blockchain, after the first one, and transactions per block
+#   seed: Seed of the random number generator, the same parameters always generate the same operations
+# Every generated transaction is valid: transfers are only generated for lands owned in the blockchain (see settle)
+# which no pending transaction refers to
+class Workload:
+    BALANCE = 10 ** 9
+    MAX_STAKE = 10
+    TRANSFER_ATTEMPTS = 5
+
+    def __init__(
+        self,
+        nodes: int = 10,
+        lands: int = 1000,
+        transfers: float = 0.3,
+        stakes: float = 0.1,
+        length: int = 100,
+        blockSize: int = 10,
+        seed: int = 0
+    ) -> None:
+        self.nodes = nodes
+        self.lands = lands
+        self.transfers = transfers
+        self.stakes = stakes
+        self.length = length
+        self.blockSize = blockSize
+        self.seed = seed
+
+        self.random = random.Random(seed)
+        self.nodeIds = [f"node-{n}" for n in range(nodes)]
+        self.registered = 0
+        self.owners: dict[str, str] = {}
+        self.ownedLands: list[str] = []
+        self.pending: dict[str, str] = {}
+
+    def getParameters(self) -> dict[str, int | float]:
+        return {
+            "nodes": self.nodes,
+            "lands": self.lands,
+            "transfers": self.transfers,
+            "stakes": self.stakes,
+            "length": self.length,
+            "blockSize": self.blockSize,
+            "seed": self.seed
+        }
+
+    # Returns a copy of the workload with some parameters changed (for example to sweep the number of nodes)
+    def vary(self, **parameters: int | float) -> 'Workload':
+        return Workload(**{**self.getParameters(), **parameters})
+
+    def nextTransaction(self) -> Transaction:
+        draw = self.random.random()
+        if draw < self.stakes or (self.registered == self.lands and self.nodes < 2):
+            return Transaction.newSTTransaction(self.random.choice(self.nodeIds), self.random.randint(1, Workload.MAX_STAKE))
+        if draw < self.stakes + self.transfers or self.registered == self.lands:
+            transaction = self.nextTransfer()
+            if transaction is not None:
+                return transaction
+        if self.registered == self.lands:
+            return Transaction.newSTTransaction(self.random.choice(self.nodeIds), self.random.randint(1, Workload.MAX_STAKE))
+
+        landId = f"land-{self.registered}"
+        self.registered += 1
+        ownerId = self.random.choice(self.nodeIds)
+        self.pending[landId] = ownerId
+        return Transaction.newLDTransaction(ownerId, landId)
+
+    # Returns a transfer of a land owned in the blockchain to another node, or None if no such land was found
+    def nextTransfer(self) -> Transaction | None:
+        if len(self.ownedLands) == 0 or self.nodes < 2:
+            return None
+        for _ in range(Workload.TRANSFER_ATTEMPTS):
+            landId = self.random.choice(self.ownedLands)
+            if landId in self.pending:
+                continue
+            sellerId = self.owners[landId]
+            receiverId = self.random.choice(self.nodeIds)
+            while receiverId == sellerId:
+                receiverId = self.random.choice(self.nodeIds)
+            self.pending[landId] = receiverId
+            return Transaction.newLTTransaction(sellerId, landId, receiverId)
+        return None
+
+    def generateTransactions(self, count: int) -> list[Transaction]:
+        return [self.nextTransaction() for _ in range(count)]
+
+    # Marks the lands of the generated transactions as owned in the blockchain, once they are included in blocks
+    def settle(self) -> None:
+        for landId, ownerId in self.pending.items():
+            if landId not in self.owners:
+                self.ownedLands.append(landId)
+            self.owners[landId] = ownerId
+        self.pending = {}
+
+    # Generates a blockchain of length blocks of blockSize transactions after the block giving their balance to the nodes
+    # The validator of every block is elected as in the network, so that the stakes and ages of the nodes change as they would
+    def createBlockchain(self) -> Blockchain:
+        blockchain = Blockchain()
+        for height in range(self.length + 1):
+            if height == 0:
+                data = [Transaction.newRCTransaction(nodeId, Workload.BALANCE) for nodeId in self.nodeIds]
+            else:
+                data = self.generateTransactions(self.blockSize)
+            validator = Election.getValidator(blockchain, self.nodeIds)
+            blockchain.addBlock(Block.createBlock(blockchain.getLength(), blockchain.getLastBlock(), validator, data))
+            self.settle()
+        return blockchain
+
+    # Creates a network of the nodes following a blockchain, with empty transaction pools
+    # networkClass is Network or a subclass of it, for example AsyncNetwork
+    def createNetwork(self, blockchain: Blockchain, networkClass: type[Network] = Network) -> Network:
+        network = networkClass()
+        network.addNodes([Node(nodeId, blockchain.share(), Mempool()) for nodeId in self.nodeIds])
+        return network
@@ -0,0 +1,141 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from blockchain.blockchain import Blockchain
+from blockchain.transaction import Transaction
+
+# The Analytics class answers group-by and aggregate queries over the transactions of a blockchain with NumPy
+#
+# The transactions are kept in a columnar archive, one array per column:
+#   code: Type code of the transaction (see Transaction)
+#   height: Height of the block holding the transaction
+#   time: Timestamp in microseconds since the epoch
+#   user, land, receiver: Indexes of the user, land and receiver IDs in the table of IDs (-1 when empty)
+#   amount: Amount of coins
+# The archive is built incrementally: every query first appends the blocks added to the blockchain since the last query
+# It is rebuilt when the blockchain switched to another chain (for example a shorter fork)
+#
+# Queries group the rows by ID and by period (PERIODS), which are computed with vectorized NumPy operations
+# NumPy is an optional dependency, it is only needed when the analytics are used
+class Analytics:
+    COLUMNS = {"code": "u1", "height": "i8", "time": "i8", "user": "i4", "land": "i4", "receiver": "i4", "amount": "i8"}
+
+    # Periods of the queries and the NumPy datetime unit they truncate the timestamps to
+    PERIODS = {"hour": "h", "day": "D", "month": "M", "year": "Y"}
+
+    def __init__(self) -> None:
+        if np is None:
+            raise RuntimeError("The analytics need NumPy (pip install numpy)")
+        self.clear(None)
+
+    def clear(self, store) -> None:
+        self.store = store
+        self.length = 0
+        self.tipHash = ""
+        self.ids: list[str] = []
+        self.idIndexes: dict[str, int] = {}
+        self.columns = {name: np.empty(0, dtype) for name, dtype in Analytics.COLUMNS.items()}
+        self.pending: dict[str, list[int]] = {name: [] for name in Analytics.COLUMNS}
+
+    # Appends the blocks of the blockchain which are not in the archive yet
+    def update(self, blockchain: Blockchain) -> None:
+        store = blockchain.store
+        if self.store is not store or self.length > blockchain.getLength() or (
+            self.length > 0 and store.blocks[self.length - 1].hash != self.tipHash
+        ):
+            self.clear(store)
+
+        pending = self.pending
+        for height in range(self.length, blockchain.getLength()):
+            block = store.blocks[height]
+            for transaction in block.data:
+                pending["code"].append(transaction.code)
+                pending["height"].append(height)
+                pending["time"].append(transaction.time)
+                pending["user"].append(self.getIdIndex(transaction.userId))
+                pending["land"].append(self.getIdIndex(transaction.landId))
+                pending["receiver"].append(self.getIdIndex(transaction.receiverId))
+                pending["amount"].append(transaction.amount)
+            self.tipHash = block.hash
+        self.length = blockchain.getLength()
+
+        if len(pending["code"]) > 0:
+            for name, dtype in Analytics.COLUMNS.items():
+                self.columns[name] = np.concatenate([self.columns[name], np.array(pending[name], dtype=dtype)])
+            self.pending = {name: [] for name in Analytics.COLUMNS}
+
+    def getIdIndex(self, id: str) -> int:
+        if id == "":
+            return -1
+        index = self.idIndexes.get(id)
+        if index is None:
+            index = len(self.ids)
+            self.ids.append(id)
+            self.idIndexes[id] = index
+        return index
+
+    # Returns the columns of the transactions of the blockchain
+    def getColumns(self, blockchain: Blockchain) -> dict:
+        self.update(blockchain)
+        return self.columns
+
+    # Returns the periods of the timestamps as an index into the sorted array of distinct periods, along with that array
+    @staticmethod
+    def getPeriods(times, period: str) -> tuple:
+        if period not in Analytics.PERIODS:
+            raise ValueError(f"Unknown period {period} (use {', '.join(Analytics.PERIODS)})")
+        periods = times.astype("datetime64[us]").astype(f"datetime64[{Analytics.PERIODS[period]}]")
+        distinct, indexes = np.unique(periods, return_inverse=True)
+        return indexes.reshape(-1), distinct
+
+    # Returns the number of transfers of every land in every period, most transferred first
+    def getTransfersPerLand(self, blockchain: Blockchain, period: str = "month", limit: int | None = None) -> list[tuple[str, str, int]]:
+        columns = self.getColumns(blockchain)
+        transfers = columns["code"] == Transaction.LT
+        periodIndexes, periods = Analytics.getPeriods(columns["time"][transfers], period)
+        keys = columns["land"][transfers].astype("i8") * max(len(periods), 1) + periodIndexes
+        keys, counts = np.unique(keys, return_counts=True)
+        order = np.lexsort((keys, -counts))[:limit]
+        return [
+            (self.ids[keys[i] // len(periods)], str(periods[keys[i] % len(periods)]), int(counts[i])) for i in order
+        ]
+
+    # Returns the users owning the most lands with the number of lands they own, most lands first
+    def getTopHolders(self, blockchain: Blockchain, limit: int | None = 10) -> list[tuple[str, int]]:
+        columns = self.getColumns(blockchain)
+        code = columns["code"]
+        lands = (code == Transaction.LD) | (code == Transaction.LT)
+        owners = np.where(code[lands] == Transaction.LD, columns["user"][lands], columns["receiver"][lands])
+        landIds = columns["land"][lands]
+        # The owner of a land is the new owner of its last transaction
+        _, lastIndexes = np.unique(landIds[::-1], return_index=True)
+        counts = np.bincount(owners[len(landIds) - 1 - lastIndexes], minlength=len(self.ids))
+        order = np.argsort(-counts, kind="stable")[:limit]
+        return [(self.ids[i], int(counts[i])) for i in order if counts[i] > 0]
+
+    # Returns the total stake of every user at the end of every period (cumulative), with its share of all stakes
+    # The totals only have a column per user who staked, not per ID (which include the land IDs)
+    def getStakeDistribution(self, blockchain: Blockchain, period: str = "month") -> list[tuple[str, str, int, float]]:
+        columns = self.getColumns(blockchain)
+        stakes = columns["code"] == Transaction.ST
+        periodIndexes, periods = Analytics.getPeriods(columns["time"][stakes], period)
+        stakers, stakerIndexes = np.unique(columns["user"][stakes], return_inverse=True)
+        totals = np.zeros((len(periods), len(stakers)), dtype="i8")
+        np.add.at(totals, (periodIndexes, stakerIndexes), columns["amount"][stakes])
+        totals = np.cumsum(totals, axis=0)
+        sums = totals.sum(axis=1)
+        return [
+            (str(periods[p]), self.ids[stakers[s]], int(totals[p, s]), float(totals[p, s] / sums[p]))
+            for p, s in zip(*np.nonzero(totals))
+        ]
+
+    # Returns the number of transactions of every type in every period
+    def getActivity(self, blockchain: Blockchain, period: str = "day") -> list[tuple[str, str, int]]:
+        columns = self.getColumns(blockchain)
+        periodIndexes, periods = Analytics.getPeriods(columns["time"], period)
+        keys, counts = np.unique(periodIndexes.astype("i8") * 256 + columns["code"], return_counts=True)
+        return [
+            (str(periods[key // 256]), Transaction.CODE_TYPES[int(key % 256)], int(count)) for key, count in zip(keys, counts)
+        ]
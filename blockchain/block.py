@@ -1,12 +1,15 @@
 import hashlib
-import pickle
+import struct
+import sys
 from datetime import datetime
 from termcolor import colored
 from tabulate import tabulate
 
+from blockchain.codec import Codec
 from blockchain.merkle_tree import MerkleTree
 from blockchain.transaction import Transaction
 from blockchain.constants import GENESIS_BLOCK_MERKLE_ROOT, GENESIS_BLOCK_VALIDATOR, GENESIS_BLOCK_PREVIOUS_BLOCK_HASH, GENESIS_BLOCK_DATA
+from utils.utils import Metrics
 
 # The Block class is used to represent a block in the blockchain and has methods relating to creating and modifying blocks
 # The structure of the block is as follows
@@ -19,33 +22,60 @@ from blockchain.constants import GENESIS_BLOCK_MERKLE_ROOT, GENESIS_BLOCK_VALIDA
 #   Validator: The ID of the validator of the block
 # BLOCK DATA
 #   Transaction 1 ... n 
+#
+# The hash of a block is computed once when the block is created and is taken over its header only
+# The block data is already committed to by the merkle root in the header
+# Blocks are stored in slots like transactions, with the timestamp as the number of microseconds since the epoch (time)
 class Block:
+    # ID and timestamp of the binary header (followed by the previous block hash, merkle root and validator)
+    HEADER_FORMAT = struct.Struct(">Qq")
+
+    __slots__ = ("id", "time", "previousBlockHash", "merkleRoot", "validator", "data", "hash")
+
     def __init__(
         self,
         id: int,
-        timestamp: datetime,
+        time: int,
         previousBlockHash: str,
         merkleRoot: str,
         validator: str,
         data: list[Transaction]
     ) -> None:
         self.id = id
-        self.timestamp = timestamp
+        self.time = time
         self.previousBlockHash = previousBlockHash
         self.merkleRoot = merkleRoot
-        self.validator = validator
+        self.validator = sys.intern(validator)
         self.data = data
+        self.hash = Block.hashBlock(self)
+
+    @property
+    def timestamp(self) -> datetime:
+        return Codec.decodeTimestamp(self.time)
 
     @staticmethod
     def hashBlock(block: 'Block') -> str:
-        return hashlib.sha256(Block.serialize(block)).hexdigest()
+        Metrics.increment("hashes_computed_total", "block")
+        return hashlib.sha256(Block.encodeHeader(block)).hexdigest()
+
+    # Encodes the block header into a fixed layout which gives the same bytes on every platform and Python version
+    #   ID: 8 byte unsigned integer
+    #   Timestamp: 8 byte integer (microseconds since the epoch)
+    #   Prev. block hash, Merkle root, Validator: Length prefixed strings
+    @staticmethod
+    def encodeHeader(block: 'Block') -> bytes:
+        return b"".join([
+            Block.HEADER_FORMAT.pack(block.id, block.time),
+            Codec.encodeString(block.previousBlockHash),
+            Codec.encodeString(block.merkleRoot),
+            Codec.encodeString(block.validator)
+        ])
 
     @staticmethod
     def genesis() -> 'Block':
-        timestamp = datetime.now()
         return Block(
             0,
-            timestamp, 
+            Codec.encodeTimestamp(datetime.now()),
             GENESIS_BLOCK_PREVIOUS_BLOCK_HASH, 
             GENESIS_BLOCK_MERKLE_ROOT, 
             GENESIS_BLOCK_VALIDATOR,
@@ -54,15 +84,79 @@ class Block:
 
     @staticmethod
     def createBlock(id: int, lastBlock: 'Block', validator: str, data: list[Transaction]) -> 'Block':
-        timestamp = datetime.now()
-        previousBlockHash = Block.hashBlock(lastBlock)
+        previousBlockHash = lastBlock.hash
         merkleRoot = MerkleTree.getMerkleRoot(data)
-        return Block(id, timestamp, previousBlockHash, merkleRoot, validator, data)
+        return Block(id, Codec.encodeTimestamp(datetime.now()), previousBlockHash, merkleRoot, validator, data)
     
     @staticmethod
     def serialize(block: 'Block') -> bytes:
-        return pickle.dumps(block)
-    
+        return Codec.encodeVersion() + Block.encode(block)
+
+    @staticmethod
+    def deserialize(data: bytes | memoryview) -> 'Block':
+        view = memoryview(data)
+        block, _ = Block.decode(view, Codec.decodeVersion(view))
+        return block
+
+    @staticmethod
+    def serializeMany(blocks: list['Block']) -> bytes:
+        return Codec.encodeVersion() + Block.encodeMany(blocks)
+
+    @staticmethod
+    def deserializeMany(data: bytes | memoryview) -> list['Block']:
+        view = memoryview(data)
+        blocks, _ = Block.decodeMany(view, Codec.decodeVersion(view))
+        return blocks
+
+    # Binary format of a block
+    #   Header: The header as encoded by encodeHeader
+    #   Data: 4 byte transaction count followed by the encoded transactions
+    @staticmethod
+    def encode(block: 'Block') -> bytes:
+        return Block.encodeHeader(block) + Transaction.encodeMany(block.data)
+
+    @staticmethod
+    def decode(view: memoryview, offset: int) -> tuple['Block', int]:
+        id, timestamp = Block.HEADER_FORMAT.unpack_from(view, offset)
+        offset += Block.HEADER_FORMAT.size
+        previousBlockHash, offset = Codec.decodeString(view, offset)
+        merkleRoot, offset = Codec.decodeString(view, offset)
+        validator, offset = Codec.decodeString(view, offset)
+        data, offset = Transaction.decodeMany(view, offset)
+        return Block(id, timestamp, previousBlockHash, merkleRoot, validator, data), offset
+
+    @staticmethod
+    def encodeMany(blocks: list['Block']) -> bytes:
+        return Codec.encodeCount(len(blocks)) + b"".join([Block.encode(block) for block in blocks])
+
+    @staticmethod
+    def decodeMany(view: memoryview, offset: int) -> tuple[list['Block'], int]:
+        count, offset = Codec.decodeCount(view, offset)
+        blocks = []
+        for _ in range(count):
+            block, offset = Block.decode(view, offset)
+            blocks.append(block)
+        return blocks, offset
+
+    # Returns the block as a dictionary of JSON values
+    def toDict(self) -> dict:
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp.isoformat(),
+            "previousBlockHash": self.previousBlockHash,
+            "merkleRoot": self.merkleRoot,
+            "validator": self.validator,
+            "hash": self.hash,
+            "transactions": [transaction.toDict() for transaction in self.data]
+        }
+
+    # Returns the header of the block as a line of tab separated values, followed by a line for every transaction
+    def toPlain(self) -> str:
+        return "\n".join(
+            [f"{self.id}\t{self.timestamp}\t{self.hash}\t{self.validator}\t{len(self.data)}"] +
+            [f"\t{transaction.toPlain()}" for transaction in self.data]
+        )
+
     def __str__(self) -> str:
         return tabulate([
             [colored("BLOCK HEADER", "green", attrs=["bold"]), "", ""],
@@ -0,0 +1,293 @@
+import weakref
+from bisect import bisect_right
+from typing import Iterator
+
+from blockchain.block import Block
+from blockchain.constants import CHECKPOINT_INTERVAL, MAX_REORG_DEPTH, SNAPSHOT_INTERVAL
+from blockchain.disk_store import BlockList, DiskStore
+from blockchain.snapshot import Snapshot
+from blockchain.state import State
+from blockchain.transaction import Transaction
+from utils.utils import Metrics
+
+# The BlockStore class holds a chain of blocks along with everything derived from it
+#   Blocks: The blocks of the chain, starting with the genesis block
+#   State: The world state at the tip of the chain
+#   Undo records: For every block since undoBase, the changes it made to the state
+#   Checkpoints: Chain length -> Copy of the state after that many blocks, every CHECKPOINT_INTERVAL blocks
+#   Transaction index: Transaction ID -> (block height, position in block)
+#   Land index: Land ID -> Ordered list of (block height, position in block) of its declaration and transfers
+#
+# Blocks are immutable once appended, so a single store is shared by the blockchains of every node that follows the same chain
+# The store keeps weak references to the blockchains using it, and to the branches (see BranchStore) built on its blocks
+#
+# A blockchain that diverges from the store switches the store to its branch in place (see reorganize): the state is
+# rolled back with the undo records of the dropped blocks and only their index entries are removed, so the switch costs
+# its depth. The blockchains which are still on the dropped blocks are moved to a BranchStore holding only those blocks
+# When the dropped blocks are already on disk or have no undo records, the diverging blockchain gets a copy of the store
+# instead (see getFork)
+#
+# A store can be persisted to a DiskStore, in which case only the blocks appended since the last save are written
+# Snapshots of the state and indexes are saved along with the blocks every SNAPSHOT_INTERVAL blocks
+#
+# The state after any number of blocks is rebuilt from the nearest checkpoint, by applying the blocks after a checkpoint
+# or reverting the blocks before one with their undo records, so historical queries replay at most CHECKPOINT_INTERVAL blocks
+class BlockStore:
+    def __init__(self, blocks: list[Block]) -> None:
+        self.blocks: list[Block] | BlockList = []
+        self.state = State()
+        self.undo: list[list[tuple[str, str, object]]] = []
+        self.undoBase = 0
+        self.checkpoints: dict[int, State] = {}
+        self.transactionIndex: dict[bytes, tuple[int, int]] = {}
+        self.landIndex: dict[str, list[tuple[int, int]]] = {}
+        self.disk: DiskStore | None = None
+        self.snapshotLength = 0
+        self.forks: dict[str, tuple[int, BlockStore]] = {}
+        self.blockchains = weakref.WeakSet()
+        self.branches: weakref.WeakSet[BranchStore] = weakref.WeakSet()
+        for block in blocks:
+            self.append(block)
+
+    # Opens a store saved to disk
+    # The state and indexes are loaded from the latest snapshot and only the blocks after it are replayed
+    # Blocks are then read from disk only when they are needed
+    @staticmethod
+    def fromDisk(disk: DiskStore) -> 'BlockStore':
+        store = BlockStore([])
+        for length in reversed(Snapshot.list(disk.directory)):
+            if length > disk.getLength():
+                continue
+            snapshot = Snapshot.load(disk.directory, length)
+            if snapshot.tipHash == disk.read(length - 1).hash:
+                store.state = snapshot.state
+                store.transactionIndex = snapshot.transactionIndex
+                store.landIndex = snapshot.landIndex
+                store.undoBase = store.snapshotLength = length
+                store.checkpoints[length] = snapshot.state.copy()
+                break
+
+        for height, block in enumerate(disk.readRange(store.undoBase, disk.getLength()), store.undoBase):
+            store.applyBlock(block, height)
+        store.blocks = BlockList(disk, disk.getLength())
+        store.disk = disk
+        return store
+
+    # Writes the blocks which are not yet on disk and a new snapshot when enough blocks were added since the last one
+    def persist(self, disk: DiskStore) -> None:
+        if self.disk is not disk:
+            self.snapshotLength = 0
+        self.disk = disk
+        for height in range(disk.getLength(), len(self.blocks)):
+            disk.append(self.blocks[height])
+        if self.snapshotLength == 0 or len(self.blocks) - self.snapshotLength >= SNAPSHOT_INTERVAL:
+            Snapshot(len(self.blocks), self.blocks[-1].hash, self.state, self.transactionIndex, self.landIndex).save(disk.directory)
+            self.snapshotLength = len(self.blocks)
+
+    def getLength(self) -> int:
+        return len(self.blocks)
+
+    # Returns the block at the given height in the binary format, read directly from disk when it is there
+    def getEncodedBlock(self, height: int) -> bytes:
+        if isinstance(self.blocks, BlockList) and height < self.blocks.diskLength:
+            return self.blocks.disk.readEncoded(height)
+        return Block.encode(self.blocks[height])
+
+    # Appends a block to the store and updates the state and indexes
+    def append(self, block: Block) -> None:
+        start = Metrics.start()
+        self.blocks.append(block)
+        self.applyBlock(block, len(self.blocks) - 1)
+        Metrics.stop("block_apply_seconds", start)
+
+    # Returns the keys of a field of the state changed by the blocks between two heights, or None when some of these
+    # blocks have no undo record (they were loaded from a snapshot)
+    def getChangedKeys(self, field: str, start: int, end: int) -> set[str] | None:
+        if start < self.undoBase:
+            return None
+        return {key for height in range(start, end) for changed, key, _ in self.undo[height - self.undoBase] if changed == field}
+
+    def applyBlock(self, block: Block, height: int) -> None:
+        self.undo.append(self.state.applyBlock(block, height))
+        if (height + 1) % CHECKPOINT_INTERVAL == 0:
+            self.checkpoints[height + 1] = self.state.copy()
+        for position, transaction in enumerate(block.data):
+            self.transactionIndex[transaction.key] = (height, position)
+            if transaction.code == Transaction.LD or transaction.code == Transaction.LT:
+                landId = transaction.landId
+                if landId not in self.landIndex:
+                    self.landIndex[landId] = []
+                self.landIndex[landId].append((height, position))
+
+    # Returns the state after the first length blocks
+    # The closest of the checkpoint before, the checkpoint after and the tip is copied and the blocks in between are
+    # applied or reverted. Blocks before the first undo record can only be applied, and the checkpoints passed on the
+    # way are kept so that later queries of the same range start from them
+    def getStateAt(self, length: int) -> State:
+        lengths = sorted(self.checkpoints)
+        index = bisect_right(lengths, length)
+        before = lengths[index - 1] if index > 0 else 0
+        after = lengths[index] if index < len(lengths) else len(self.blocks)
+        if length >= self.undoBase and after - length < length - before:
+            state = self.checkpoints[after].copy() if after < len(self.blocks) else self.state.copy()
+            for height in range(after - 1, length - 1, -1):
+                state.revertBlock(self.undo[height - self.undoBase])
+            return state
+
+        state = self.checkpoints[before].copy() if before > 0 else State()
+        for height, block in enumerate(self.blocks[before:length], before):
+            state.applyBlock(block, height)
+            if (height + 1) % CHECKPOINT_INTERVAL == 0 and height + 1 not in self.checkpoints:
+                self.checkpoints[height + 1] = state.copy()
+        return state
+
+    # Returns the store the blockchain continues on when it adds a block which differs from the block at that height
+    # The store switches in place when the blockchain moves to a chain of targetLength blocks which is longer than the
+    # chain of every other blockchain using it, which would then switch as well (the longest chain is chosen, see Blockchain)
+    # A blockchain lagging behind the others gets a copy of the store instead
+    def diverge(self, length: int, block: Block, blockchain, targetLength: int) -> 'BlockStore':
+        longest = max((other.getLength() for other in self.blockchains if other is not blockchain), default=0)
+        if longest < targetLength and length >= self.undoBase and (self.disk is None or length >= self.disk.getLength()):
+            self.reorganize(length, blockchain)
+            self.append(block)
+            return self
+        return self.getFork(length, block)
+
+    # Drops the blocks after the first length blocks: their undo records are reverted and their index entries removed
+    # The other blockchains using the dropped blocks are moved to a BranchStore holding them, and the branches built on
+    # the dropped blocks are rebased on the blocks this store keeps
+    def reorganize(self, length: int, blockchain) -> None:
+        dropped = list(self.blocks[length:])
+        branch = None
+        for other in list(self.blockchains):
+            if other is not blockchain and other.getLength() > length:
+                if branch is None:
+                    branch = BranchStore(self, length, dropped)
+                other.setStore(branch)
+        for other in list(self.branches):
+            if other is not branch and other.length > length:
+                other.rebase(length, dropped[:other.length - length])
+
+        for height in range(len(self.blocks) - 1, length - 1, -1):
+            block = self.blocks[height]
+            self.state.revertBlock(self.undo.pop())
+            for transaction in reversed(block.data):
+                del self.transactionIndex[transaction.key]
+                if transaction.code == Transaction.LD or transaction.code == Transaction.LT:
+                    locations = self.landIndex[transaction.landId]
+                    locations.pop()
+                    if len(locations) == 0:
+                        del self.landIndex[transaction.landId]
+        if isinstance(self.blocks, BlockList):
+            del self.blocks.appended[length - self.blocks.diskLength:]
+        else:
+            del self.blocks[length:]
+        for checkpoint in [checkpoint for checkpoint in self.checkpoints if checkpoint > length]:
+            del self.checkpoints[checkpoint]
+        for hash in [hash for hash, (forkLength, _) in self.forks.items() if forkLength > length]:
+            del self.forks[hash]
+
+    # Returns the fork of this store with the first length blocks followed by the given block
+    # Blockchains switching to the same branch share its fork, which is created by the first of them
+    # Forks from final blocks are no longer switched to and are evicted
+    def getFork(self, length: int, block: Block) -> 'BlockStore':
+        fork = self.forks.get(block.hash)
+        if fork is not None:
+            return fork[1]
+        store = self.fork(length)
+        store.append(block)
+        self.forks[block.hash] = (length, store)
+        for hash in [hash for hash, (forkLength, _) in self.forks.items() if forkLength <= len(self.blocks) - MAX_REORG_DEPTH]:
+            del self.forks[hash]
+        return store
+
+    # Creates a new store with the first length blocks of this store
+    # The blocks are shared with this store, only the list holding them and the derived data are copied
+    # The index entries of the blocks after the first length blocks are removed from the copies of the indexes
+    def fork(self, length: int) -> 'BlockStore':
+        store = BlockStore([])
+        store.blocks = self.blocks[:length]
+        store.state = self.getStateAt(length)
+        store.undoBase = min(self.undoBase, length)
+        store.undo = self.undo[:length - store.undoBase]
+        store.checkpoints = {checkpoint: state for checkpoint, state in self.checkpoints.items() if checkpoint <= length}
+        store.transactionIndex = dict(self.transactionIndex)
+        store.landIndex = {landId: locations[:] for landId, locations in self.landIndex.items()}
+        for block in self.blocks[length:]:
+            for transaction in block.data:
+                store.transactionIndex.pop(transaction.key, None)
+                locations = store.landIndex.get(transaction.landId)
+                if locations is not None:
+                    while len(locations) > 0 and locations[-1][0] >= length:
+                        locations.pop()
+                    if len(locations) == 0:
+                        del store.landIndex[transaction.landId]
+        return store
+
+
+# The BranchStore class holds the blocks a store dropped when it switched to another branch, for the blockchains which
+# still follow them (see BlockStore.reorganize)
+# Its chain is the first length blocks of the base store followed by the dropped blocks. Only these blocks are available
+# until something else is needed, for example the state: the branch is then copied into a store of its own and the
+# blockchains move to it. A blockchain which rewinds to the blocks of the base store moves back to it (see Blockchain.rewind)
+class BranchStore:
+    def __init__(self, base: BlockStore, length: int, dropped: list[Block]) -> None:
+        self.base = base
+        self.length = length
+        self.dropped = dropped
+        self.store: BlockStore | None = None
+        self.blocks = BranchBlocks(self)
+        self.blockchains = weakref.WeakSet()
+        base.branches.add(self)
+
+    # Keeps the chain of the branch when the base store drops blocks before its first dropped block
+    def rebase(self, length: int, blocks: list[Block]) -> None:
+        self.dropped = blocks + self.dropped
+        self.length = length
+
+    def getLength(self) -> int:
+        return self.length + len(self.dropped)
+
+    def getEncodedBlock(self, height: int) -> bytes:
+        if height < self.length:
+            return self.base.getEncodedBlock(height)
+        return Block.encode(self.dropped[height - self.length])
+
+    # Copies the branch into a store of its own and moves the blockchains to it
+    def materialize(self) -> BlockStore:
+        if self.store is None:
+            self.store = self.base.fork(self.length)
+            for block in self.dropped:
+                self.store.append(block)
+            self.base.branches.discard(self)
+            for blockchain in list(self.blockchains):
+                blockchain.setStore(self.store)
+        return self.store
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+
+# The blocks of a BranchStore
+class BranchBlocks:
+    def __init__(self, branch: BranchStore) -> None:
+        self.branch = branch
+
+    def __len__(self) -> int:
+        return self.branch.getLength()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("block height out of range")
+        if index < self.branch.length:
+            return self.branch.base.blocks[index]
+        return self.branch.dropped[index - self.branch.length]
+
+    def __iter__(self) -> Iterator[Block]:
+        return (self[index] for index in range(len(self)))
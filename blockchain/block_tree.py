@@ -0,0 +1,43 @@
+from blockchain.block import Block
+
+# The BlockTree class holds the blocks a blockchain knows of which are not in its chain: the blocks of competing
+# branches, and the blocks its chain dropped when it switched to another branch
+#
+# Every block points to its parent with the previous block hash, so the blocks form a tree rooted in the chain
+# A branch is followed from its tip back to the first block whose parent is in the chain (see Blockchain.addBlock)
+# Blocks below the final height can no longer be switched to and are pruned whenever the chain grows (see MAX_REORG_DEPTH)
+class BlockTree:
+    def __init__(self) -> None:
+        self.blocks: dict[str, Block] = {}
+
+    def add(self, block: Block) -> None:
+        self.blocks[block.hash] = block
+
+    def remove(self, block: Block) -> None:
+        self.blocks.pop(block.hash, None)
+
+    def get(self, hash: str) -> Block | None:
+        return self.blocks.get(hash)
+
+    # Returns the blocks from the first block off the chain to the block with the given hash
+    def getBranch(self, hash: str) -> list[Block]:
+        branch = []
+        block = self.blocks.get(hash)
+        while block is not None:
+            branch.append(block)
+            block = self.blocks.get(block.previousBlockHash)
+        branch.reverse()
+        return branch
+
+    # Returns the tips of the branches, the blocks which no other block of the tree extends
+    def getTips(self) -> list[Block]:
+        parents = {block.previousBlockHash for block in self.blocks.values()}
+        return [block for hash, block in self.blocks.items() if hash not in parents]
+
+    # Drops the blocks below a height
+    def prune(self, height: int) -> None:
+        for hash in [hash for hash, block in self.blocks.items() if block.id < height]:
+            del self.blocks[hash]
+
+    def __len__(self) -> int:
+        return len(self.blocks)
@@ -1,113 +1,271 @@
+from bisect import bisect_right
+from itertools import islice
+from typing import Iterator
+
 from termcolor import colored
 
 from blockchain.block import Block
+from blockchain.block_store import BlockStore, BranchStore
+from blockchain.block_tree import BlockTree
+from blockchain.constants import MAX_REORG_DEPTH
+from blockchain.state import State
 from blockchain.transaction import Transaction
-from utils.utils import Log
+from utils.utils import Log, Metrics
 
 # The Blockchain class is used to represent a blockchain which is a series of cryptographically linked blocks
 # The Blockchain is the single source of truth for all data in a distributed network
+#
+# The blocks, the materialized world state (land owners, balances, stakes and ages) and the transaction and land indexes
+# are kept in a BlockStore which is shared by every blockchain following the same chain
+# A blockchain only holds the store and the length of the chain it has accepted so far
+# When it accepts a block that differs from the one in the shared store, the store switches to its chain and the other
+# blockchains keep the dropped blocks in a BranchStore (see BlockStore.diverge)
+#
+# Blocks which do not extend the tip but whose parent is known are kept in a BlockTree of competing branches
+# Fork choice: the longest chain, and the branch seen first when two are as long
+# When a branch becomes longer than the chain, the blockchain switches to it (reorganization): the blocks after the common
+# ancestor are dropped into the tree and the state is rolled back with their undo records (see BlockStore.reorganize), so
+# a reorganization costs its depth. Blocks more than MAX_REORG_DEPTH blocks below the tip are final
 class Blockchain:
-    def __init__(self) -> None:
-        self.chain = [Block.genesis()]
+    def __init__(self, store: BlockStore | None = None, length: int | None = None) -> None:
+        self.store: BlockStore | BranchStore | None = None
+        self.laggingState: tuple[int, int, State] | None = None
+        self.setStore(store if store is not None else BlockStore([Block.genesis()]))
+        self.length = length if length is not None else self.store.getLength()
+        self.tree = BlockTree()
+
+    # Creates a blockchain from a list of blocks starting with the genesis block (for example when loaded from a file)
+    @staticmethod
+    def fromBlocks(blocks: list[Block]) -> 'Blockchain':
+        return Blockchain(BlockStore(blocks))
+
+    # Moves the blockchain to another store, which keeps track of the blockchains using it
+    def setStore(self, store: BlockStore | BranchStore) -> None:
+        if self.store is not None:
+            self.store.blockchains.discard(self)
+        self.store = store
+        store.blockchains.add(self)
+        self.laggingState = None
 
+    # Returns a new blockchain sharing the blocks, state and indexes of this one
+    def share(self) -> 'Blockchain':
+        return Blockchain(self.store, self.length)
+
+    # Adds a block to the chain, or to the tree of competing branches when it does not extend the tip
+    # Returns the new tip when the block extends the chain or a branch the blockchain switched to, None otherwise
     def addBlock(self, block: Block) -> Block | None:
-        if block.previousBlockHash == Block.hashBlock(self.getLastBlock()):
-            self.chain.append(block)
-        else:
+        if block.previousBlockHash != self.getLastBlock().hash:
+            return self.addBranchBlock(block)
+        self.appendBlock(block, self.length + 1)
+        return block
+
+    # Appends a block extending the tip, on the way to a chain of targetLength blocks
+    # When the block differs from the block of the store at that height, the store only switches to it in place if no
+    # other blockchain using the store is as long as the target (see BlockStore.diverge)
+    def appendBlock(self, block: Block, targetLength: int) -> None:
+        if self.length == self.store.getLength():
+            self.store.append(block)
+        elif self.store.blocks[self.length].hash != block.hash:
+            self.setStore(self.store.diverge(self.length, block, self, targetLength))
+        self.length += 1
+        if len(self.tree) > 0:
+            self.tree.prune(self.length - MAX_REORG_DEPTH)
+        Metrics.increment("blocks_added_total")
+
+    # Adds a block extending a block before the tip, or a block of the tree, and switches to its branch if it is now the longest
+    def addBranchBlock(self, block: Block) -> Block | None:
+        if block.hash in self.tree.blocks or (block.id < self.length and self.store.blocks[block.id].hash == block.hash):
+            Log.debug(f"Block {block.id} is already known", "FORK")
+            return None
+        parent = self.tree.get(block.previousBlockHash)
+        if parent is None and 0 < block.id <= self.length and self.store.blocks[block.id - 1].hash == block.previousBlockHash:
+            parent = self.store.blocks[block.id - 1]
+        if parent is None or parent.id != block.id - 1:
             Log.error("Invalid block")
             return None
-        return block
+        branch = self.tree.getBranch(block.previousBlockHash) + [block]
+        if branch[0].id <= self.length - MAX_REORG_DEPTH:
+            Log.error(f"Block {block.id} is on a branch forking from the final block {branch[0].id - 1}")
+            return None
+
+        self.tree.add(block)
+        Metrics.increment("branch_blocks_total")
+        if block.id < self.length:
+            Log.debug(f"Block {block.id} is kept on a competing branch", "FORK")
+            return None
+        return self.switchBranch(branch)
+
+    # Switches to a branch of the tree, given from its first block off the chain to its tip
+    # The dropped blocks are kept in the tree so that the blockchain can switch back to them
+    def switchBranch(self, branch: list[Block]) -> Block:
+        ancestorLength = branch[0].id
+        depth = self.length - ancestorLength
+        for block in self.iterBlocks(ancestorLength):
+            self.tree.add(block)
+        self.rewind(ancestorLength)
+        for block in branch:
+            self.tree.remove(block)
+            self.appendBlock(block, branch[-1].id + 1)
+        Metrics.increment("reorganizations_total")
+        Metrics.increment("blocks_dropped_total", amount=depth)
+        Log.debug(f"Switched to the branch of block {branch[-1].id} from block {ancestorLength - 1}, dropping {depth} blocks", "FORK")
+        return branch[-1]
+
+    # Returns the blocks the chain dropped when it switched to another branch, from its common ancestor with the chain
+    # to the previous tip
+    def getDroppedBlocks(self, previousTip: Block) -> list[Block]:
+        return self.tree.getBranch(previousTip.hash)
+
+    # Drops the blocks after the first length blocks (for example to switch to another chain from a common ancestor)
+    # The blocks stay in the store for the blockchains sharing it, the next block added after them switches the store
+    # A blockchain which rewinds to the blocks a branch shares with its base store moves back to the base store
+    def rewind(self, length: int) -> None:
+        if not 1 <= length <= self.length:
+            raise ValueError(f"Cannot rewind a blockchain of {self.length} blocks to {length} blocks")
+        self.length = length
+        while isinstance(self.store, BranchStore) and length <= self.store.length:
+            self.setStore(self.store.base)
+
+    # The blocks of the chain accepted by this blockchain
+    @property
+    def chain(self) -> list[Block]:
+        if self.length == self.store.getLength():
+            return self.store.blocks
+        return self.store.blocks[:self.length]
+
+    # The world state at the tip of this blockchain
+    # A blockchain that has not yet accepted the latest blocks of its store reverts them on a copy of the state
+    @property
+    def state(self) -> State:
+        storeLength = self.store.getLength()
+        if self.length == storeLength:
+            return self.store.state
+        if self.laggingState is None or self.laggingState[:2] != (self.length, storeLength):
+            self.laggingState = (self.length, storeLength, self.store.getStateAt(self.length))
+        return self.laggingState[2]
+
+    # The world state right after the block at the given height was added (see BlockStore.getStateAt)
+    def getStateAt(self, height: int) -> State | None:
+        if not 0 <= height < self.length:
+            Log.error("Invalid block height")
+            return None
+        if height == self.length - 1:
+            return self.state
+        return self.store.getStateAt(height + 1)
+
+    # Checks that the materialized state matches a full replay of the chain
+    def verifyState(self) -> bool:
+        return self.state == State.fromBlocks(self.chain)
     
     def getLength(self) -> int:
-        return len(self.chain)
+        return self.length
 
-    def getTransaction(self, transactionId: str) -> Transaction | None:
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.id == transactionId:
-                    return transaction
+    # Transactions are looked up by their ID or by their key (see Transaction)
+    def hasTransaction(self, transactionId: str | bytes) -> bool:
+        location = self.store.transactionIndex.get(Blockchain.getKey(transactionId))
+        return location is not None and location[0] < self.length
 
-        Log.error("Transaction does not exist")
-        return
+    # Returns the (block height, position in block) of a transaction
+    def getTransactionLocation(self, transactionId: str | bytes) -> tuple[int, int] | None:
+        location = self.store.transactionIndex.get(Blockchain.getKey(transactionId))
+        if location is None or location[0] >= self.length:
+            Log.error("Transaction does not exist")
+            return None
+        return location
+
+    def getTransaction(self, transactionId: str | bytes) -> Transaction | None:
+        location = self.getTransactionLocation(transactionId)
+        if location is None:
+            return
+        height, position = location
+        return self.store.blocks[height].data[position]
+
+    @staticmethod
+    def getKey(transactionId: str | bytes) -> bytes | None:
+        return transactionId if isinstance(transactionId, bytes) else Transaction.getKey(transactionId)
 
     def getLandHistory(self, landId: str) -> list[Transaction]:
-        landHistory = []
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.type in [Transaction.LD_TRANSACTION, Transaction.LT_TRANSACTION] and transaction.input['land_id'] == landId:
-                    landHistory.append(transaction)
+        return list(self.iterLandHistory(landId))
+
+    # The iter* functions yield the rows of a listing one at a time from the row at start, at most limit of them
+    # Blocks stored on disk are read as they are yielded, so the whole listing is never held in memory
+    def iterLandHistory(self, landId: str, start: int = 0, limit: int | None = None) -> Iterator[Transaction]:
+        locations = (location for location in self.store.landIndex.get(landId, []) if location[0] < self.length)
+        for height, position in islice(locations, start, None if limit is None else start + limit):
+            yield self.store.blocks[height].data[position]
 
-        return landHistory
+    def iterBlocks(self, start: int = 0, limit: int | None = None) -> Iterator[Block]:
+        end = self.length if limit is None else min(self.length, start + limit)
+        for height in range(start, end):
+            yield self.store.blocks[height]
+
+    def iterLandOwners(self, start: int = 0, limit: int | None = None) -> Iterator[tuple[str, str]]:
+        return islice(self.state.landOwners.items(), start, None if limit is None else start + limit)
 
     def getLandOwner(self, landId: str) -> str | None:
-        history = self.getLandHistory(landId)
-        if len(history) == 0:
+        return self.state.landOwners.get(landId)
+
+    # Returns the owner of a land right after the block at the given height was added, from the last transaction of the land
+    # up to that block in the land index
+    def getLandOwnerAt(self, landId: str, height: int) -> str | None:
+        if not 0 <= height < self.length:
+            Log.error("Invalid block height")
+            return None
+        locations = self.store.landIndex.get(landId, [])
+        index = bisect_right(locations, (height, len(self.store.blocks[height].data)))
+        if index == 0:
             return None
-        return history[-1].output['user_id']
+        transaction = self.store.blocks[locations[index - 1][0]].data[locations[index - 1][1]]
+        return transaction.receiverId if transaction.code == Transaction.LT else transaction.userId
     
     def getLandOwners(self) -> dict[str, str]:
-        landOwners = {}
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.type == Transaction.LD_TRANSACTION:
-                    landOwners[transaction.input["land_id"]] = transaction.input["user_id"]
-                elif transaction.type == Transaction.LT_TRANSACTION:
-                    landOwners[transaction.input["land_id"]] = transaction.output["user_id"]
-        return landOwners
+        return dict(self.state.landOwners)
+
+    # Returns the lands owned by a node from the owned lands of the state, without going through the other lands
+    def getOwnedLands(self, nodeId: str) -> set[str]:
+        return set(self.state.ownedLands.get(nodeId, ()))
+
+    # Returns the keys of a field of the state changed by the blocks from a height to the tip, or None when they are not known
+    def getChangedKeys(self, field: str, start: int) -> set[str] | None:
+        if isinstance(self.store, BranchStore):
+            return None
+        return self.store.getChangedKeys(field, start, self.length)
 
     def getBlockFromHeight(self, height: int) -> Block | None:
-        if not 0 <= height < len(self.chain):
+        if not 0 <= height < self.length:
             Log.error("Invalid block height")
             return None
-        return self.chain[height]
+        return self.store.blocks[height]
     
     def getLastBlock(self) -> Block:
-        return self.chain[-1]
+        return self.store.blocks[self.length - 1]
     
-    def getStakes(self, peers) -> dict[str, int]:
-        stakes = {}
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.type == Transaction.ST_TRANSACTION:
-                    nodeId = transaction.input["user_id"]
-                    stake = transaction.input["amount"]
-                    stakes[nodeId] = stakes[nodeId] + stake if nodeId in stakes else stake
+    # The stakes, ages and balances are those of the given state (the current one by default, see getStateAt)
+    def getStakes(self, peers, state: State | None = None) -> dict[str, int]:
+        stakes = dict((self.state if state is None else state).stakes)
         for peer in peers:
             if peer not in stakes:
                 stakes[peer] = 0
         return stakes
 
-    def getAges(self, peers) -> dict[str, int]:
-        ages = {}
-        for i, block in enumerate(self.chain):
-            nodeId = block.validator
-            ages[nodeId] = i
-        for nodeId in ages:
-            ages[nodeId] = self.getLength() - ages[nodeId] - 1
+    def getAges(self, peers, state: State | None = None) -> dict[str, int]:
+        length = self.getLength()
+        if state is None:
+            state = self.state
+        else:
+            # Every block records the height of its validator, so the last one recorded is the height of the last block
+            length = max(state.lastMinted.values(), default=-1) + 1
+        ages = {nodeId: length - height - 1 for nodeId, height in state.lastMinted.items()}
         for peer in peers:
             if peer not in ages:
-                ages[peer] = self.getLength()
+                ages[peer] = length
         return ages
 
     def getBalance(self, nodeId: str) -> int:
-        balance = 0
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.type == Transaction.RC_TRANSACTION and transaction.input["user_id"] == nodeId:
-                    balance += transaction.input["amount"]
-                elif transaction.type == Transaction.ST_TRANSACTION and transaction.input["user_id"] == nodeId:
-                    balance -= transaction.input["amount"]
-        return balance
+        return self.state.balances.get(nodeId, 0)
     
-    def getAllBalances(self) -> dict[str, int]:
-        balances = {}
-        for block in self.chain:
-            for transaction in block.data:
-                if transaction.type == Transaction.RC_TRANSACTION:
-                    balances[transaction.input["user_id"]] = transaction.input["amount"]
-                elif transaction.type == Transaction.ST_TRANSACTION:
-                    balances[transaction.input["user_id"]] -= transaction.input["amount"]
-        return balances
+    def getAllBalances(self, state: State | None = None) -> dict[str, int]:
+        return dict((self.state if state is None else state).balances)
 
     def __str__(self) -> str:
         return "\n".join([colored(f"THE BLOCKCHAIN [{self.getLength()}]", "green", attrs=["bold"])] + [
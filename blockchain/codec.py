@@ -0,0 +1,78 @@
+import struct
+from datetime import datetime, timedelta
+
+# The Codec class holds the primitives of the binary format used to store and transmit transactions and blocks
+# All integers are big endian and all strings are UTF-8 encoded and prefixed with their length
+# Every top level payload starts with the format version so that the format can evolve without breaking old files
+#
+# Decoding reads from a memoryview at an offset and returns the decoded value along with the offset of the next value,
+# so that large buffers (files, network messages) are decoded in place without being copied
+class Codec:
+    VERSION = 1
+
+    EPOCH = datetime(1970, 1, 1)
+    MICROSECOND = timedelta(microseconds=1)
+
+    VERSION_FORMAT = struct.Struct(">B")
+    COUNT_FORMAT = struct.Struct(">I")
+    LENGTH_FORMAT = struct.Struct(">H")
+    INTEGER_FORMAT = struct.Struct(">q")
+
+    @staticmethod
+    def encodeVersion() -> bytes:
+        return Codec.VERSION_FORMAT.pack(Codec.VERSION)
+
+    @staticmethod
+    def decodeVersion(view: memoryview, offset: int = 0) -> int:
+        (version,) = Codec.VERSION_FORMAT.unpack_from(view, offset)
+        if version != Codec.VERSION:
+            raise ValueError(f"Unsupported format version {version}")
+        return offset + Codec.VERSION_FORMAT.size
+
+    @staticmethod
+    def encodeCount(count: int) -> bytes:
+        return Codec.COUNT_FORMAT.pack(count)
+
+    @staticmethod
+    def decodeCount(view: memoryview, offset: int) -> tuple[int, int]:
+        (count,) = Codec.COUNT_FORMAT.unpack_from(view, offset)
+        return count, offset + Codec.COUNT_FORMAT.size
+
+    @staticmethod
+    def encodeInteger(value: int) -> bytes:
+        return Codec.INTEGER_FORMAT.pack(value)
+
+    @staticmethod
+    def decodeInteger(view: memoryview, offset: int) -> tuple[int, int]:
+        (value,) = Codec.INTEGER_FORMAT.unpack_from(view, offset)
+        return value, offset + Codec.INTEGER_FORMAT.size
+
+    @staticmethod
+    def encodeString(value: str) -> bytes:
+        encoded = value.encode("utf-8")
+        return Codec.LENGTH_FORMAT.pack(len(encoded)) + encoded
+
+    @staticmethod
+    def decodeString(view: memoryview, offset: int) -> tuple[str, int]:
+        (length,) = Codec.LENGTH_FORMAT.unpack_from(view, offset)
+        offset += Codec.LENGTH_FORMAT.size
+        return str(view[offset:offset + length], "utf-8"), offset + length
+
+    # Timestamps are stored as the number of microseconds since the epoch
+    @staticmethod
+    def encodeTimestamp(timestamp: datetime) -> int:
+        return (timestamp - Codec.EPOCH) // Codec.MICROSECOND
+
+    @staticmethod
+    def decodeTimestamp(value: int) -> datetime:
+        return Codec.EPOCH + timedelta(microseconds=value)
+
+    # IDs generated by utils.id are UUIDs which are stored in their 16 byte binary form
+    @staticmethod
+    def encodeId(value: str) -> bytes:
+        return bytes.fromhex(value.replace("-", ""))
+
+    @staticmethod
+    def decodeId(value: bytes) -> str:
+        h = value.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
@@ -6,3 +6,18 @@ GENESIS_BLOCK_VALIDATOR = str(uuid4())
 GENESIS_BLOCK_DATA = []
 
 BLOCK_TRANSACTION_THRESHOLD = 3
+
+# Maximum number of transactions of a block and maximum encoded size of its transactions (see BlockPolicy)
+MAX_BLOCK_TRANSACTIONS = 1000
+MAX_BLOCK_BYTES = 1 << 20
+
+# Maximum number of transactions in a block minted while loading operations in bulk (see Network.ingest)
+INGEST_BLOCK_SIZE = 1000
+
+SNAPSHOT_INTERVAL = 1000
+
+# Number of blocks between the copies of the state kept for historical queries (see BlockStore.getStateAt)
+CHECKPOINT_INTERVAL = 100
+
+# Number of blocks below the tip after which blocks are final: no branch forking from them is switched to (see Blockchain)
+MAX_REORG_DEPTH = 100
@@ -0,0 +1,180 @@
+import mmap
+import os
+import struct
+import weakref
+from collections import OrderedDict
+from typing import Iterator
+
+from blockchain.block import Block
+from blockchain.codec import Codec
+
+# The DiskStore class is an append-only store of blocks on disk
+# The blocks are appended to segment files and located through an index file
+#
+#   segment-<n>.seg: Magic bytes, format version and the encoded blocks one after the other
+#   index: One fixed size record (segment number, offset, length) per block, in order of height
+#
+# Every block is flushed to disk (fsync) before its index record is written, so an interrupted append leaves
+# at most some unreferenced bytes at the end of a segment, which are discarded when the store is opened again
+# Blocks are read by height through memory maps of the segments without loading the rest of the chain
+# The open stores are tracked so that the directory of a store which blocks are still read from is never removed (see Network.save)
+class DiskStore:
+    SEGMENT_MAGIC = b"LPSG"
+    SEGMENT_SIZE = 64 * 1024 * 1024
+    INDEX_FORMAT = struct.Struct(">IQI")
+    CACHE_SIZE = 128
+    opened: weakref.WeakSet['DiskStore'] = weakref.WeakSet()
+
+    def __init__(self, directory: str) -> None:
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.indexFile = open(os.path.join(self.directory, "index"), "a+b")
+        self.maps: dict[int, mmap.mmap] = {}
+        self.cache: OrderedDict[int, Block] = OrderedDict()
+
+        # Discard a partially written index record
+        size = os.fstat(self.indexFile.fileno()).st_size
+        self.length = size // DiskStore.INDEX_FORMAT.size
+        if size % DiskStore.INDEX_FORMAT.size != 0:
+            self.indexFile.truncate(self.length * DiskStore.INDEX_FORMAT.size)
+
+        if self.length == 0:
+            self.segment, self.end = 0, 0
+        else:
+            segment, offset, length = self.getLocation(self.length - 1)
+            self.segment, self.end = segment, offset + length
+        self.segmentFile = self.openSegment(self.segment)
+        # Discard the bytes of a block whose index record was never written
+        self.segmentFile.truncate(max(self.end, len(DiskStore.SEGMENT_MAGIC) + 1))
+        self.end = max(self.end, len(DiskStore.SEGMENT_MAGIC) + 1)
+        DiskStore.opened.add(self)
+
+    # Returns whether a store is open in the directory
+    @staticmethod
+    def isOpen(directory: str) -> bool:
+        directory = os.path.abspath(directory)
+        return any(disk.directory == directory for disk in DiskStore.opened)
+
+    def getLength(self) -> int:
+        return self.length
+
+    # Appends a block to the last segment (or a new one when it is full) and records its location in the index
+    def append(self, block: Block) -> None:
+        data = Block.encode(block)
+        if self.end + len(data) > DiskStore.SEGMENT_SIZE and self.end > len(DiskStore.SEGMENT_MAGIC) + 1:
+            self.segmentFile.close()
+            self.segment += 1
+            self.segmentFile = self.openSegment(self.segment)
+            self.end = len(DiskStore.SEGMENT_MAGIC) + 1
+            self.segmentFile.truncate(self.end)
+
+        self.segmentFile.seek(self.end)
+        self.segmentFile.write(data)
+        self.segmentFile.flush()
+        os.fsync(self.segmentFile.fileno())
+
+        self.indexFile.write(DiskStore.INDEX_FORMAT.pack(self.segment, self.end, len(data)))
+        self.indexFile.flush()
+        os.fsync(self.indexFile.fileno())
+
+        self.end += len(data)
+        self.length += 1
+
+    # Reads the block at the given height from its memory mapped segment
+    def read(self, height: int) -> Block:
+        if height in self.cache:
+            self.cache.move_to_end(height)
+            return self.cache[height]
+
+        segment, offset, _ = self.getLocation(height)
+        block, _ = Block.decode(memoryview(self.getMap(segment, offset)), offset)
+
+        self.cache[height] = block
+        if len(self.cache) > DiskStore.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return block
+
+    # Returns the encoded block at the given height without decoding it
+    def readEncoded(self, height: int) -> bytes:
+        segment, offset, length = self.getLocation(height)
+        return self.getMap(segment, offset)[offset:offset + length]
+
+    # Reads the blocks between the given heights in order, bypassing the cache
+    def readRange(self, start: int, stop: int) -> Iterator[Block]:
+        for h in range(start, stop):
+            segment, offset, _ = self.getLocation(h)
+            block, _ = Block.decode(memoryview(self.getMap(segment, offset)), offset)
+            yield block
+
+    def getLocation(self, height: int) -> tuple[int, int, int]:
+        self.indexFile.seek(height * DiskStore.INDEX_FORMAT.size)
+        return DiskStore.INDEX_FORMAT.unpack(self.indexFile.read(DiskStore.INDEX_FORMAT.size))
+
+    # Returns a memory map of a segment which covers the given offset (the last segment is remapped as it grows)
+    def getMap(self, segment: int, offset: int) -> mmap.mmap:
+        if segment not in self.maps or len(self.maps[segment]) <= offset:
+            if segment in self.maps:
+                self.maps[segment].close()
+            with open(self.getSegmentPath(segment), "rb") as f:
+                self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[segment]
+
+    def getSegmentPath(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:05d}.seg")
+
+    def openSegment(self, segment: int):
+        path = self.getSegmentPath(segment)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(DiskStore.SEGMENT_MAGIC + Codec.encodeVersion())
+                f.flush()
+                os.fsync(f.fileno())
+        f = open(path, "r+b")
+        view = f.read(len(DiskStore.SEGMENT_MAGIC) + 1)
+        if view[:len(DiskStore.SEGMENT_MAGIC)] != DiskStore.SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a block segment")
+        Codec.decodeVersion(memoryview(view), len(DiskStore.SEGMENT_MAGIC))
+        return f
+
+    def close(self) -> None:
+        DiskStore.opened.discard(self)
+        for map in self.maps.values():
+            map.close()
+        self.maps = {}
+        self.segmentFile.close()
+        self.indexFile.close()
+
+
+# The BlockList class is a list of blocks whose first blocks are read from a DiskStore on demand
+# Blocks appended after the store was opened are kept in memory
+class BlockList:
+    def __init__(self, disk: DiskStore, diskLength: int, appended: list[Block] | None = None) -> None:
+        self.disk = disk
+        self.diskLength = diskLength
+        self.appended = appended if appended is not None else []
+
+    def append(self, block: Block) -> None:
+        self.appended.append(block)
+
+    def __len__(self) -> int:
+        return self.diskLength + len(self.appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start != 0 or step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if stop <= self.diskLength:
+                return BlockList(self.disk, stop)
+            return BlockList(self.disk, self.diskLength, self.appended[:stop - self.diskLength])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("block height out of range")
+        if index < self.diskLength:
+            return self.disk.read(index)
+        return self.appended[index - self.diskLength]
+
+    def __iter__(self) -> Iterator[Block]:
+        yield from self.disk.readRange(0, self.diskLength)
+        yield from self.appended
@@ -1,18 +1,80 @@
+from collections import OrderedDict
 from hashlib import sha256
 from blockchain.transaction import Transaction
+from utils.utils import Metrics
 
 # A MerkleTree is a tree in which every leaf node is a hash of a data block and every inner node is the hash of its child nodes
-# This class provides a function to get the Merkle Root given a list of transactions
+# This class provides functions to get the Merkle Root given a list of transactions, and to prove that a transaction
+# is included in a block without the rest of the block
+#
+# A proof is the list of the sibling hashes on the path from the leaf of the transaction to the root, each with
+# whether the sibling is on the left. Verifying it takes one hash per level of the tree
+# The levels of the trees of recently used blocks are cached by block hash
 class MerkleTree:
+    CACHE_SIZE = 64
+
+    cache: OrderedDict[str, list[list[str]]] = OrderedDict()
+
     @staticmethod
     def getMerkleRoot(transactionList: list[Transaction]) -> str:
-        hashList = [sha256(Transaction.serialize(transaction)).hexdigest() for transaction in transactionList]
+        return MerkleTree.getLevels(transactionList)[-1][0]
+
+    # Returns every level of the tree, from the leaves to the root
+    @staticmethod
+    def getLevels(transactionList: list[Transaction]) -> list[list[str]]:
+        hashList = [MerkleTree.hashLeaf(transaction) for transaction in transactionList]
+        levels = [hashList]
         while len(hashList) > 1:
             nextHashList = []
             if len(hashList) % 2 == 1:
-                hashList.append(hashList[-1])
+                hashList = hashList + [hashList[-1]]
             for i in range(0, len(hashList), 2):
-                nextHashList.append(sha256(str(hashList[i] + hashList[i + 1]).encode('utf-8')).hexdigest())
+                nextHashList.append(MerkleTree.hashPair(hashList[i], hashList[i + 1]))
             hashList = nextHashList
+            levels.append(hashList)
+
+        if Metrics.enabled:
+            Metrics.increment("hashes_computed_total", "merkle", sum(len(level) for level in levels))
+        return levels
+
+    # Returns the levels of the tree of a block, from the cache when possible
+    @staticmethod
+    def getBlockLevels(block) -> list[list[str]]:
+        if block.hash in MerkleTree.cache:
+            MerkleTree.cache.move_to_end(block.hash)
+            return MerkleTree.cache[block.hash]
+        levels = MerkleTree.getLevels(block.data)
+        MerkleTree.cache[block.hash] = levels
+        if len(MerkleTree.cache) > MerkleTree.CACHE_SIZE:
+            MerkleTree.cache.popitem(last=False)
+        return levels
 
-        return hashList[0]
+    # Returns the proof that a transaction is included in a block, or None if it is not in the block
+    @staticmethod
+    def getProof(block, transactionId: str) -> list[tuple[str, bool]] | None:
+        key = Transaction.getKey(transactionId)
+        position = next((i for i, transaction in enumerate(block.data) if transaction.key == key), None)
+        if position is None:
+            return None
+        proof = []
+        for level in MerkleTree.getBlockLevels(block)[:-1]:
+            sibling = position ^ 1
+            proof.append((level[sibling] if sibling < len(level) else level[position], sibling < position))
+            position //= 2
+        return proof
+
+    # Checks that a proof links a transaction to a merkle root
+    @staticmethod
+    def verifyProof(merkleRoot: str, transaction: Transaction, proof: list[tuple[str, bool]]) -> bool:
+        hash = MerkleTree.hashLeaf(transaction)
+        for sibling, isLeft in proof:
+            hash = MerkleTree.hashPair(sibling, hash) if isLeft else MerkleTree.hashPair(hash, sibling)
+        return hash == merkleRoot
+
+    @staticmethod
+    def hashLeaf(transaction: Transaction) -> str:
+        return sha256(Transaction.serialize(transaction)).hexdigest()
+
+    @staticmethod
+    def hashPair(left: str, right: str) -> str:
+        return sha256(str(left + right).encode('utf-8')).hexdigest()
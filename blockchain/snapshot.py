@@ -0,0 +1,92 @@
+import os
+import struct
+
+from blockchain.codec import Codec
+from blockchain.state import State
+
+# The Snapshot class saves and loads snapshots of the data derived from a chain, so that it does not need to be rebuilt
+# from the genesis block every time a saved network is loaded
+#
+# A snapshot is saved next to the blocks of a DiskStore as snapshot-<length>.snap and contains
+#   Magic bytes and format version
+#   Length of the chain and hash of its last block
+#   The world state (see State.encode)
+#   Transaction index: Count followed by (16 byte transaction ID, block height, position) records
+#   Land index: Count followed by the land ID, the number of locations and the (block height, position) pairs
+class Snapshot:
+    MAGIC = b"LPSS"
+    LOCATION_FORMAT = struct.Struct(">II")
+    KEEP = 2
+
+    def __init__(
+        self,
+        length: int,
+        tipHash: str,
+        state: State,
+        transactionIndex: dict[bytes, tuple[int, int]],
+        landIndex: dict[str, list[tuple[int, int]]]
+    ) -> None:
+        self.length = length
+        self.tipHash = tipHash
+        self.state = state
+        self.transactionIndex = transactionIndex
+        self.landIndex = landIndex
+
+    # Writes the snapshot into the directory and removes all but the latest snapshots
+    def save(self, directory: str) -> None:
+        data = [Snapshot.MAGIC, Codec.encodeVersion(), Codec.encodeCount(self.length), Codec.encodeString(self.tipHash)]
+        data.append(self.state.encode())
+        data.append(Codec.encodeCount(len(self.transactionIndex)))
+        for key, location in self.transactionIndex.items():
+            data.append(key + Snapshot.LOCATION_FORMAT.pack(*location))
+        data.append(Codec.encodeCount(len(self.landIndex)))
+        for landId, locations in self.landIndex.items():
+            data.append(Codec.encodeString(landId) + Codec.encodeCount(len(locations)))
+            data += [Snapshot.LOCATION_FORMAT.pack(*location) for location in locations]
+
+        path = os.path.join(directory, f"snapshot-{self.length:010d}.snap")
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"".join(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        for length in Snapshot.list(directory)[:-Snapshot.KEEP]:
+            os.remove(os.path.join(directory, f"snapshot-{length:010d}.snap"))
+
+    @staticmethod
+    def load(directory: str, length: int) -> 'Snapshot':
+        with open(os.path.join(directory, f"snapshot-{length:010d}.snap"), "rb") as f:
+            view = memoryview(f.read())
+        if view[:len(Snapshot.MAGIC)] != Snapshot.MAGIC:
+            raise ValueError(f"Invalid snapshot in {directory}")
+        offset = Codec.decodeVersion(view, len(Snapshot.MAGIC))
+        length, offset = Codec.decodeCount(view, offset)
+        tipHash, offset = Codec.decodeString(view, offset)
+        state, offset = State.decode(view, offset)
+
+        transactionIndex = {}
+        count, offset = Codec.decodeCount(view, offset)
+        for _ in range(count):
+            transactionIndex[bytes(view[offset:offset + 16])] = Snapshot.LOCATION_FORMAT.unpack_from(view, offset + 16)
+            offset += 16 + Snapshot.LOCATION_FORMAT.size
+
+        landIndex = {}
+        count, offset = Codec.decodeCount(view, offset)
+        for _ in range(count):
+            landId, offset = Codec.decodeString(view, offset)
+            locations, offset = Codec.decodeCount(view, offset)
+            landIndex[landId] = [
+                Snapshot.LOCATION_FORMAT.unpack_from(view, offset + i * Snapshot.LOCATION_FORMAT.size) for i in range(locations)
+            ]
+            offset += locations * Snapshot.LOCATION_FORMAT.size
+
+        return Snapshot(length, tipHash, state, transactionIndex, landIndex)
+
+    # Returns the chain lengths of the snapshots in the directory in increasing order
+    @staticmethod
+    def list(directory: str) -> list[int]:
+        return sorted(
+            int(name[len("snapshot-"):-len(".snap")])
+            for name in os.listdir(directory) if name.startswith("snapshot-") and name.endswith(".snap")
+        )
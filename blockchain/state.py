@@ -0,0 +1,135 @@
+from blockchain.block import Block
+from blockchain.codec import Codec
+from blockchain.transaction import Transaction
+
+# The State class is the world state of the blockchain, materialized from the transactions in its blocks
+# It holds
+#   Land owners: The current owner of every registered land
+#   Balances: The wallet balance of every user
+#   Stakes: The total amount staked by every user
+#   Last minted: The height of the last block minted by every validator
+#   Owned lands: The lands of every owner, the reverse of the land owners, kept up to date as owners change
+# Applying every block of a chain in order to an empty state gives the same result as scanning the whole chain
+#
+# Applying a block returns its undo record, the list of (field, key, previous value) entries it changed
+# (previous value is None when the key did not exist), which can be used to revert the block later
+class State:
+    def __init__(self) -> None:
+        self.landOwners: dict[str, str] = {}
+        self.balances: dict[str, int] = {}
+        self.stakes: dict[str, int] = {}
+        self.lastMinted: dict[str, int] = {}
+        self.ownedLands: dict[str, set[str]] = {}
+
+    # Replays a full chain of blocks on an empty state
+    @staticmethod
+    def fromBlocks(blocks: list[Block]) -> 'State':
+        state = State()
+        for height, block in enumerate(blocks):
+            state.applyBlock(block, height)
+        return state
+
+    # Updates the state with the block appended at the given height and returns its undo record
+    def applyBlock(self, block: Block, height: int) -> list[tuple[str, str, object]]:
+        undo = []
+        self.set("lastMinted", block.validator, height, undo)
+        for transaction in block.data:
+            self.applyTransaction(transaction, undo)
+        return undo
+
+    # Updates the state with a single transaction
+    def applyTransaction(self, transaction: Transaction, undo: list[tuple[str, str, object]] | None = None) -> None:
+        if undo is None:
+            undo = []
+        if transaction.code == Transaction.RC:
+            nodeId = transaction.userId
+            self.set("balances", nodeId, self.balances.get(nodeId, 0) + transaction.amount, undo)
+        elif transaction.code == Transaction.LD:
+            self.setLandOwner(transaction.landId, transaction.userId, undo)
+        elif transaction.code == Transaction.LT:
+            self.setLandOwner(transaction.landId, transaction.receiverId, undo)
+        elif transaction.code == Transaction.ST:
+            nodeId = transaction.userId
+            self.set("balances", nodeId, self.balances.get(nodeId, 0) - transaction.amount, undo)
+            self.set("stakes", nodeId, self.stakes.get(nodeId, 0) + transaction.amount, undo)
+
+    # Sets an entry of a field of the state and records its previous value in the undo record
+    def set(self, field: str, key: str, value: object, undo: list[tuple[str, str, object]]) -> None:
+        values = getattr(self, field)
+        undo.append((field, key, values.get(key)))
+        values[key] = value
+
+    # Sets the owner of a land and moves the land from the lands of its previous owner to the lands of the new one
+    def setLandOwner(self, landId: str, ownerId: str, undo: list[tuple[str, str, object]]) -> None:
+        self.moveLand(landId, self.landOwners.get(landId), ownerId)
+        self.set("landOwners", landId, ownerId, undo)
+
+    def moveLand(self, landId: str, previousOwnerId: str | None, ownerId: str | None) -> None:
+        if previousOwnerId is not None:
+            lands = self.ownedLands[previousOwnerId]
+            lands.discard(landId)
+            if len(lands) == 0:
+                del self.ownedLands[previousOwnerId]
+        if ownerId is not None:
+            if ownerId not in self.ownedLands:
+                self.ownedLands[ownerId] = set()
+            self.ownedLands[ownerId].add(landId)
+
+    # Reverts the changes of a block using its undo record
+    def revertBlock(self, undo: list[tuple[str, str, object]]) -> None:
+        for field, key, value in reversed(undo):
+            values = getattr(self, field)
+            if field == "landOwners":
+                self.moveLand(key, values[key], value)
+            if value is None:
+                del values[key]
+            else:
+                values[key] = value
+
+    def copy(self) -> 'State':
+        state = State()
+        state.landOwners = dict(self.landOwners)
+        state.balances = dict(self.balances)
+        state.stakes = dict(self.stakes)
+        state.lastMinted = dict(self.lastMinted)
+        state.ownedLands = {ownerId: set(lands) for ownerId, lands in self.ownedLands.items()}
+        return state
+
+    # Binary format of a state
+    #   Land owners: Count followed by (land ID, owner ID) pairs of strings
+    #   Balances, Stakes, Last minted: Count followed by (node ID, 8 byte integer) pairs
+    # The owned lands are not saved, they are rebuilt from the land owners
+    def encode(self) -> bytes:
+        data = [Codec.encodeCount(len(self.landOwners))]
+        for landId, owner in self.landOwners.items():
+            data.append(Codec.encodeString(landId) + Codec.encodeString(owner))
+        for values in [self.balances, self.stakes, self.lastMinted]:
+            data.append(Codec.encodeCount(len(values)))
+            for nodeId, value in values.items():
+                data.append(Codec.encodeString(nodeId) + Codec.encodeInteger(value))
+        return b"".join(data)
+
+    @staticmethod
+    def decode(view: memoryview, offset: int) -> tuple['State', int]:
+        state = State()
+        count, offset = Codec.decodeCount(view, offset)
+        for _ in range(count):
+            landId, offset = Codec.decodeString(view, offset)
+            state.landOwners[landId], offset = Codec.decodeString(view, offset)
+            state.moveLand(landId, None, state.landOwners[landId])
+        for values in [state.balances, state.stakes, state.lastMinted]:
+            count, offset = Codec.decodeCount(view, offset)
+            for _ in range(count):
+                nodeId, offset = Codec.decodeString(view, offset)
+                values[nodeId], offset = Codec.decodeInteger(view, offset)
+        return state, offset
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, State):
+            return NotImplemented
+        return (
+            self.landOwners == other.landOwners and
+            self.balances == other.balances and
+            self.stakes == other.stakes and
+            self.lastMinted == other.lastMinted
+        )
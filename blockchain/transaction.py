@@ -1,10 +1,11 @@
-from os import stat
-import pickle
+import struct
+import sys
+import uuid
 from datetime import datetime
 from termcolor import colored
 from typing import TypedDict
 
-from utils.utils import id
+from blockchain.codec import Codec
 
 class InputType(TypedDict):
     user_id: str
@@ -28,94 +29,192 @@ class OutputType(TypedDict):
 #
 # 4. Stake Increase
 # The transaction used by a user to increase their stake in the network
+#
+# Transactions are the bulk of the memory of a network, so they are stored compactly in slots
+#   key: The ID as a 16 byte UUID, which is used as the key of the pools and indexes
+#   code: The type as an integer (RC, LD, LT or ST)
+#   time: The timestamp as the number of microseconds since the epoch (see Codec)
+#   userId, landId, amount, receiverId: The fields of the input and output. IDs are interned, so that every node and
+#   land ID is stored once however many transactions refer to it
+# id, type, timestamp, input and output are computed from them when read, as they were stored before
 class Transaction:
     RC_TRANSACTION = 'Receive Coins'
     LD_TRANSACTION = 'Land Declaration'
     LT_TRANSACTION = 'Land Transfer'
     ST_TRANSACTION = 'Stake Increase'
 
-    def __init__(self) -> None:
-        self.id = id()
-        self.type = ""
-        self.timestamp = datetime.now()
-        self.input: InputType = {"user_id": "", "land_id": "", "amount": 0}
-        self.output: OutputType = {"user_id": ""}
+    # Type codes, which are also the type tags of the binary format
+    RC = 1
+    LD = 2
+    LT = 3
+    ST = 4
+    TYPE_CODES = {RC_TRANSACTION: RC, LD_TRANSACTION: LD, LT_TRANSACTION: LT, ST_TRANSACTION: ST}
+    CODE_TYPES = {code: type for type, code in TYPE_CODES.items()}
+
+    # Type tag, ID and timestamp of the binary format (followed by the user ID, land ID, amount and receiver ID)
+    RECORD_FORMAT = struct.Struct(">B16sq")
+
+    __slots__ = ("key", "code", "time", "userId", "landId", "amount", "receiverId")
+
+    def __init__(
+        self,
+        code: int,
+        userId: str,
+        landId: str,
+        amount: int,
+        receiverId: str,
+        key: bytes | None = None,
+        time: int | None = None
+    ) -> None:
+        self.key = key if key is not None else uuid.uuid4().bytes
+        self.code = code
+        self.time = time if time is not None else Codec.encodeTimestamp(datetime.now())
+        self.userId = sys.intern(userId)
+        self.landId = sys.intern(landId)
+        self.amount = amount
+        self.receiverId = sys.intern(receiverId)
+
+    @property
+    def id(self) -> str:
+        return Codec.decodeId(self.key)
+
+    @property
+    def type(self) -> str:
+        return Transaction.CODE_TYPES[self.code]
+
+    @property
+    def timestamp(self) -> datetime:
+        return Codec.decodeTimestamp(self.time)
+
+    @property
+    def input(self) -> InputType:
+        return {"user_id": self.userId, "land_id": self.landId, "amount": self.amount}
+
+    @property
+    def output(self) -> OutputType:
+        return {"user_id": self.receiverId}
+
+    # Returns the key of a transaction ID, or None if it is not a valid ID
+    @staticmethod
+    def getKey(transactionId: str) -> bytes | None:
+        try:
+            key = Codec.encodeId(transactionId)
+        except ValueError:
+            return None
+        return key if len(key) == 16 else None
 
     # Create new receive coins transaction
     @staticmethod
     def newRCTransaction(receiver_id: str, amount: int) -> 'Transaction':
-        input: InputType = {
-            "user_id": receiver_id,
-            "land_id": "",
-            "amount": amount
-        }
-        output: OutputType = {
-            "user_id": receiver_id
-        }
-        return Transaction.generateTransaction(Transaction.RC_TRANSACTION, input, output)
+        return Transaction(Transaction.RC, receiver_id, "", amount, receiver_id)
 
     # Create new land declaration transaction
     @staticmethod
     def newLDTransaction(sender_id: str, land_id: str) -> 'Transaction':
-        input: InputType = {
-            "user_id": sender_id,
-            "land_id": land_id,
-            "amount": 0
-        }
-        output: OutputType = {
-            "user_id": sender_id
-        }
-        return Transaction.generateTransaction(Transaction.LD_TRANSACTION, input, output)
+        return Transaction(Transaction.LD, sender_id, land_id, 0, sender_id)
 
     # Create new land transfer transaction
     @staticmethod
     def newLTTransaction(sender_id: str, land_id: str, receiver_id: str) -> 'Transaction':
-        input: InputType = {
-            "user_id": sender_id,
-            "land_id": land_id,
-            "amount": 0
-        }
-        output: OutputType = {
-            "user_id": receiver_id
-        }
-        return Transaction.generateTransaction(Transaction.LT_TRANSACTION, input, output)
+        return Transaction(Transaction.LT, sender_id, land_id, 0, receiver_id)
 
     # Create new stake increase transaction
     @staticmethod
-    def newSTTransaction(sender_id: str, amount: int):
-        input: InputType = {
-            "user_id": sender_id,
-            "land_id": "",
-            "amount": amount
-        }
-        output: OutputType = {
-            "user_id": sender_id
-        }
-        return Transaction.generateTransaction(Transaction.ST_TRANSACTION, input, output)
+    def newSTTransaction(sender_id: str, amount: int) -> 'Transaction':
+        return Transaction(Transaction.ST, sender_id, "", amount, sender_id)
 
     @staticmethod
-    def generateTransaction(type: str, input: InputType, output: OutputType):
-        transaction = Transaction()
-        transaction.type = type
-        transaction.timestamp = datetime.now()
-        transaction.input = input
-        transaction.output = output
-        return transaction
+    def generateTransaction(type: str, input: InputType, output: OutputType) -> 'Transaction':
+        return Transaction(Transaction.TYPE_CODES[type], input["user_id"], input["land_id"], input["amount"], output["user_id"])
     
     @staticmethod
-    def serialize(transaction):
-        return pickle.dumps(transaction)
+    def serialize(transaction: 'Transaction') -> bytes:
+        return Codec.encodeVersion() + Transaction.encode(transaction)
+
+    @staticmethod
+    def deserialize(data: bytes | memoryview) -> 'Transaction':
+        view = memoryview(data)
+        transaction, _ = Transaction.decode(view, Codec.decodeVersion(view))
+        return transaction
+
+    @staticmethod
+    def serializeMany(transactions: list['Transaction']) -> bytes:
+        return Codec.encodeVersion() + Transaction.encodeMany(transactions)
+
+    @staticmethod
+    def deserializeMany(data: bytes | memoryview) -> list['Transaction']:
+        view = memoryview(data)
+        transactions, _ = Transaction.decodeMany(view, Codec.decodeVersion(view))
+        return transactions
+
+    # Binary format of a transaction
+    #   Type: 1 byte type tag
+    #   ID: 16 byte UUID
+    #   Timestamp: 8 byte integer (microseconds since the epoch)
+    #   Sender/User ID, Land ID: Length prefixed strings
+    #   Amount: 8 byte integer
+    #   Receiver ID: Length prefixed string
+    @staticmethod
+    def encode(transaction: 'Transaction') -> bytes:
+        return b"".join([
+            Transaction.RECORD_FORMAT.pack(transaction.code, transaction.key, transaction.time),
+            Codec.encodeString(transaction.userId),
+            Codec.encodeString(transaction.landId),
+            Codec.encodeInteger(transaction.amount),
+            Codec.encodeString(transaction.receiverId)
+        ])
+
+    @staticmethod
+    def decode(view: memoryview, offset: int) -> tuple['Transaction', int]:
+        code, key, time = Transaction.RECORD_FORMAT.unpack_from(view, offset)
+        offset += Transaction.RECORD_FORMAT.size
+        userId, offset = Codec.decodeString(view, offset)
+        landId, offset = Codec.decodeString(view, offset)
+        amount, offset = Codec.decodeInteger(view, offset)
+        receiverId, offset = Codec.decodeString(view, offset)
+        if code not in Transaction.CODE_TYPES:
+            raise ValueError(f"Invalid transaction type {code}")
+        return Transaction(code, userId, landId, amount, receiverId, key, time), offset
+
+    # Returns the size of the transaction in the binary format without encoding it
+    @staticmethod
+    def getSize(transaction: 'Transaction') -> int:
+        return (
+            Transaction.RECORD_FORMAT.size + 3 * Codec.LENGTH_FORMAT.size + Codec.INTEGER_FORMAT.size +
+            len(transaction.userId.encode("utf-8")) + len(transaction.landId.encode("utf-8")) + len(transaction.receiverId.encode("utf-8"))
+        )
+
+    @staticmethod
+    def encodeMany(transactions: list['Transaction']) -> bytes:
+        return Codec.encodeCount(len(transactions)) + b"".join([Transaction.encode(transaction) for transaction in transactions])
+
+    @staticmethod
+    def decodeMany(view: memoryview, offset: int) -> tuple[list['Transaction'], int]:
+        count, offset = Codec.decodeCount(view, offset)
+        transactions = []
+        for _ in range(count):
+            transaction, offset = Transaction.decode(view, offset)
+            transactions.append(transaction)
+        return transactions, offset
     
+    # Returns the transaction as a dictionary of JSON values
+    def toDict(self) -> dict:
+        return {"id": self.id, "type": self.type, "timestamp": self.timestamp.isoformat(), "input": self.input, "output": self.output}
+
+    # Returns the transaction as a line of tab separated values without colors
+    def toPlain(self) -> str:
+        return f"{self.id}\t{self.timestamp}\t{self}"
+
     def __repr__(self) -> str:
         return f"{colored(self.id, 'yellow')} [{colored(str(self.timestamp), 'cyan')}]: {str(self)}"
     
     def __str__(self) -> str:
-        if self.type == Transaction.RC_TRANSACTION:
-            return f"{self.input['user_id']} received {self.input['amount']} coins from the network"
-        elif self.type == Transaction.LD_TRANSACTION:
-            return f"{self.input['user_id']} owns {self.input['land_id']}"
-        elif self.type == Transaction.LT_TRANSACTION:
-            return f"{self.input['user_id']} transferred {self.input['land_id']} to {self.output['user_id']}"
-        elif self.type == Transaction.ST_TRANSACTION:
-            return f"{self.input['user_id']} staked {self.input['amount']} coins"
+        if self.code == Transaction.RC:
+            return f"{self.userId} received {self.amount} coins from the network"
+        elif self.code == Transaction.LD:
+            return f"{self.userId} owns {self.landId}"
+        elif self.code == Transaction.LT:
+            return f"{self.userId} transferred {self.landId} to {self.receiverId}"
+        elif self.code == Transaction.ST:
+            return f"{self.userId} staked {self.amount} coins"
         return "Invalid transaction type"
@@ -35,7 +35,7 @@ if __name__ == "__main__":
     # Display nodes in the network
     network.run('nodes')
 
-    # Node tries to register a land that someone already owns
+    # Node tries to register a land that someone already owns (rejected when it is added to the pools)
     network.run('charlie register land-1')
 
     # View transactions in pool
@@ -47,7 +47,7 @@ if __name__ == "__main__":
     # Node stakes when their balance is 0
     network.run('charlie stake 100')
 
-    # Two more blocks have been minted, display balances, stakes and lands
+    # Display balances, stakes and lands
     network.run('alice balance')
     network.run('bob balance')
     network.run('charlie balance')
@@ -63,6 +63,9 @@ if __name__ == "__main__":
     # Node sells land
     network.run('bob sell land-1 charlie')
 
+    # Node stakes, which fills the pool and mints a new block
+    network.run('alice stake 10')
+
     # Node stakes
     network.run('charlie stake 100')
 
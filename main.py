@@ -1,19 +1,102 @@
-import sys
-import pickle
+import argparse
+import time
 
+from network.async_network import AsyncNetwork
+from network.cluster import Cluster
 from network.network import Network
-from utils.utils import Log
+from network.node import Node
+from utils.utils import Log, Metrics
 
+# Usage: python main.py [<directory>] [--verify] [--async | --processes <n>] [--log-level <level>] [--log <type>=<level>]...
+#                       [--log-json <file>] [--log-async] [--metrics] [--metrics-memory] [--metrics-file <file> [--metrics-interval <seconds>]]
+#                       [--block-threshold <n>] [--block-max <n>] [--block-bytes <n>] [--block-flush <seconds>] [--block-adaptive <seconds>]
+# --verify checks the whole blockchain of the loaded network before starting
+# --async runs every node as an actor with its own queue (see AsyncNetwork)
+# --processes hosts the nodes in <n> worker processes driven by this process (see Cluster)
+# --log-level sets the level of all events, --log <type>=<level> the level of the events of a type (see Log)
+# --log-json also writes the events to a file of JSON lines, --log-async writes the output with a thread
+# --metrics records metrics (see Metrics), --metrics-memory also traces memory, --metrics-file writes them to a Prometheus text
+# or JSON file every --metrics-interval seconds (10 by default)
+# The --block options set the block policy (see BlockPolicy and the policy command)
 if __name__ == "__main__":
-    
-    if len(sys.argv) > 1:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", nargs="?")
+    parser.add_argument("--verify", action="store_true")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--async", dest="asynchronous", action="store_true")
+    mode.add_argument("--processes", type=int)
+    parser.add_argument("--log-level", choices=list(Log.LEVELS.keys()))
+    parser.add_argument("--log", action="append", default=[], metavar="<type>=<level>")
+    parser.add_argument("--log-json", metavar="<file>")
+    parser.add_argument("--log-async", action="store_true")
+    parser.add_argument("--metrics", action="store_true")
+    parser.add_argument("--metrics-memory", action="store_true")
+    parser.add_argument("--metrics-file", metavar="<file>")
+    parser.add_argument("--metrics-interval", type=float, default=10, metavar="<seconds>")
+    parser.add_argument("--block-threshold", type=int, metavar="<n>")
+    parser.add_argument("--block-max", type=int, metavar="<n>")
+    parser.add_argument("--block-bytes", type=int, metavar="<n>")
+    parser.add_argument("--block-flush", type=float, metavar="<seconds>")
+    parser.add_argument("--block-adaptive", type=float, metavar="<seconds>")
+    arguments = parser.parse_args()
+
+    if arguments.log_level is not None:
+        Log.setLevel(arguments.log_level)
+    for setting in arguments.log:
+        type, _, level = setting.rpartition("=")
         try:
-            with open(sys.argv[1], "rb") as f:
-                network = pickle.load(f)
-            Log.info(f"Successfully loaded network from file {sys.argv[1]}")
-            network.start()
+            Log.setLevel(level, type)
+        except ValueError as error:
+            parser.error(str(error))
+    if arguments.log_json is not None:
+        Log.setJsonFile(arguments.log_json)
+    Log.setAsynchronous(arguments.log_async)
+    # Set before the network is created, so that the workers of a Cluster record metrics as well
+    if arguments.metrics or arguments.metrics_memory or arguments.metrics_file is not None:
+        Metrics.setEnabled(True, arguments.metrics_memory)
+    if arguments.metrics_interval <= 0:
+        parser.error("--metrics-interval needs to be positive")
+    # Set before the network is created as well, so that the workers of a Cluster follow the same policy
+    for option, value in [
+        ("threshold", arguments.block_threshold), ("max", arguments.block_max), ("bytes", arguments.block_bytes),
+        ("flush", arguments.block_flush), ("adaptive", arguments.block_adaptive)
+    ]:
+        if value is not None and value <= 0:
+            parser.error(f"--block-{option} needs to be positive")
+    if arguments.block_threshold is not None:
+        Node.policy.threshold = Node.policy.adaptiveThreshold = arguments.block_threshold
+    if arguments.block_max is not None:
+        Node.policy.maxTransactions = arguments.block_max
+    if arguments.block_bytes is not None:
+        Node.policy.maxBytes = arguments.block_bytes
+    Node.policy.flushInterval = arguments.block_flush
+    Node.policy.targetInterval = arguments.block_adaptive
+
+    def startMetrics(network: Network) -> None:
+        if arguments.metrics_file is not None:
+            network.handle(["metrics", "dump", arguments.metrics_file, str(arguments.metrics_interval)])
+
+    if arguments.processes is not None:
+        load = lambda directory: Cluster.load(directory, arguments.processes)
+        create = lambda: Cluster(arguments.processes)
+    else:
+        networkClass = AsyncNetwork if arguments.asynchronous else Network
+        load = networkClass.load
+        create = networkClass
+
+    if arguments.directory is not None:
+        try:
+            start = time.perf_counter()
+            network = load(arguments.directory)
+            Log.info(f"Successfully loaded network from {arguments.directory} in {time.perf_counter() - start:.3f}s", "STARTUP")
         except:
-            Log.error(f"Invalid file {sys.argv[1]}")
+            Log.error(f"Invalid network {arguments.directory}")
+        else:
+            if arguments.verify:
+                network.run("verify")
+            startMetrics(network)
+            network.start()
     else:
-        network = Network()
+        network = create()
+        startMetrics(network)
         network.start()
@@ -0,0 +1,90 @@
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, Sequence
+
+from blockchain.block import Block
+from blockchain.transaction import Transaction
+from network.node import Node
+from utils.utils import Log
+
+if TYPE_CHECKING:
+    from network.async_network import AsyncNetwork
+
+# NodeActor runs a node of an AsyncNetwork as an actor with its own inbound queue
+#
+# Messages are handled one at a time in the order they were received
+#   ("transaction", transaction, peers): Adds the transaction to the transaction pool of the node
+#   ("block", block): Adds the block to the blockchain of the node
+# Consecutive transactions waiting in the queue are admitted as a batch and the node checks whether it is the validator
+# once per batch, and again after every block since the election changes with the tip
+# A validator mints as soon as its pool is full and adds the block to its own blockchain before the block is sent to
+# the other actors, so it keeps taking transactions while the others catch up
+#
+# Backpressure: at most QUEUE_SIZE transactions can wait in the queue, send() waits for a free slot
+# Blocks do not take a slot, so an actor sending a block never waits on another actor
+class NodeActor:
+    QUEUE_SIZE = 256
+    BATCH_SIZE = 64
+
+    def __init__(self, node: Node, network: 'AsyncNetwork') -> None:
+        self.node = node
+        self.network = network
+        self.inbox: deque[tuple] = deque()
+        self.ready = asyncio.Event()
+        self.slots = asyncio.Semaphore(NodeActor.QUEUE_SIZE)
+
+    # Queues a transaction, waiting while the queue is full
+    async def send(self, transaction: Transaction, peers: Sequence[str]) -> None:
+        await self.slots.acquire()
+        self.network.pending += 1
+        self.inbox.append(("transaction", transaction, peers))
+        self.ready.set()
+
+    # Queues a block without waiting
+    def sendBlock(self, block: Block) -> None:
+        self.network.pending += 1
+        self.inbox.append(("block", block))
+        self.ready.set()
+
+    # Handles the messages of the queue until the actor is cancelled
+    async def run(self) -> None:
+        while True:
+            while len(self.inbox) == 0:
+                self.ready.clear()
+                await self.ready.wait()
+            message = self.inbox.popleft()
+            if message[0] == "block":
+                self.node.addBlock(message[1])
+                # The election of the new tip may choose this node while its pool is already full
+                if self.node.isValidator(self.network.getPeers()):
+                    self.mint()
+                self.network.done(1)
+            else:
+                batch = [message]
+                while len(batch) < NodeActor.BATCH_SIZE and len(self.inbox) > 0 and self.inbox[0][0] == "transaction":
+                    batch.append(self.inbox.popleft())
+                isMinting = False
+                for _, transaction, peers in batch:
+                    isMinting = self.node.addTransaction(transaction, peers) or isMinting
+                    self.slots.release()
+                if isMinting:
+                    self.mint()
+                self.network.done(len(batch))
+            # Let the other actors and the producer run between messages
+            await asyncio.sleep(0)
+
+    # Mints a block from the pool, adds it to the blockchain of the node and sends it to the other actors
+    # A deep pool is minted into blocks back to back for as long as the node is elected for the new tip
+    def mint(self) -> None:
+        while True:
+            Node.logValidator(self.node.id)
+            block = self.node.mint()
+            if block is None:
+                return
+            self.node.addBlock(block)
+            Log.info(f"Broadcasting minted block {block.id} to all nodes", "BROADCAST")
+            for actor in self.network.actors.values():
+                if actor is not self:
+                    actor.sendBlock(block)
+            if not self.node.isValidator(self.network.getPeers()):
+                return
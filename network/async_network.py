@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Coroutine
+
+from termcolor import colored
+
+from blockchain.block import Block
+from blockchain.transaction import Transaction
+from network.actor import NodeActor
+from network.network import Network
+from utils.utils import Log
+
+# AsyncNetwork is a Network in which every node runs as an actor with its own inbound queue (see NodeActor)
+#
+# Broadcasts put the transaction into the queue of every actor and the actors handle their queues concurrently on an
+# asyncio event loop. The validator mints as soon as its own pool is full while the other actors keep taking transactions,
+# and its block reaches them through their queues
+#
+# The commands of Network are unchanged: every broadcast runs the event loop until all queues are empty, so a command
+# sees the same network as it would in a Network. broadcastTransactions() only waits once all of its transactions have
+# been handled, so that they are pipelined through the actors
+class AsyncNetwork(Network):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.loop = asyncio.new_event_loop()
+        self.actors: dict[str, NodeActor] = {}
+        self.pending = 0
+        self.idle = asyncio.Event()
+
+    # Broadcast new transaction to all actors and wait until the network has handled it
+    def broadcastTransaction(self, transaction: Transaction) -> None:
+        Log.info(lambda: f"Broadcasting transaction {colored(transaction.id, 'yellow')} to all nodes", "BROADCAST")
+        self.broadcastTransactions([transaction])
+
+    # Broadcast the transactions to all actors in order and wait until the network has handled all of them
+    def broadcastTransactions(self, transactions: list[Transaction]) -> None:
+        actors = self.getActors()
+        peers = self.getPeers()
+
+        async def publish() -> None:
+            for transaction in transactions:
+                for actor in actors:
+                    await actor.send(transaction, peers)
+
+        self.loop.run_until_complete(self.runActors(publish()))
+
+    # Broadcasts a block to all actors and waits until the network has handled it
+    def broadcastBlock(self, block: Block | None) -> None:
+        if block is None:
+            return
+        Log.info(f"Broadcasting minted block {block.id} to all nodes", "BROADCAST")
+        actors = self.getActors()
+
+        async def publish() -> None:
+            for actor in actors:
+                actor.sendBlock(block)
+
+        self.loop.run_until_complete(self.runActors(publish()))
+
+    # Runs the actors while the messages are published, until all queues are empty
+    # An error in an actor stops the other actors and is raised again
+    async def runActors(self, publish: Coroutine[Any, Any, None]) -> None:
+        tasks = [self.loop.create_task(actor.run()) for actor in self.actors.values()]
+        publisher = self.loop.create_task(publish)
+        try:
+            while not publisher.done() or self.pending > 0:
+                self.idle.clear()
+                idle = self.loop.create_task(self.idle.wait())
+                waiting = tasks + [idle] + ([publisher] if not publisher.done() else [])
+                await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                idle.cancel()
+                for task in tasks + [publisher]:
+                    if task.done():
+                        task.result()
+        finally:
+            for task in tasks + [publisher]:
+                task.cancel()
+            await asyncio.gather(*tasks, publisher, return_exceptions=True)
+
+    # Called by the actors once they have handled a number of messages
+    def done(self, count: int) -> None:
+        self.pending -= count
+        if self.pending == 0:
+            self.idle.set()
+
+    # Returns the actors of all nodes, creating the actors of new nodes
+    def getActors(self) -> list[NodeActor]:
+        for nodeId, node in self.nodes.items():
+            if nodeId not in self.actors:
+                self.actors[nodeId] = NodeActor(node, self)
+        return list(self.actors.values())
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from blockchain.block import Block
+from blockchain.codec import Codec
+from blockchain.constants import BLOCK_TRANSACTION_THRESHOLD, MAX_BLOCK_BYTES, MAX_BLOCK_TRANSACTIONS
+from network.mempool import Mempool
+
+# The BlockPolicy class decides when the validator mints a block and how many transactions go into it
+#
+# Parameters
+#   threshold: Number of pending transactions from which a block is minted
+#   maxTransactions, maxBytes: Maximum number of transactions of a block and maximum encoded size of its transactions
+#   flushInterval: Seconds after which waiting transactions are minted even if the pool is below the threshold
+#     (None to wait for the threshold, see Mempool.getWaitingTime)
+#   targetInterval: Adaptive sizing, None to keep the threshold fixed. The threshold follows the number of transactions which
+#     arrive every targetInterval seconds, between threshold and maxTransactions, so that a busy network mints fewer and
+#     larger blocks. The pool is also flushed every targetInterval seconds if no flushInterval is set
+#
+# A pool deeper than a block is drained into several full blocks back to back, each minted by the validator elected for
+# the tip it extends (see Network.mintBlocks), so the cost of an election, hash and broadcast is shared by more transactions
+class BlockPolicy:
+    # Weight of the latest arrival rate in the adaptive threshold
+    SMOOTHING = 0.5
+
+    def __init__(
+        self,
+        threshold: int = BLOCK_TRANSACTION_THRESHOLD,
+        maxTransactions: int = MAX_BLOCK_TRANSACTIONS,
+        maxBytes: int = MAX_BLOCK_BYTES,
+        flushInterval: float | None = None,
+        targetInterval: float | None = None
+    ) -> None:
+        self.threshold = threshold
+        self.maxTransactions = maxTransactions
+        self.maxBytes = maxBytes
+        self.flushInterval = flushInterval
+        self.targetInterval = targetInterval
+        self.adaptiveThreshold = float(threshold)
+
+    # Returns the number of pending transactions from which a block is minted
+    def getThreshold(self) -> int:
+        if self.targetInterval is None:
+            return self.threshold
+        return min(max(int(self.adaptiveThreshold), self.threshold), self.maxTransactions)
+
+    # Returns whether the pool holds enough transactions, or its transactions waited long enough, for a block to be minted
+    def isReady(self, pool: Mempool) -> bool:
+        depth = len(pool)
+        if depth >= self.getThreshold():
+            return depth > 0
+        interval = self.flushInterval if self.flushInterval is not None else self.targetInterval
+        if depth == 0 or interval is None:
+            return False
+        return pool.getWaitingTime() >= interval
+
+    # Updates the adaptive threshold with the number of transactions pending when a block was minted on top of the tip
+    def recordBlock(self, depth: int, tip: Block) -> None:
+        if self.targetInterval is None:
+            return
+        elapsed = max(Codec.encodeTimestamp(datetime.now()) - tip.time, 1) / 1e6
+        target = depth / elapsed * self.targetInterval
+        self.adaptiveThreshold += BlockPolicy.SMOOTHING * (target - self.adaptiveThreshold)
+        self.adaptiveThreshold = min(max(self.adaptiveThreshold, self.threshold), self.maxTransactions)
+
+    def getSettings(self) -> list[tuple[str, object]]:
+        return [
+            ("threshold", self.threshold),
+            ("max transactions", self.maxTransactions),
+            ("max bytes", self.maxBytes),
+            ("flush interval", "off" if self.flushInterval is None else f"{self.flushInterval:g}s"),
+            ("adaptive", "off" if self.targetInterval is None else f"a block every {self.targetInterval:g}s"),
+            ("current threshold", self.getThreshold())
+        ]
@@ -0,0 +1,280 @@
+import atexit
+import multiprocessing
+import os
+import socket
+import tempfile
+from itertools import islice
+from typing import Iterable
+
+from termcolor import colored
+
+from blockchain.block import Block
+from blockchain.codec import Codec
+from blockchain.constants import INGEST_BLOCK_SIZE
+from blockchain.transaction import Transaction
+from network.network import Network
+from network.protocol import Protocol
+from network.worker import runWorker
+from utils.utils import Log
+
+# Cluster is a Network whose nodes are hosted by worker processes (see ClusterWorker), so that it is not limited to one core
+#
+# The controller (this process) starts the workers, which connect to it over a Unix socket and exchange the messages of
+# Protocol with it. Nodes are assigned to the workers in turn as they join
+#   Node commands run on the worker hosting the node, the other commands on the worker hosting the first node
+#   Metrics are recorded by every worker, the metrics command runs on all of them and each one writes its own file
+#   Changes to the log levels and the block policy are made on the controller and every worker
+#   Transactions are sent to all workers at once, which add them to the pools of their nodes in parallel
+#   A block minted by a worker is sent to the other workers, which may mint the next block in turn
+#   A node joining a worker which hosts no node yet starts from the blocks and pool of the first node (SYNC)
+# Every message is replied to before the next command runs, so all nodes follow the same blockchain
+class Cluster(Network):
+    BATCH_SIZE = 256
+
+    def __init__(self, processes: int | None = None, directory: str | None = None) -> None:
+        super().__init__()
+        processes = processes if processes is not None else os.cpu_count() or 1
+        self.placement: dict[str, int] = {}
+        self.closed = False
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        address = os.path.join(self.temporaryDirectory.name, "cluster.sock")
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+        listener.listen(processes)
+        context = multiprocessing.get_context("fork")
+        self.processes = [
+            context.Process(target=runWorker, args=(address, index, processes, directory)) for index in range(processes)
+        ]
+        for process in self.processes:
+            process.start()
+        atexit.register(self.close)
+
+        self.connections: list[socket.socket] = []
+        indexes: list[int] = []
+        loaded: list[str] = []
+        error = None
+        for _ in range(processes):
+            connection, _ = listener.accept()
+            self.connections.append(connection)
+            message = Protocol.receive(connection)
+            if message is None or message[0] == Protocol.ERROR:
+                error = str(message[1], "utf-8") if message is not None else "The worker stopped"
+                indexes.append(-1)
+                continue
+            body = message[1]
+            index, offset = Codec.decodeCount(body, 0)
+            loaded, _ = Protocol.decodeStrings(body, offset)
+            indexes.append(index)
+        listener.close()
+        if error is not None:
+            self.close()
+            raise RuntimeError(f"A worker could not load {directory}:\n{error}")
+        self.connections = [self.connections[indexes.index(index)] for index in range(processes)]
+
+        for position, nodeId in enumerate(loaded):
+            self.placement[nodeId] = position % processes
+        self.sendPeers()
+        Log.info(f"Started {processes} worker processes", "CLUSTER")
+
+    # Loads a network saved with save(), the nodes are assigned to the workers in turn
+    @classmethod
+    def load(cls, directory: str, processes: int | None = None) -> 'Cluster':
+        return cls(processes, os.path.abspath(directory))
+
+    def getPeers(self) -> list[str]:
+        return list(self.placement.keys())
+
+    # The controller hosts no node, the nodes are looked up in their placement on the workers
+    def nodeExists(self, nodeId: str | None = None) -> bool:
+        if nodeId is None:
+            if len(self.placement) <= 0:
+                Log.error(f"At least one node needs to be connected to the network")
+                return False
+            return True
+
+        if nodeId not in self.placement:
+            Log.error(f"Node ID {nodeId} is invalid")
+            return False
+        return True
+
+    # Sends a message to a worker and returns the blocks, transactions and output of its reply
+    def request(self, worker: int, type: int, body: bytes = b"") -> tuple[list[Block], list[Transaction], str]:
+        Protocol.send(self.connections[worker], type, body)
+        return self.receiveReply(worker)
+
+    # Sends a message to all workers at once and returns their replies in order
+    # The rejections which start the replies to TRANSACTIONS are added up in rejected
+    def requestAll(
+        self, type: int, body: bytes = b"", exclude: int | None = None, rejected: dict[str, int] | None = None
+    ) -> list[tuple[list[Block], list[Transaction], str]]:
+        workers = [worker for worker in range(len(self.connections)) if worker != exclude]
+        for worker in workers:
+            Protocol.send(self.connections[worker], type, body)
+        return [self.receiveReply(worker, rejected) for worker in workers]
+
+    def receiveReply(self, worker: int, rejected: dict[str, int] | None = None) -> tuple[list[Block], list[Transaction], str]:
+        body = self.receiveBody(worker)
+        if rejected is None:
+            return Protocol.decodeReply(body)
+        counts, offset = Protocol.decodeRejections(body, 0)
+        for reason, count in counts.items():
+            rejected[reason] = rejected.get(reason, 0) + count
+        return Protocol.decodeReply(body, offset)
+
+    def receiveBody(self, worker: int) -> memoryview:
+        message = Protocol.receive(self.connections[worker])
+        if message is None:
+            raise ConnectionError(f"Worker {worker} stopped")
+        type, body = message
+        if type == Protocol.ERROR:
+            raise RuntimeError(f"Worker {worker} failed:\n{str(body, 'utf-8')}")
+        return body
+
+    def sendPeers(self) -> None:
+        self.requestAll(Protocol.PEERS, Protocol.encodeStrings(self.getPeers()))
+
+    # Connects a new node to the worker whose turn it is
+    def connectNode(self, id: str, balance: int) -> None:
+        if id in self.placement:
+            Log.info(f"Node {id} is trying to join the network", "NEW NODE")
+            Log.error("Node already exists")
+            return None
+
+        worker = len(self.placement) % len(self.connections)
+        sync = Codec.encodeCount(0)
+        if len(self.placement) > 0 and worker not in self.placement.values():
+            blocks, pool, _ = self.request(self.placement[self.getPeers()[0]], Protocol.SYNC, Codec.encodeCount(0))
+            sync = Codec.encodeCount(1) + Block.encodeMany(blocks) + Transaction.encodeMany(pool)
+
+        self.placement[id] = worker
+        self.sendPeers()
+        _, transactions, output = self.request(worker, Protocol.JOIN, Codec.encodeString(id) + Codec.encodeInteger(balance) + sync)
+        Log.output(output, end="")
+        for transaction in transactions:
+            self.broadcastTransaction(transaction)
+        Log.info(f"Node {id} has joined the network", "NEW NODE")
+
+    # Broadcast new transaction to all workers
+    def broadcastTransaction(self, transaction: Transaction) -> None:
+        Log.info(lambda: f"Broadcasting transaction {colored(transaction.id, 'yellow')} to all nodes", "BROADCAST")
+        self.publish([transaction])
+
+    # Broadcast transactions to all workers in batches of BATCH_SIZE
+    def broadcastTransactions(self, transactions: list[Transaction]) -> None:
+        for start in range(0, len(transactions), Cluster.BATCH_SIZE):
+            self.publish(transactions[start:start + Cluster.BATCH_SIZE])
+
+    # Adds transactions to the cluster in batches of blockSize
+    # The workers mint once per batch, so the blocks hold about blockSize transactions
+    # Returns the number of blocks minted and the number of transactions rejected by the pool of the first node by reason
+    def ingest(self, transactions: Iterable[Transaction], blockSize: int = INGEST_BLOCK_SIZE) -> tuple[int, dict[str, int]]:
+        blocks = 0
+        rejected = {}
+        transactions = iter(transactions)
+        while len(batch := list(islice(transactions, blockSize))) > 0:
+            blocks += self.publish(batch, rejected)
+        return blocks, rejected
+
+    # Sends transactions to all workers, then sends every minted block to the other workers until no block is minted
+    # Returns the number of blocks minted, the transactions rejected by the pool of the first node are counted in rejected
+    def publish(self, transactions: list[Transaction], rejected: dict[str, int] | None = None) -> int:
+        replies = self.requestAll(
+            Protocol.TRANSACTIONS, Transaction.encodeMany(transactions), rejected=rejected if rejected is not None else {}
+        )
+        minted = self.printReplies(replies)
+        blocks = 0
+        while len(minted) > 0:
+            worker, block = minted.pop(0)
+            Log.info(f"Broadcasting minted block {block.id} to all nodes", "BROADCAST")
+            replies = self.requestAll(Protocol.BLOCK, Block.encode(block), exclude=worker)
+            workers = [other for other in range(len(self.connections)) if other != worker]
+            minted += [(workers[i], block) for i, block in self.printReplies(replies)]
+            blocks += 1
+        return blocks
+
+    # Prints the output of the replies and returns the blocks they hold along with the position of the reply
+    def printReplies(self, replies: list[tuple[list[Block], list[Transaction], str]]) -> list[tuple[int, Block]]:
+        minted = []
+        for position, (blocks, _, output) in enumerate(replies):
+            Log.output(output, end="")
+            minted += [(position, block) for block in blocks]
+        return minted
+
+    # Saves the cluster as a network, which is written by the worker hosting the first node
+    def save(self, directory: str) -> None:
+        if len(self.placement) == 0:
+            Network().save(directory)
+            return
+        writer = self.placement[self.getPeers()[0]]
+        count = 0
+        others = []
+        for worker in range(len(self.connections)):
+            if worker != writer:
+                Protocol.send(self.connections[worker], Protocol.NODES)
+                body = self.receiveBody(worker)
+                nodes, offset = Codec.decodeCount(body, 0)
+                count += nodes
+                others.append(bytes(body[offset:]))
+        body = Codec.encodeString(os.path.abspath(directory)) + Codec.encodeCount(count) + b"".join(others)
+        _, _, output = self.request(writer, Protocol.SAVE, body)
+        Log.output(output, end="")
+
+    # Handle user commands
+    # Commands are run by the workers, except for the ones which concern the whole cluster
+    # The errors of the workers are logged
+    def handle(self, command: list[str]) -> None:
+        try:
+            match command:
+                case ["connect", _, _] | ["nodes"] | ["help"] | ["stop"] | ["throughput", _] | ["save"] | ["save", _]:
+                    super().handle(command)
+                case ["load", _] | ["load", _, _]:
+                    super().handle(command)
+                case ["log", _] | ["log", _, _] | ["policy", _, _]:
+                    super().handle(command)
+                    for worker in range(len(self.connections)):
+                        self.runCommand(worker, command)
+                case ["sync", *_]:
+                    Log.info("The nodes of a cluster follow the blocks broadcast by the controller, they never fall behind", "SYNC")
+                case ["metrics", *_]:
+                    for worker in range(len(self.connections)):
+                        Log.info(f"Worker {worker}", "METRICS")
+                        self.runCommand(worker, command)
+                case [nodeId, *_] if nodeId in self.placement:
+                    self.runCommand(self.placement[nodeId], command)
+                case _:
+                    if len(self.placement) == 0:
+                        super().handle(command)
+                    else:
+                        self.runCommand(self.placement[self.getPeers()[0]], command)
+        except (RuntimeError, ConnectionError) as error:
+            Log.error(str(error))
+
+    # Runs a command on a worker and broadcasts the transactions it creates
+    def runCommand(self, worker: int, command: list[str]) -> None:
+        _, transactions, output = self.request(worker, Protocol.COMMAND, " ".join(command).encode("utf-8"))
+        Log.output(output, end="")
+        for transaction in transactions:
+            self.broadcastTransaction(transaction)
+
+    # Start the network, then stop the workers (they are also stopped when the controller exits)
+    def start(self) -> None:
+        try:
+            super().start()
+        finally:
+            self.close()
+
+    # Stops the workers
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for connection in self.connections:
+            try:
+                Protocol.send(connection, Protocol.STOP)
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.temporaryDirectory.cleanup()
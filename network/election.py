@@ -0,0 +1,91 @@
+import math
+import random
+from collections import OrderedDict
+from typing import Sequence
+
+import numpy as np
+
+from blockchain.blockchain import Blockchain
+from network.peers import Peers
+from utils.utils import Metrics
+
+# The Election class selects the validator of the next block (see Node.getValidator for the consensus rules)
+#
+# Every node runs the election for every transaction once its pool is full, and all of them reach the same result
+# since it only depends on the chain and the peers. The result is therefore computed once per tip hash and set of peers,
+# and shared by every node in the process. The peers of a network are identified by the version of their list (see
+# Peers), so a cached election costs the same whatever the number of peers; other sequences are keyed by their IDs
+#
+# The coinages (stake * age + 1) are computed with NumPy from a column of stakes and a column of last minted heights
+# in the order of the peers. The columns of a Peers list are kept with the tip they were taken at, and when the chain
+# has grown from that tip only the entries changed by the new blocks are updated, as listed by their undo records
+# (see Blockchain.getChangedKeys). The columns are built again after a switch of branch or when the peers change
+# The running totals are taken with numpy.cumsum and the validator is sampled with a binary search
+# (numpy.searchsorted), using a random number generator seeded with the hash of the last block (the global random
+# module is left untouched)
+class Election:
+    CACHE_SIZE = 64
+    COLUMNS_CACHE_SIZE = 4
+
+    cache: OrderedDict[tuple[str, int | tuple[str, ...]], str] = OrderedDict()
+    # Peers version: (tip hash, length, stakes, last minted heights)
+    columns: OrderedDict[int, tuple[str, int, np.ndarray, np.ndarray]] = OrderedDict()
+
+    @staticmethod
+    def getValidator(blockchain: Blockchain, peers: Sequence[str]) -> str:
+        tipHash = blockchain.getLastBlock().hash
+        key = (tipHash, peers.version if isinstance(peers, Peers) else tuple(peers))
+        if key in Election.cache:
+            Election.cache.move_to_end(key)
+            Metrics.increment("elections_total", "cached")
+            return Election.cache[key]
+
+        start = Metrics.start()
+        cumulativeCoinages = Election.getCumulativeCoinages(blockchain, peers)
+        generator = random.Random(tipHash)
+        # The running totals are integers, so they exceed the sampled value exactly when they exceed its floor, which is
+        # compared as an integer: compared to a float, the totals would be cast to floats and lose precision above 2 ** 53
+        threshold = math.floor(generator.random() * int(cumulativeCoinages[-1]))
+        position = int(np.searchsorted(cumulativeCoinages, threshold, side="right"))
+        validator = peers[min(position, len(peers) - 1)]
+
+        Election.cache[key] = validator
+        if len(Election.cache) > Election.CACHE_SIZE:
+            Election.cache.popitem(last=False)
+        Metrics.increment("elections_total", "computed")
+        Metrics.stop("election_seconds", start)
+        return validator
+
+    # Returns the running totals of (stake * age + 1) of the peers in order
+    @staticmethod
+    def getCumulativeCoinages(blockchain: Blockchain, peers: Sequence[str]) -> np.ndarray:
+        stakes, lastMinted = Election.getColumns(blockchain, peers)
+        return np.cumsum(stakes * (blockchain.getLength() - lastMinted - 1) + 1)
+
+    # Returns the stake and the height of the last block minted of every peer, as columns in the order of the peers
+    @staticmethod
+    def getColumns(blockchain: Blockchain, peers: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+        state = blockchain.state
+        length = blockchain.getLength()
+        entry = Election.columns.get(peers.version) if isinstance(peers, Peers) else None
+        changed = None
+        if entry is not None and entry[1] <= length and blockchain.getBlockFromHeight(entry[1] - 1).hash == entry[0]:
+            changed = [blockchain.getChangedKeys(field, entry[1]) for field in ["stakes", "lastMinted"]]
+
+        if changed is None or None in changed:
+            stakes = np.fromiter((state.stakes.get(peer, 0) for peer in peers), dtype="i8", count=len(peers))
+            lastMinted = np.fromiter((state.lastMinted.get(peer, -1) for peer in peers), dtype="i8", count=len(peers))
+        else:
+            _, _, stakes, lastMinted = entry
+            positions = peers.getPositions()
+            for column, values, default, keys in [(stakes, state.stakes, 0, changed[0]), (lastMinted, state.lastMinted, -1, changed[1])]:
+                for key in keys:
+                    if key in positions:
+                        column[positions[key]] = values.get(key, default)
+
+        if isinstance(peers, Peers):
+            Election.columns[peers.version] = (blockchain.getLastBlock().hash, length, stakes, lastMinted)
+            Election.columns.move_to_end(peers.version)
+            if len(Election.columns) > Election.COLUMNS_CACHE_SIZE:
+                Election.columns.popitem(last=False)
+        return stakes, lastMinted
@@ -0,0 +1,84 @@
+import csv
+import json
+from itertools import chain
+from typing import Iterable, Iterator
+
+from blockchain.transaction import Transaction
+
+# The Ingest class reads land registry operations in bulk and turns them into transactions
+#
+# Operations are read from CSV or JSON lines, one operation per line, in the order of the commands of the network
+#   CSV: <node_id>,register,<land_id> | <node_id>,buy,<land_id>,<seller_id> | <node_id>,sell,<land_id>,<receiver_id> | <node_id>,stake,<amount>
+#   JSON lines: {"node": ..., "operation": "register" | "buy" | "sell" | "stake", "land": ..., "seller": ..., "receiver": ..., "amount": ...}
+# The fields of a JSON line are taken by name, those of every operation are listed in FIELDS (other fields are ignored)
+# The format is detected from the first line. Lines are read lazily, so that files of any size can be streamed
+# As with the commands, the node, seller and receiver of an operation must be nodes of the network
+class Ingest:
+    FIELDS = {"register": ["land"], "buy": ["land", "seller"], "sell": ["land", "receiver"], "stake": ["amount"]}
+
+    # Returns the line number and either the transaction or the reason the line is invalid, for every non empty line
+    @staticmethod
+    def readTransactions(lines: Iterable[str], peers: set[str]) -> Iterator[tuple[int, Transaction | str]]:
+        lines = iter(lines)
+        first = next(lines, None)
+        if first is None:
+            return
+        lines = chain([first], lines)
+        if first.lstrip().startswith("{"):
+            for number, line in enumerate(lines, 1):
+                if line.strip() == "":
+                    continue
+                try:
+                    yield number, Ingest.createJsonTransaction(json.loads(line), peers)
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    yield number, f"invalid operation ({error})"
+        else:
+            for number, row in enumerate(csv.reader(lines), 1):
+                if len(row) == 0:
+                    continue
+                if len(row) < 3:
+                    yield number, "invalid operation"
+                    continue
+                try:
+                    yield number, Ingest.createTransaction(row[0], row[1], row[2:], peers)
+                except ValueError as error:
+                    yield number, f"invalid operation ({error})"
+
+    # Creates the transaction of an operation given as a JSON object, whose arguments are taken from the FIELDS of the operation
+    @staticmethod
+    def createJsonTransaction(operation: dict, peers: set[str]) -> Transaction:
+        name = operation["operation"]
+        if name not in Ingest.FIELDS:
+            raise ValueError(f"unknown operation {name}")
+        missing = [field for field in ["node"] + Ingest.FIELDS[name] if field not in operation]
+        if len(missing) > 0:
+            raise ValueError(f"{name} is missing {', '.join(missing)}")
+        return Ingest.createTransaction(operation["node"], name, [str(operation[field]) for field in Ingest.FIELDS[name]], peers)
+
+    # Creates the transaction of an operation
+    # arguments holds the arguments of the command (CSV) or of the operation (JSON lines), in the order of the command
+    # Raises a ValueError when the operation is unknown or one of its nodes is not in peers
+    @staticmethod
+    def createTransaction(nodeId: str, operation: str, arguments: list[str], peers: set[str]) -> Transaction:
+        arguments = [argument for argument in arguments if argument != ""]
+        match [operation, *arguments]:
+            case ["register", landId]:
+                Ingest.checkNodes(peers, nodeId)
+                return Transaction.newLDTransaction(nodeId, landId)
+            case ["buy", landId, sellerId]:
+                Ingest.checkNodes(peers, nodeId, sellerId)
+                return Transaction.newLTTransaction(sellerId, landId, nodeId)
+            case ["sell", landId, receiverId]:
+                Ingest.checkNodes(peers, nodeId, receiverId)
+                return Transaction.newLTTransaction(nodeId, landId, receiverId)
+            case ["stake", amount]:
+                Ingest.checkNodes(peers, nodeId)
+                return Transaction.newSTTransaction(nodeId, int(amount))
+        raise ValueError(f"unknown operation {operation} with arguments {arguments}")
+
+    # Raises a ValueError for the first node which is not in peers
+    @staticmethod
+    def checkNodes(peers: set[str], *nodeIds: str) -> None:
+        for nodeId in nodeIds:
+            if nodeId not in peers:
+                raise ValueError(f"node {nodeId} does not exist")
@@ -0,0 +1,235 @@
+import time
+from collections import ChainMap
+from itertools import islice
+from typing import Iterable, Iterator
+
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from blockchain.transaction import Transaction
+from utils.utils import Metrics
+
+# The Mempool class is the pool of pending transactions of a node
+#
+# Transactions are validated when they are admitted, against the state of the blockchain combined with the changes
+# of the transactions already in the pool (the pending state)
+#   Land owners: The owner of every land after the pending declarations and transfers
+#   Stakes: The total amount of pending stakes of every user
+# Transactions are indexed by the lands and users they refer to, so that when a block is added only the pending
+# transactions which conflict with it are validated again. Included and invalidated transactions are evicted, the rest stay
+# Transactions are referred to by their key (see Transaction)
+# The pool records since when transactions have been waiting for a block: the time it last became non-empty, or the time
+# of the last block if transactions were left in it
+class Mempool:
+    def __init__(self) -> None:
+        self.transactions: dict[bytes, Transaction] = {}
+        self.sequence: dict[bytes, int] = {}
+        self.nextSequence = 0
+        self.landOwners: dict[str, str] = {}
+        self.stakes: dict[str, int] = {}
+        self.byLand: dict[str, list[bytes]] = {}
+        self.byUser: dict[str, set[bytes]] = {}
+        self.waitingSince: float | None = None
+
+    # Creates a pool from the transactions which are still valid on top of the blockchain, in the given order
+    # Used when the blockchain of a node moved to another chain (see Node.addBlock and Sync)
+    @staticmethod
+    def fromTransactions(transactions: Iterable[Transaction], blockchain: Blockchain) -> 'Mempool':
+        mempool = Mempool()
+        for transaction in transactions:
+            mempool.admit(transaction, blockchain)
+        return mempool
+
+    def copy(self) -> 'Mempool':
+        mempool = Mempool()
+        mempool.transactions = dict(self.transactions)
+        mempool.sequence = dict(self.sequence)
+        mempool.nextSequence = self.nextSequence
+        mempool.landOwners = dict(self.landOwners)
+        mempool.stakes = dict(self.stakes)
+        mempool.byLand = {landId: list(transactionIds) for landId, transactionIds in self.byLand.items()}
+        mempool.byUser = {userId: set(transactionIds) for userId, transactionIds in self.byUser.items()}
+        mempool.waitingSince = self.waitingSince
+        return mempool
+
+    # Validates a transaction against the pending state and adds it to the pool
+    # Returns the reason the transaction is invalid, or None if it was added
+    def add(self, transaction: Transaction, blockchain: Blockchain) -> str | None:
+        if not Metrics.enabled:
+            return self.admit(transaction, blockchain)
+        start = Metrics.start()
+        reason = self.admit(transaction, blockchain)
+        Metrics.stop("validation_seconds", start)
+        if reason is None:
+            Metrics.increment("transactions_admitted_total")
+        else:
+            Metrics.increment("transactions_rejected_total", reason)
+        return reason
+
+    # add() without the metrics, also used when pending transactions are validated again
+    def admit(self, transaction: Transaction, blockchain: Blockchain) -> str | None:
+        if transaction.key in self.transactions:
+            return "it is already in the pool"
+        if blockchain.hasTransaction(transaction.key):
+            return "it is already in the blockchain"
+
+        state = blockchain.state
+        userId = transaction.userId
+        reason = Mempool.check(
+            transaction,
+            ChainMap(self.landOwners, state.landOwners),
+            {userId: state.balances.get(userId, 0) - self.stakes.get(userId, 0)},
+            state.landOwners
+        )
+        if reason is not None:
+            return reason
+
+        if len(self.transactions) == 0:
+            self.waitingSince = time.monotonic()
+        self.transactions[transaction.key] = transaction
+        self.sequence[transaction.key] = self.nextSequence
+        self.nextSequence += 1
+        for user in Mempool.getUsers(transaction):
+            if user not in self.byUser:
+                self.byUser[user] = set()
+            self.byUser[user].add(transaction.key)
+        if transaction.code == Transaction.LD or transaction.code == Transaction.LT:
+            landId = transaction.landId
+            if landId not in self.byLand:
+                self.byLand[landId] = []
+            self.byLand[landId].append(transaction.key)
+            self.landOwners[landId] = Mempool.getNewOwner(transaction)
+        elif transaction.code == Transaction.ST:
+            self.stakes[userId] = self.stakes.get(userId, 0) + transaction.amount
+        return None
+
+    def remove(self, transaction: Transaction) -> None:
+        del self.transactions[transaction.key]
+        del self.sequence[transaction.key]
+        for user in Mempool.getUsers(transaction):
+            self.byUser[user].discard(transaction.key)
+            if len(self.byUser[user]) == 0:
+                del self.byUser[user]
+        if transaction.code == Transaction.LD or transaction.code == Transaction.LT:
+            landId = transaction.landId
+            self.byLand[landId].remove(transaction.key)
+            if len(self.byLand[landId]) == 0:
+                del self.byLand[landId]
+                del self.landOwners[landId]
+            else:
+                self.landOwners[landId] = Mempool.getNewOwner(self.transactions[self.byLand[landId][-1]])
+        elif transaction.code == Transaction.ST:
+            userId = transaction.userId
+            self.stakes[userId] -= transaction.amount
+            if self.stakes[userId] == 0:
+                del self.stakes[userId]
+
+    # Returns the first transactions of the pool in the order they were admitted
+    # With maxBytes, the transactions are taken while their encoded size fits in it (at least one transaction is taken)
+    def take(self, count: int, maxBytes: int | None = None) -> list[Transaction]:
+        if maxBytes is None:
+            return list(islice(self.transactions.values(), count))
+        transactions = []
+        size = 0
+        for transaction in islice(self.transactions.values(), count):
+            size += Transaction.getSize(transaction)
+            if size > maxBytes and len(transactions) > 0:
+                break
+            transactions.append(transaction)
+        return transactions
+
+    # Returns the number of seconds transactions have been waiting for a block (0 if the pool is empty)
+    def getWaitingTime(self) -> float:
+        return time.monotonic() - self.waitingSince if self.waitingSince is not None and len(self.transactions) > 0 else 0
+
+    # Evicts the transactions included in a block which was added to the blockchain
+    # The pending transactions referring to the same lands or users are validated again, in the order they were admitted
+    # Returns the transactions evicted because they are no longer valid, along with the reason
+    def removeBlock(self, block: Block, blockchain: Blockchain) -> list[tuple[Transaction, str]]:
+        lands = set()
+        users = set()
+        for transaction in block.data:
+            if transaction.key in self.transactions:
+                self.remove(transaction)
+            users.update(Mempool.getUsers(transaction))
+            if transaction.code == Transaction.LD or transaction.code == Transaction.LT:
+                lands.add(transaction.landId)
+
+        conflicts = set()
+        for landId in lands:
+            conflicts.update(self.byLand.get(landId, []))
+        for userId in users:
+            conflicts.update(self.byUser.get(userId, set()))
+        conflicting = sorted([self.transactions[transactionId] for transactionId in conflicts], key=lambda t: self.sequence[t.key])
+
+        for transaction in conflicting:
+            self.remove(transaction)
+        evicted = []
+        for transaction in conflicting:
+            reason = self.admit(transaction, blockchain)
+            if reason is not None:
+                Metrics.increment("transactions_evicted_total", reason)
+                evicted.append((transaction, reason))
+        self.waitingSince = time.monotonic() if len(self.transactions) > 0 else None
+        return evicted
+
+    @staticmethod
+    def getUsers(transaction: Transaction) -> set[str]:
+        return {transaction.userId, transaction.receiverId}
+
+    @staticmethod
+    def getNewOwner(transaction: Transaction) -> str:
+        if transaction.code == Transaction.LD:
+            return transaction.userId
+        return transaction.receiverId
+
+    # Transaction validation
+    # Receive Coins Transaction
+    #   Is assumed to be valid since it is initiated by the network
+    #
+    # Land Declaration Transaction
+    #   Is invalid if the land is already declared by someone else
+    #
+    # Land Transfer Transaction
+    #   Is invalid if the land is not registered
+    #   Is invalid if the seller is not the owner of the land
+    #   Is invalid if the buyer and seller is the same
+    #
+    # Stake Increase Transaction
+    #   Is invalid if the user's balance is less than the amount they are trying to stake
+    #   Is invalid if the amount specified is negative or 0
+    #
+    # landOwners and balances include the pending transactions, trueLandOwners only has the lands in the blockchain
+    # Returns the reason the transaction is invalid, or None if it is valid
+    @staticmethod
+    def check(transaction: Transaction, landOwners, balances, trueLandOwners) -> str | None:
+        if transaction.code == Transaction.RC:
+            pass
+        elif transaction.code == Transaction.LD:
+            if transaction.landId in landOwners:
+                return "land is already registered"
+        elif transaction.code == Transaction.LT:
+            if transaction.landId not in trueLandOwners:
+                return "land is not registered"
+            if not transaction.userId == trueLandOwners[transaction.landId] == landOwners[transaction.landId]:
+                return "seller does not own this land"
+            if transaction.userId == transaction.receiverId:
+                return "buyer and seller cannot be the same"
+        elif transaction.code == Transaction.ST:
+            nodeId = transaction.userId
+            if nodeId not in balances:
+                balance = 0
+            else:
+                balance = balances[nodeId]
+            if balance < transaction.amount:
+                return "user does not have sufficient balance"
+            elif transaction.amount <= 0:
+                return "stake needs to be a positive amount"
+        else:
+            return f"its type {transaction.code} is invalid"
+        return None
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return iter(self.transactions.values())
@@ -1,15 +1,32 @@
-import pickle
+import json
+import os
+import shutil
+import sys
 import time
-from copy import deepcopy
+import uuid
+from itertools import count, islice
+from typing import Callable, Iterable, Iterator
 from termcolor import colored
 from tabulate import tabulate
 
+from blockchain.analytics import Analytics
 from blockchain.block import Block
+from blockchain.block_store import BlockStore
 from blockchain.blockchain import Blockchain
-from blockchain.constants import BLOCK_TRANSACTION_THRESHOLD
+from blockchain.codec import Codec
+from blockchain.disk_store import DiskStore
+from blockchain.merkle_tree import MerkleTree
+from blockchain.state import State
+from blockchain.constants import INGEST_BLOCK_SIZE
 from blockchain.transaction import Transaction
-from utils.utils import Log, Command
+from utils.utils import Log, Command, Metrics
+from network.election import Election
+from network.ingest import Ingest
+from network.mempool import Mempool
 from network.node import Node
+from network.peers import Peers
+from network.sync import Sync
+from network.verifier import Verifier
 
 # All commands that the user can execute at the terminal
 class Commands:
@@ -23,16 +40,48 @@ class Commands:
     # Node independent
     TRANSACTION = Command("transaction", "transaction <transaction_id>", "Get details of a transaction on the blockchain")
     BLOCK = Command("block", "block <n>", "Get nth block in the blockchain (-1 for last block)")
-    HISTORY = Command("history", "history <land_id>", "Get history of land owners")
-    BLOCKCHAIN = Command("blockchain", "blockchain", "Get the blockchain")
-    LANDS = Command("lands", "lands", "Get all registered lands and their owners")
+    HISTORY = Command("history", "history <land_id> [<listing options>]", "Get history of land owners")
+    OWNER = Command("owner", "owner <land_id> [at <height>]", "Get the owner of a land, now or right after the block at a height")
+    BALANCES = Command("balances", "balances [at <height>]", "Get the balances of all nodes, now or right after the block at a height")
+    PROOF = Command("proof", "proof <transaction_id>", "Get the merkle proof that a transaction is included in its block")
+    BLOCKCHAIN = Command("blockchain", "blockchain [<listing options>]", "Get the blockchain")
+    LANDS = Command("lands", "lands [<listing options>]", "Get all registered lands and their owners")
+    OWNED = Command("owned", "owned <node_id> [<listing options>]", "Get the lands owned by a node")
     POOL = Command("pool", "pool", "Get the current transaction pool")
-    STAKES = Command("stakes", "stakes", "Get stakes of all nodes in the network")
+    STAKES = Command("stakes", "stakes [at <height>]", "Get stakes of all nodes in the network, now or right after the block at a height")
     NODES = Command("nodes", "nodes", "Get all registered nodes")
+    FORKS = Command("forks", "forks", "Get the competing branches kept by the blockchain and the block they fork from")
+    LISTING = Command(
+        "",
+        "[--from <n>] [--limit <n>] [--format table | plain | jsonl]",
+        "Listing options: start at the nth block or row and show at most <n>, as a table, tab separated lines or JSON lines"
+    )
+
+    VERIFY = Command("verify", "verify [<workers>]", "Verify the hashes, merkle roots and transactions of the whole blockchain")
+    LOAD = Command("load", "load <file> [<block_size>]", "Load register, buy, sell and stake operations in bulk from a CSV or JSON lines file (- for stdin)")
+    THROUGHPUT = Command("throughput", "throughput <count>", "Broadcast <count> land registrations and report the transactions per second")
+    ANALYTICS = Command(
+        "analytics",
+        "analytics transfers [<period>] [<limit>] | holders [<limit>] | stakes [<period>] | activity [<period>]",
+        "Count the transfers of every land, the lands of the top holders, the stakes or the transactions per hour, day, month or year"
+    )
+
+    POLICY = Command(
+        "policy",
+        "policy [threshold <n> | max <n> | bytes <n> | flush <seconds> | flush off | adaptive <seconds> | adaptive off]",
+        "Show or change the block policy: when a block is minted, its maximum size, and the interval of adaptive blocks"
+    )
+    LOG = Command("log", "log <level> [<type>]", "Set the level (debug, info, warning, error or off) of the events of a type, or of all events")
+    METRICS = Command(
+        "metrics",
+        "metrics [on [memory] | off | reset | dump <file> [<seconds>] | dump off]",
+        "Show the metrics, turn them on or off (memory also traces memory), or write them to a Prometheus text or JSON file (every <seconds>)"
+    )
 
     # Network
     CONNECT = Command("connect", "connect <node_id> <balance>", "Connect new node to the network")
-    SAVE = Command("save", "save [<filename>]", "Save the network into a file")
+    SYNC = Command("sync", "sync <node_id> [<peer_id>]", "Catch a node up with the blockchain and pool of a peer (the node with the longest blockchain by default)")
+    SAVE = Command("save", "save [<directory>]", "Save the network into a directory (only new blocks are written)")
     HELP = Command("help", "help", "List all commands")
     STOP = Command("stop", "stop", "Stop the network")
 
@@ -40,10 +89,131 @@ class Commands:
 class Network:
 
     DEFAULT_NETWORK_FILE = "blockchain.net"
+    MAX_REPORTED_ERRORS = 20
+    NETWORK_FILE = "network"
+    FILE_MAGIC = b"LPOS"
+    LISTING_FORMATS = ["table", "plain", "jsonl"]
 
     def __init__(self) -> None:
         self.nodes: dict[str, Node] = {}
-    
+        self.peers = Peers()
+        self.analytics: Analytics | None = None
+
+    # Saves the network into a directory
+    # Directory layout
+    #   network: Magic bytes, format version, the names of the block stores and for each node its ID, block store, chain length and transaction pool
+    #   store-<n>: A DiskStore holding the blocks of a block store (stores shared by nodes are saved once)
+    # Block stores that were loaded from or saved to the same directory before only write the blocks appended since then
+    # Other block stores are written to new directories, and the directories no longer used are removed once the network
+    # file is written, except those of stores which are still open (their blocks may be read by a fork of the store)
+    def save(self, directory: str) -> None:
+        directory = os.path.abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        stores: dict[int, str] = {}
+        for node in self.nodes.values():
+            store = node.blockchain.store
+            if store.disk is not None and os.path.dirname(store.disk.directory) == directory:
+                stores[id(store)] = os.path.basename(store.disk.directory)
+        for node in self.nodes.values():
+            store = node.blockchain.store
+            if id(store) not in stores:
+                name = next(
+                    f"store-{n}" for n in count()
+                    if f"store-{n}" not in stores.values() and not os.path.exists(os.path.join(directory, f"store-{n}"))
+                )
+                stores[id(store)] = name
+                store.persist(DiskStore(os.path.join(directory, name)))
+            else:
+                store.persist(store.disk)
+
+        names = list(dict.fromkeys(stores.values()))
+        data = [Network.FILE_MAGIC, Codec.encodeVersion(), Codec.encodeCount(len(names))]
+        data += [Codec.encodeString(name) for name in names]
+        data.append(Codec.encodeCount(len(self.nodes)))
+        for node in self.nodes.values():
+            data.append(Codec.encodeString(node.id))
+            data.append(Codec.encodeCount(names.index(stores[id(node.blockchain.store)])))
+            data.append(Codec.encodeCount(node.blockchain.getLength()))
+            data.append(Transaction.encodeMany(list(node.transactionPool)))
+
+        path = os.path.join(directory, Network.NETWORK_FILE)
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"".join(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        for name in os.listdir(directory):
+            if name.startswith("store-") and name not in names and not DiskStore.isOpen(os.path.join(directory, name)):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    # Loads a network saved with save()
+    # The state and indexes are loaded from the latest snapshot of each block store, blocks are read from disk when they are needed
+    @classmethod
+    def load(cls, directory: str) -> 'Network':
+        with open(os.path.join(directory, Network.NETWORK_FILE), "rb") as f:
+            view = memoryview(f.read())
+        if view[:len(Network.FILE_MAGIC)] != Network.FILE_MAGIC:
+            raise ValueError(f"{directory} is not a saved network")
+        offset = Codec.decodeVersion(view, len(Network.FILE_MAGIC))
+
+        stores = []
+        count, offset = Codec.decodeCount(view, offset)
+        for _ in range(count):
+            name, offset = Codec.decodeString(view, offset)
+            start = time.perf_counter()
+            store = BlockStore.fromDisk(DiskStore(os.path.join(directory, name)))
+            Log.info(
+                f"Loaded {name} with {store.getLength()} blocks in {time.perf_counter() - start:.3f}s "
+                f"(snapshot at length {store.snapshotLength}, replayed {store.getLength() - store.snapshotLength} blocks)",
+                "STARTUP"
+            )
+            stores.append(store)
+
+        network = cls()
+        nodes = []
+        count, offset = Codec.decodeCount(view, offset)
+        for _ in range(count):
+            nodeId, offset = Codec.decodeString(view, offset)
+            store, offset = Codec.decodeCount(view, offset)
+            length, offset = Codec.decodeCount(view, offset)
+            transactions, offset = Transaction.decodeMany(view, offset)
+            node = Node(nodeId, Blockchain(stores[store], length), Mempool())
+            for transaction in transactions:
+                node.transactionPool.add(transaction, node.blockchain)
+            nodes.append(node)
+        network.addNodes(nodes)
+
+        # Nodes saved behind the others (for example stopped before the latest blocks) catch up with the longest blockchain
+        if len(network.nodes) > 0:
+            peer = network.getLongestNode()
+            for node in list(network.nodes.values()):
+                if node.blockchain.getLength() < peer.blockchain.getLength():
+                    network.syncNode(node, peer)
+        return network
+
+    # Returns the node with the longest blockchain (the first one when several are as long), other than the excluded node
+    def getLongestNode(self, excludedId: str | None = None) -> Node | None:
+        nodes = [node for node in self.nodes.values() if node.id != excludedId]
+        return max(nodes, key=lambda node: node.blockchain.getLength()) if len(nodes) > 0 else None
+
+    # Catches a node up with the blockchain and pool of a peer (see Sync)
+    def syncNode(self, node: Node, peer: Node) -> None:
+        start = time.perf_counter()
+        length = node.blockchain.getLength()
+        commonLength, added, errors = Sync.sync(node, peer)
+        for error in errors[:Network.MAX_REPORTED_ERRORS]:
+            Log.error(error)
+        if len(errors) > 0:
+            Log.error(f"{node.id} could not sync with {peer.id}, its blockchain is unchanged")
+            return None
+        Log.info(
+            f"{node.id} synced with {peer.id} in {time.perf_counter() - start:.3f}s: common chain of {commonLength} blocks, "
+            f"dropped {length - commonLength} and added {added} blocks, {len(node.transactionPool)} pending transactions",
+            "SYNC"
+        )
+
     # Connects a new node to the network
     def connectNode(self, id: str, balance: int) -> None:
         Log.info(f"Node {id} is trying to join the network", "NEW NODE")
@@ -52,11 +222,11 @@ class Network:
             return None
 
         if len(self.nodes) == 0:
-            newNode = Node(id, Blockchain(), [])
+            newNode = Node(id, Blockchain(), Mempool())
         else:
             existingNode = list(self.nodes.values())[0]
-            newNode = Node(id, deepcopy(existingNode.blockchain), deepcopy(existingNode.transactionPool))
-        self.nodes[id] = newNode
+            newNode = Node(id, existingNode.blockchain.share(), existingNode.transactionPool.copy())
+        self.addNodes([newNode])
         transaction = newNode.registerCoins(balance)
         self.broadcastTransaction(transaction)
         Log.info(f"Node {id} has joined the network", "NEW NODE")
@@ -65,25 +235,54 @@ class Network:
     def start(self) -> None:
         Log.info("Starting the network")
         while True:
-            command = input("\n> ").split(" ")
+            # The end of the input (for example after streaming operations from stdin with load -) stops the network
+            Log.output()
+            Log.flush()
+            try:
+                command = input("> ").split(" ")
+            except EOFError:
+                command = [Commands.STOP.key]
             if command[0] == Commands.STOP.key:
                 Log.info("Stopping the network", end="")
                 for _ in range(3):
-                    print(".", end="", flush=True)
+                    Log.output(".", end="")
+                    Log.flush()
                     time.sleep(1)
                 break
             else:
+                self.flush()
                 self.handle(command)
-                print()
-        print()
+                Log.output()
+        if Log.isEnabled(Log.INFO, "INFO"):
+            Log.output()
         Log.info("Stopped the network")
+        Log.flush()
 
     # Run a specified command on the network
     def run(self, command: str) -> None:
-        print()
+        if Log.isEnabled(Log.INFO, "RUN"):
+            Log.output()
         Log.info(command, "RUN")
+        self.flush()
         self.handle(command.split(" "))
+        Log.flush()
     
+    # Returns the IDs of all nodes of the network in the order they joined
+    def getPeers(self) -> Peers:
+        return self.peers
+
+    # Adds nodes to the network, whose peers then get a new version (see Peers)
+    def addNodes(self, nodes: Iterable[Node]) -> None:
+        for node in nodes:
+            self.nodes[node.id] = node
+        self.peers = Peers(self.nodes)
+
+    # Removes a node from the network, whose peers then get a new version (see Peers)
+    def removeNode(self, nodeId: str) -> Node:
+        node = self.nodes.pop(nodeId)
+        self.peers = Peers(self.nodes)
+        return node
+
     # A helper function to check if a given node (or at least one node) exists on the network
     def nodeExists(self, nodeId: str | None = None) -> bool:
         if nodeId is None:
@@ -129,7 +328,7 @@ class Network:
                     node = list(self.nodes.values())[0]
                     transaction = node.blockchain.getTransaction(trId)
                     if transaction is not None:
-                        print(repr(transaction))
+                        Log.output(repr(transaction))
             case ["block", height]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
@@ -143,34 +342,151 @@ class Network:
                     else:
                         block = node.blockchain.getBlockFromHeight(height)
                     if block is not None:
-                        print(block)
-            case ["history", landId]:
+                        Log.output(block)
+            case ["proof", trId]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
-                    history = node.blockchain.getLandHistory(landId)
-                    if len(history) == 0:
+                    location = node.blockchain.getTransactionLocation(trId)
+                    if location is None:
+                        return
+                    block = node.blockchain.getBlockFromHeight(location[0])
+                    transaction = block.data[location[1]]
+                    proof = MerkleTree.getProof(block, trId)
+                    Log.info(f"Transaction {colored(trId, 'yellow')} is in block {block.id} with merkle root {block.merkleRoot}", "PROOF")
+                    Log.output(tabulate(
+                        [[level, "Left" if isLeft else "Right", sibling] for level, (sibling, isLeft) in enumerate(proof)],
+                        headers=[colored("Level", attrs=["bold"]), colored("Side", attrs=["bold"]), colored("Sibling hash", attrs=["bold"])],
+                        tablefmt="simple"
+                    ))
+                    if MerkleTree.verifyProof(block.merkleRoot, transaction, proof):
+                        Log.info(f"Proof is {colored('valid', 'green')} ({len(proof)} hashes)", "PROOF")
+                    else:
+                        Log.error("Proof does not match the merkle root of the block")
+            case ["history", landId, *options]:
+                if self.nodeExists():
+                    node = list(self.nodes.values())[0]
+                    listing = self.parseListing(options)
+                    if listing is None:
+                        return
+                    if node.blockchain.getLandOwner(landId) is None:
                         Log.error("Unknown Land ID")
                         return None
+                    start, limit, format = listing
+                    history = node.blockchain.iterLandHistory(landId, start, limit)
+                    if format != "table":
+                        self.outputRows(history, format, Transaction.toPlain, Transaction.toDict)
+                        return
                     Log.info(f"Transactions associated with land {landId}", "LAND HISTORY")
                     for transaction in history:
-                        print(repr(transaction))
-            case ["blockchain"]:
+                        Log.output(repr(transaction))
+            case ["verify"] | ["verify", _]:
+                if self.nodeExists():
+                    workers = None
+                    if len(command) == 2:
+                        try:
+                            workers = int(command[1])
+                        except:
+                            Log.error("Number of workers needs to be an integer")
+                            return
+                        if workers <= 0:
+                            Log.error("Number of workers needs to be positive")
+                            return
+                    node = list(self.nodes.values())[0]
+                    if Verifier(workers).verify(node.blockchain):
+                        Log.info(f"The blockchain is {colored('valid', 'green')}", "VERIFY")
+                    else:
+                        Log.error("The blockchain is invalid")
+            case ["load", path] | ["load", path, _]:
+                if self.nodeExists():
+                    blockSize = INGEST_BLOCK_SIZE
+                    if len(command) == 3:
+                        try:
+                            blockSize = int(command[2])
+                        except:
+                            Log.error("Block size needs to be an integer")
+                            return
+                        if blockSize <= 0:
+                            Log.error("Block size needs to be positive")
+                            return
+                    if path == "-":
+                        self.loadOperations(sys.stdin, blockSize)
+                        return
+                    try:
+                        with open(path, newline="") as file:
+                            self.loadOperations(file, blockSize)
+                    except OSError as error:
+                        Log.error(f"Cannot read {path}: {error.strerror}")
+            case ["throughput", count]:
+                if self.nodeExists():
+                    try:
+                        count = int(count)
+                    except:
+                        Log.error("Number of transactions needs to be an integer")
+                        return
+                    nodeIds = self.getPeers()
+                    transactions = [
+                        Transaction.newLDTransaction(nodeIds[i % len(nodeIds)], f"land-{uuid.uuid4().hex[:12]}") for i in range(count)
+                    ]
+                    start = time.perf_counter()
+                    self.broadcastTransactions(transactions)
+                    elapsed = time.perf_counter() - start
+                    Log.info(
+                        f"Broadcast {count} transactions to {len(nodeIds)} nodes in {elapsed:.3f}s: {count / elapsed:.0f} transactions/s",
+                        "THROUGHPUT"
+                    )
+            case ["blockchain", *options]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
-                    print(node.blockchain)
-            case ["lands"]:
+                    listing = self.parseListing(options)
+                    if listing is None:
+                        return
+                    start, limit, format = listing
+                    blocks = node.blockchain.iterBlocks(start, limit)
+                    if format != "table":
+                        self.outputRows(blocks, format, Block.toPlain, Block.toDict)
+                        return
+                    Log.output(colored(f"THE BLOCKCHAIN [{node.blockchain.getLength()}]", "green", attrs=["bold"]))
+                    for block in blocks:
+                        Log.output(block)
+            case ["lands", *options]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
-                    landOwners = node.blockchain.getLandOwners()
+                    listing = self.parseListing(options)
+                    if listing is None:
+                        return
+                    start, limit, format = listing
+                    landOwners = node.blockchain.iterLandOwners(start, limit)
+                    if format != "table":
+                        self.outputRows(landOwners, format, "\t".join, lambda row: {"land": row[0], "owner": row[1]})
+                        return
+                    landOwners = list(landOwners)
                     if len(landOwners) == 0:
                         Log.info("There are no lands registered in the network yet")
                     else:
                         Log.info(f"List of available lands and their owners", "LANDS")
-                        print(tabulate(
-                            [[land, owner] for land, owner in landOwners.items()],
+                        Log.output(tabulate(
+                            landOwners,
                             headers=[colored("Land", attrs=["bold"]), colored("Owner", attrs=["bold"])],
                             tablefmt="simple"
                         ))
+            case ["owned", nodeId, *options]:
+                if self.nodeExists(nodeId):
+                    node = list(self.nodes.values())[0]
+                    listing = self.parseListing(options)
+                    if listing is None:
+                        return
+                    start, limit, format = listing
+                    lands = islice(sorted(node.blockchain.getOwnedLands(nodeId)), start, None if limit is None else start + limit)
+                    if format != "table":
+                        self.outputRows(lands, format, str, lambda landId: {"land": landId, "owner": nodeId})
+                        return
+                    lands = list(lands)
+                    if len(lands) == 0:
+                        Log.info(f"{nodeId} does not own any land", "OWNED LANDS")
+                    else:
+                        Log.info(f"Lands owned by {nodeId}", "OWNED LANDS")
+                        for landId in lands:
+                            Log.output(f"- {landId}")
             case ["pool"]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
@@ -180,32 +496,84 @@ class Network:
                     else:
                         Log.info("Currently the transaction pool contains the following transactions", "TRANSACTION POOL")
                         for transaction in pool:
-                            print(repr(transaction))
-            case ["stakes"]:
+                            Log.output(repr(transaction))
+            case ["owner", landId] | ["owner", landId, "at", _]:
+                if self.nodeExists():
+                    node = list(self.nodes.values())[0]
+                    if len(command) == 2:
+                        owner = node.blockchain.getLandOwner(landId)
+                    else:
+                        height = self.parseHeight(command[3])
+                        if height is None or node.blockchain.getBlockFromHeight(height) is None:
+                            return
+                        owner = node.blockchain.getLandOwnerAt(landId, height)
+                    if owner is None:
+                        Log.error("Unknown Land ID")
+                    else:
+                        Log.output(f"{landId} is owned by {colored(owner, 'yellow')}")
+            case ["balances"] | ["balances", "at", _]:
                 if self.nodeExists():
                     node = list(self.nodes.values())[0]
+                    state = self.parseState(node.blockchain, command)
+                    if state is None:
+                        return
+                    balances = node.blockchain.getAllBalances(state)
+                    Log.info(f"Balances {self.describeHeight(command)}", "BALANCES")
+                    if len(balances) == 0:
+                        Log.info("No node has received coins yet")
+                        return
+                    Log.output(tabulate(
+                        [[nodeId, balance] for nodeId, balance in balances.items()],
+                        headers=[colored("Node", attrs=["bold"]), colored("Balance", attrs=["bold"])],
+                        tablefmt="simple"
+                    ))
+            case ["stakes"] | ["stakes", "at", _]:
+                if self.nodeExists():
+                    node = list(self.nodes.values())[0]
+                    state = self.parseState(node.blockchain, command)
+                    if state is None:
+                        return
 
-                    stakes = node.blockchain.getStakes(self.nodes)
-                    ages = node.blockchain.getAges(self.nodes)
+                    stakes = node.blockchain.getStakes(self.getPeers(), state)
+                    ages = node.blockchain.getAges(self.getPeers(), state)
                     
                     data = [[nodeId, stakes[nodeId], ages[nodeId], stakes[nodeId] * ages[nodeId]] for nodeId in stakes]
-                    Log.info("Current stakes in the blockchain", "STAKES")
+                    Log.info(f"Stakes in the blockchain {self.describeHeight(command)}", "STAKES")
                     if len(data) == 0:
                         Log.info("No one has staked in the network yet")
                     else:
-                        print(tabulate(
+                        Log.output(tabulate(
                             data, headers=[
                                 colored("Node", attrs=["bold"]),
                                 colored("Stake", attrs=["bold"]),
                                 colored("Age", attrs=["bold"]),
                                 colored("Coinage", attrs=["bold"])
                             ] , tablefmt="simple"))
+            case ["forks"]:
+                if self.nodeExists():
+                    blockchain = list(self.nodes.values())[0].blockchain
+                    tips = sorted(blockchain.tree.getTips(), key=lambda block: block.id)
+                    if len(tips) == 0:
+                        Log.info("There is no competing branch", "FORKS")
+                        return
+                    rows = []
+                    for tip in tips:
+                        branch = blockchain.tree.getBranch(tip.hash)
+                        rows.append([tip.id, tip.hash, tip.validator, branch[0].id - 1, len(branch)])
+                    Log.info(f"Competing branches of the blockchain of length {blockchain.getLength()}", "FORKS")
+                    Log.output(tabulate(rows, headers=[
+                        colored("Tip", attrs=["bold"]),
+                        colored("Hash", attrs=["bold"]),
+                        colored("Validator", attrs=["bold"]),
+                        colored("Forks from", attrs=["bold"]),
+                        colored("Blocks", attrs=["bold"])
+                    ], tablefmt="simple"))
             case ["nodes"]:
-                if len(self.nodes) <= 0:
+                if len(self.getPeers()) <= 0:
                     Log.info("No node is registered to the network")
                 else:
-                    for nodeId in self.nodes.keys():
-                        print(f"- {nodeId}")
+                    for nodeId in self.getPeers():
+                        Log.output(f"- {nodeId}")
             case ["connect", nodeId, balance]:
                 try:
                     balance = int(balance)
@@ -215,28 +583,244 @@ class Network:
                     self.connectNode(nodeId, balance)
                 except:
                     Log.error("Balance needs to be an integer")
+            case ["sync", nodeId] | ["sync", nodeId, _]:
+                if self.nodeExists(nodeId):
+                    if len(command) == 3:
+                        peerId = command[2]
+                        if not self.nodeExists(peerId):
+                            return
+                    else:
+                        peer = self.getLongestNode(nodeId)
+                        if peer is None:
+                            Log.error("There is no other node to sync with")
+                            return
+                        peerId = peer.id
+                    if peerId == nodeId:
+                        Log.error("A node cannot sync with itself")
+                        return
+                    self.syncNode(self.nodes[nodeId], self.nodes[peerId])
             case ["save"]:
-                with open(Network.DEFAULT_NETWORK_FILE, "wb") as f:
-                    pickle.dump(self, f)
-                Log.info(f"Successfully saved network to file {Network.DEFAULT_NETWORK_FILE}")
-            case ["save", filename]:
-                with open(filename, "wb") as f:
-                    pickle.dump(self, f)
-                Log.info(f"Successfully saved network to file {filename}")
+                self.save(Network.DEFAULT_NETWORK_FILE)
+                Log.info(f"Successfully saved network to {Network.DEFAULT_NETWORK_FILE}")
+            case ["save", directory]:
+                self.save(directory)
+                Log.info(f"Successfully saved network to {directory}")
+            case ["log", level] | ["log", level, _]:
+                try:
+                    Log.setLevel(level, command[2] if len(command) == 3 else None)
+                except ValueError as error:
+                    Log.error(str(error))
+            case ["policy", *arguments]:
+                self.handlePolicy(arguments)
+            case ["metrics", *arguments]:
+                self.handleMetrics(arguments)
+            case ["analytics", *arguments]:
+                if self.nodeExists():
+                    self.handleAnalytics(arguments)
             case ["help"]:
                 self.printCommands()
             case ["stop"]:
                 return
             case _:
-                print(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
+                Log.output(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
     
+    # Handles the metrics command (see Metrics)
+    def handleMetrics(self, arguments: list[str]) -> None:
+        Metrics.collector = self.collectMetrics
+        match arguments:
+            case []:
+                if not Metrics.enabled:
+                    Log.info(f"Metrics are off (use {colored('metrics on', attrs=['bold'])} to record them)", "METRICS")
+                rows = Metrics.getRows()
+                if len(rows) > 0:
+                    Log.output(tabulate(rows, headers=[
+                        colored("Metric", attrs=["bold"]),
+                        colored("Label", attrs=["bold"]),
+                        colored("Value", attrs=["bold"])
+                    ], tablefmt="simple"))
+            case ["on"] | ["on", "memory"]:
+                Metrics.setEnabled(True, len(arguments) == 2)
+                Log.info("Metrics are on" + (" (tracing memory)" if len(arguments) == 2 else ""), "METRICS")
+            case ["off"]:
+                Metrics.setEnabled(False)
+                Log.info("Metrics are off", "METRICS")
+            case ["reset"]:
+                Metrics.reset()
+                Log.info("Metrics were reset", "METRICS")
+            case ["dump", "off"]:
+                Metrics.stopDumping()
+                Log.info("Stopped writing the metrics", "METRICS")
+            case ["dump", path]:
+                Log.info(f"Metrics written to {Metrics.dump(path)}", "METRICS")
+            case ["dump", path, interval]:
+                try:
+                    interval = float(interval)
+                    if interval <= 0:
+                        raise ValueError()
+                except ValueError:
+                    Log.error("Interval needs to be a positive number of seconds")
+                    return
+                Metrics.startDumping(path, interval)
+                Log.info(f"Writing the metrics to {path} every {interval:g}s", "METRICS")
+            case _:
+                Log.output(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
+
+    # Parses the options of the commands which list blocks or rows (blockchain, history and lands)
+    # Returns the first block or row, the maximum number of them (None for all) and the format, or None if an option is invalid
+    def parseListing(self, options: list[str]) -> tuple[int, int | None, str] | None:
+        values = {"--from": "0", "--limit": None, "--format": "table"}
+        if len(options) % 2 != 0 or any(name not in values for name in options[::2]):
+            Log.output(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
+            return None
+        values.update(zip(options[::2], options[1::2]))
+        if not values["--from"].isdigit():
+            Log.error("--from needs to be a non-negative integer")
+            return None
+        if values["--limit"] is not None and (not values["--limit"].isdigit() or int(values["--limit"]) == 0):
+            Log.error("--limit needs to be a positive integer")
+            return None
+        if values["--format"] not in Network.LISTING_FORMATS:
+            Log.error(f"--format needs to be one of {', '.join(Network.LISTING_FORMATS)}")
+            return None
+        return int(values["--from"]), None if values["--limit"] is None else int(values["--limit"]), values["--format"]
+
+    # Writes the rows of a listing one at a time as tab separated lines (plain) or JSON lines (jsonl), without colors
+    # The first row is written at once, the next ones as the output buffer fills up
+    def outputRows(self, rows: Iterable, format: str, toPlain: Callable[[object], str], toDict: Callable[[object], dict]) -> None:
+        for count, row in enumerate(rows):
+            Log.output(toPlain(row) if format == "plain" else json.dumps(toDict(row)))
+            if count == 0:
+                Log.flush(wait=False)
+
+    # Shows the block policy or changes one of its settings (see BlockPolicy)
+    def handlePolicy(self, arguments: list[str]) -> None:
+        policy = Node.policy
+        match arguments:
+            case []:
+                Log.output(tabulate(policy.getSettings(), headers=[
+                    colored("Setting", attrs=["bold"]),
+                    colored("Value", attrs=["bold"])
+                ], tablefmt="simple"))
+                return
+            case ["flush" | "adaptive", "off"]:
+                value = None
+            case ["threshold" | "max" | "bytes", value]:
+                if not value.isdigit() or int(value) <= 0:
+                    Log.error(f"The {arguments[0]} needs to be a positive integer")
+                    return
+                value = int(value)
+            case ["flush" | "adaptive", value]:
+                try:
+                    value = float(value)
+                    if value <= 0:
+                        raise ValueError()
+                except ValueError:
+                    Log.error("Interval needs to be a positive number of seconds")
+                    return
+            case _:
+                Log.output(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
+                return
+
+        match arguments[0]:
+            case "threshold":
+                policy.threshold = value
+                policy.adaptiveThreshold = float(value)
+            case "max":
+                policy.maxTransactions = value
+            case "bytes":
+                policy.maxBytes = value
+            case "flush":
+                policy.flushInterval = value
+            case "adaptive":
+                policy.targetInterval = value
+                policy.adaptiveThreshold = float(policy.threshold)
+        Log.info(f"Block policy {arguments[0]} set to {arguments[1]}", "POLICY")
+
+    # Runs an analytics query on the blockchain of the first node (see Analytics)
+    # The archive of the analytics is kept between queries so that only the new blocks are added to it
+    def handleAnalytics(self, arguments: list[str]) -> None:
+        blockchain = list(self.nodes.values())[0].blockchain
+        match arguments:
+            case ["transfers"] | ["transfers", _] | ["transfers", _, _]:
+                period = arguments[1] if len(arguments) > 1 else "month"
+                limit = self.parseLimit(arguments[2]) if len(arguments) > 2 else None
+                if len(arguments) > 2 and limit is None:
+                    return
+                query = lambda analytics: analytics.getTransfersPerLand(blockchain, period, limit)
+                headers = ["Land", period.capitalize(), "Transfers"]
+            case ["holders"] | ["holders", _]:
+                limit = self.parseLimit(arguments[1]) if len(arguments) > 1 else 10
+                if limit is None:
+                    return
+                query = lambda analytics: analytics.getTopHolders(blockchain, limit)
+                headers = ["Owner", "Lands"]
+            case ["stakes"] | ["stakes", _]:
+                period = arguments[1] if len(arguments) > 1 else "month"
+                query = lambda analytics: [
+                    (time, userId, stake, f"{share:.1%}")
+                    for time, userId, stake, share in analytics.getStakeDistribution(blockchain, period)
+                ]
+                headers = [period.capitalize(), "Node", "Stake", "Share"]
+            case ["activity"] | ["activity", _]:
+                period = arguments[1] if len(arguments) > 1 else "day"
+                query = lambda analytics: analytics.getActivity(blockchain, period)
+                headers = [period.capitalize(), "Type", "Transactions"]
+            case _:
+                Log.output(f"Invalid command (use {colored(Commands.HELP.key, attrs=['bold'])} to list all commands)")
+                return
+
+        try:
+            if self.analytics is None:
+                self.analytics = Analytics()
+            rows = query(self.analytics)
+        except (ValueError, RuntimeError) as error:
+            Log.error(str(error))
+            return
+        if len(rows) == 0:
+            Log.info("There are no matching transactions in the blockchain", "ANALYTICS")
+        else:
+            Log.output(tabulate(rows, headers=[colored(header, attrs=["bold"]) for header in headers], tablefmt="simple"))
+
+    # Parses the limit of an analytics query, logging an error if it is not a positive integer
+    def parseLimit(self, limit: str) -> int | None:
+        if not limit.isdigit() or int(limit) == 0:
+            Log.error("Limit needs to be a positive integer")
+            return None
+        return int(limit)
+
+    # Parses the height of a historical query, logging an error if it is not an integer
+    def parseHeight(self, height: str) -> int | None:
+        try:
+            return int(height)
+        except ValueError:
+            Log.error("Block height needs to be an integer")
+            return None
+
+    # Returns the state a command ending with an optional "at <height>" refers to, or None if the height is invalid
+    def parseState(self, blockchain: Blockchain, command: list[str]) -> State | None:
+        if command[-2:-1] != ["at"]:
+            return blockchain.state
+        height = self.parseHeight(command[-1])
+        return None if height is None else blockchain.getStateAt(height)
+
+    def describeHeight(self, command: list[str]) -> str:
+        return f"right after block {command[-1]}" if command[-2:-1] == ["at"] else "currently"
+
+    # Returns the gauges of the network: the pool depth and chain length of every node
+    def collectMetrics(self) -> list[tuple[str, str, float]]:
+        gauges = []
+        for nodeId, node in list(self.nodes.items()):
+            gauges.append(("pool_depth", nodeId, len(node.transactionPool)))
+            gauges.append(("chain_length", nodeId, node.blockchain.getLength()))
+        return gauges
+
     # Displays all available commands
     def printCommands(self) -> None:
         commands = []
         for _, command in vars(Commands).items():
             if type(command) == Command:
                 commands.append([command.key, command.syntax, command.help])
-        print(tabulate(commands, headers=[
+        Log.output(tabulate(commands, headers=[
             colored("Command", attrs=['bold']),
             colored("Syntax", attrs=['bold']),
             colored("Description", attrs=['bold'])
@@ -244,22 +828,105 @@ class Network:
     
     # Broadcast new transaction to all nodes so that they can add it to their transaction pools
     def broadcastTransaction(self, transaction: Transaction) -> None:
-        Log.info(f"Broadcasting transaction {colored(transaction.id, 'yellow')} to all nodes")
+        Log.info(lambda: f"Broadcasting transaction {colored(transaction.id, 'yellow')} to all nodes", "BROADCAST")
+        start = Metrics.start()
         validator = None
         for node in self.nodes.values():
-            isMinting = node.addTransaction(transaction, list(self.nodes.keys()))
+            isMinting = node.addTransaction(transaction, self.getPeers())
             if isMinting:
                 validator = node
         if validator is not None:
-            print()
-            Log.info(f"Block Transaction Threshold of {BLOCK_TRANSACTION_THRESHOLD} reached. Proceeding to mint new block")
-            Log.info(f"{colored(validator.id, attrs=['bold'])} is chosen as the validator", "MINTING")
+            self.mintBlocks(validator)
+        Metrics.increment("transactions_broadcast_total")
+        Metrics.stop("broadcast_seconds", start)
+    
+    # Loads the operations of a CSV or JSON lines file (see Ingest) and reports the number of transactions per second
+    def loadOperations(self, lines: Iterable[str], blockSize: int) -> None:
+        invalid = []
+        count = 0
+
+        def readTransactions() -> Iterator[Transaction]:
+            nonlocal count
+            for number, transaction in Ingest.readTransactions(lines, set(self.getPeers())):
+                if isinstance(transaction, str):
+                    invalid.append(f"Line {number} is {transaction}")
+                else:
+                    count += 1
+                    yield transaction
+
+        start = time.perf_counter()
+        blocks, rejected = self.ingest(readTransactions(), blockSize)
+        elapsed = time.perf_counter() - start
+
+        for error in invalid[:Network.MAX_REPORTED_ERRORS]:
+            Log.error(error)
+        if len(invalid) > Network.MAX_REPORTED_ERRORS:
+            Log.error(f"... and {len(invalid) - Network.MAX_REPORTED_ERRORS} more invalid lines")
+        for reason, rejectedCount in rejected.items():
+            Log.info(f"{rejectedCount} transactions were rejected as {reason}", "LOAD")
+        Log.info(
+            f"Ingested {count} transactions ({sum(rejected.values())} rejected, {len(invalid)} invalid lines) into {blocks} blocks in {elapsed:.3f}s: "
+            f"{count / elapsed if elapsed > 0 else 0:.0f} transactions/s",
+            "LOAD"
+        )
+
+    # Adds transactions to the network in bulk
+    # The transactions are added to the pools of all nodes in batches of blockSize, without logging every transaction, then the
+    # validator elected for the tip mints blocks of at most blockSize transactions, which are added to all blockchains
+    # The pools are emptied into blocks at the end
+    # Returns the number of blocks minted and the number of transactions rejected by the pools by reason
+    def ingest(self, transactions: Iterable[Transaction], blockSize: int = INGEST_BLOCK_SIZE) -> tuple[int, dict[str, int]]:
+        peers = self.getPeers()
+        firstNode = list(self.nodes.values())[0]
+        blocks = 0
+        rejected: dict[str, int] = {}
+        transactions = iter(transactions)
+        while True:
+            batch = list(islice(transactions, blockSize))
+            for node in self.nodes.values():
+                for transaction in batch:
+                    reason = node.transactionPool.add(transaction, node.blockchain)
+                    if reason is not None and node is firstNode:
+                        rejected[reason] = rejected.get(reason, 0) + 1
+
+            while len(firstNode.transactionPool) >= (blockSize if len(batch) > 0 else 1):
+                validator = self.nodes[Election.getValidator(firstNode.blockchain, peers)]
+                block = validator.mint(blockSize, verbose=False)
+                if block is None:
+                    break
+                for node in self.nodes.values():
+                    node.addBlock(block)
+                blocks += 1
+            if len(batch) == 0:
+                return blocks, rejected
+
+    # Mints blocks until the pools are no longer ready for a block (see BlockPolicy)
+    # Every block is minted by the validator elected for the tip it extends, starting with the given validator
+    def mintBlocks(self, validator: Node | None) -> None:
+        peers = self.getPeers()
+        while validator is not None:
+            Node.logValidator(validator.id)
             block = validator.mint()
+            if block is None:
+                return
             self.broadcastBlock(block)
-    
+            validator = next((node for node in self.nodes.values() if node.isValidator(peers)), None)
+
+    # Mints the pending transactions which waited longer than the flush interval of the block policy
+    # Called before every command, since blocks are otherwise only minted when transactions or blocks arrive
+    def flush(self) -> None:
+        if len(self.nodes) > 0 and Node.policy.isReady(list(self.nodes.values())[0].transactionPool):
+            peers = self.getPeers()
+            self.mintBlocks(next((node for node in self.nodes.values() if node.isValidator(peers)), None))
+
+    # Broadcast transactions to all nodes one after the other
+    def broadcastTransactions(self, transactions: list[Transaction]) -> None:
+        for transaction in transactions:
+            self.broadcastTransaction(transaction)
+
     # Broadcasts the new minted block to all nodes so that they can add it to their blockchains
     def broadcastBlock(self, block: Block | None) -> None:
         if block is not None:
-            Log.info(f"Broadcasting minted block {block.id} to all nodes")
+            Log.info(f"Broadcasting minted block {block.id} to all nodes", "BROADCAST")
         for node in self.nodes.values():
             node.addBlock(block)
@@ -1,16 +1,21 @@
-import random
+from typing import Sequence
+
 from termcolor import colored
 
 from blockchain.block import Block
 from blockchain.blockchain import Blockchain
 from blockchain.transaction import Transaction
-from blockchain.constants import BLOCK_TRANSACTION_THRESHOLD
-from utils.utils import Log
+from network.block_policy import BlockPolicy
+from network.election import Election
+from network.mempool import Mempool
+from utils.utils import Log, Metrics
 
 # Node represents a single user on the blockchain network
+# All nodes mint blocks following the same block policy (see BlockPolicy)
 class Node:
+    policy = BlockPolicy()
 
-    def __init__(self, id: str, blockchain: Blockchain, transactionPool: list[Transaction]) -> None:
+    def __init__(self, id: str, blockchain: Blockchain, transactionPool: Mempool) -> None:
         self.id = id
         self.blockchain = blockchain
         self.transactionPool = transactionPool
@@ -45,15 +50,36 @@ class Node:
         Log.info(f"{self.id} stakes {amount} coins", "INITIATE TRANSACTION", self.id)
         return transaction
     
-    # Adds a transaction to the transaction pool
-    def addTransaction(self, transaction: Transaction, peers: list[str]) -> bool:
-        self.transactionPool.append(transaction)
-        Log.info(f"Added {colored(transaction.id, 'yellow')} to pool", nodeId=self.id)
-        if len(self.transactionPool) >= BLOCK_TRANSACTION_THRESHOLD:
-            validator = self.getValidator(peers)
-            if validator == self.id:
-                return True
-        return False
+    # Validates a transaction (see Mempool.check) and adds it to the transaction pool
+    # The reason a transaction is rejected is counted in rejected when it is given
+    def addTransaction(self, transaction: Transaction, peers: Sequence[str], rejected: dict[str, int] | None = None) -> bool:
+        reason = self.transactionPool.add(transaction, self.blockchain)
+        if reason is not None:
+            self.logInvalid(transaction, reason)
+            if rejected is not None:
+                rejected[reason] = rejected.get(reason, 0) + 1
+            return False
+        Log.info(lambda: f"Added {colored(transaction.id, 'yellow')} to pool", "POOL", self.id)
+        return self.isValidator(peers)
+
+    # Returns whether the transaction pool is ready for a block (see BlockPolicy) and the node is chosen as the validator of the next block
+    def isValidator(self, peers: Sequence[str]) -> bool:
+        return Node.policy.isReady(self.transactionPool) and self.getValidator(peers) == self.id
+
+    def logInvalid(self, transaction: Transaction, reason: str) -> None:
+        Log.info(
+            lambda: f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as {reason}",
+            "VALIDATION",
+            self.id
+        )
+
+    # Logs that the pool is full and a validator is chosen to mint the next block
+    @staticmethod
+    def logValidator(validatorId: str) -> None:
+        if Log.isEnabled(Log.INFO, "MINTING"):
+            Log.output()
+        Log.info(f"Block Transaction Threshold of {Node.policy.getThreshold()} reached. Proceeding to mint new block", "MINTING")
+        Log.info(lambda: f"{colored(validatorId, attrs=['bold'])} is chosen as the validator", "MINTING")
 
     # PROOF OF STAKE CONSENSUS
     # A validator is selected from the set of nodes in the network. This is done by using the coinage of the nodes.
@@ -61,134 +87,46 @@ class Node:
     # Age - The number of blocks since the last block minted by a node
     # Coinage - The product of stake and age
     # A node is randomly chosen as a validator (Weighted by their coinages)
-    def getValidator(self, peers: list[str]) -> str:
-        stakes = self.blockchain.getStakes(peers)
-        ages = self.blockchain.getAges(peers)
-        coinages = [stakes[peer] * ages[peer] + 1 for peer in peers]
-        if sum(coinages) == 0:
-            coinages = [1] * len(coinages)
-        
-        random.seed(Block.hashBlock(self.blockchain.getLastBlock()))
-        validators = random.choices(
-            peers,
-            coinages,
-            k = 1
-        )
-        return validators[0]
+    # The election is computed once per chain tip and set of peers (see Election)
+    def getValidator(self, peers: Sequence[str]) -> str:
+        return Election.getValidator(self.blockchain, peers)
     
     # Minting
-    # The validator chosen validates all transactions and mints a block
-    def mint(self) -> Block | None:
-        blockData: list[Transaction] = []
-        landOwners = self.blockchain.getLandOwners()
-        balances = self.blockchain.getAllBalances()
-        Log.info("Validating transactions", "MINTING", self.id)
-        for transaction in self.transactionPool:
-            isValid = self.validate(transaction, landOwners, balances)
-            if isValid:
-                blockData.append(transaction)
-                if transaction.type == Transaction.RC_TRANSACTION:
-                    # balances[transaction.input["user_id"]] = transaction.input["amount"]
-                    pass
-                elif transaction.type == Transaction.LD_TRANSACTION:
-                    landOwners[transaction.input["land_id"]] = transaction.input["user_id"]
-                elif transaction.type == Transaction.LT_TRANSACTION:
-                    landOwners[transaction.input["land_id"]] = transaction.output["user_id"]
-                    pass
-                elif transaction.type == Transaction.ST_TRANSACTION:
-                    balances[transaction.input["user_id"]] -= transaction.input["amount"]
-        
+    # The validator chosen puts the transactions of its pool, which were validated when they were admitted, into a block
+    # At most maxSize transactions (the maximum of the block policy by default) and the maximum size of the block policy are
+    # put into the block, and the block is only printed when verbose is set
+    def mint(self, maxSize: int | None = None, verbose: bool = True) -> Block | None:
+        start = Metrics.start()
+        blockData = self.transactionPool.take(Node.policy.maxTransactions if maxSize is None else maxSize, Node.policy.maxBytes)
         if len(blockData) == 0:
-            Log.info("All transactions are invalid. No new block is minted", "MINTING", self.id)
+            Log.info("The transaction pool is empty. No new block is minted", "MINTING", self.id)
             return None
         
+        Node.policy.recordBlock(len(self.transactionPool), self.blockchain.getLastBlock())
         block = Block.createBlock(self.blockchain.getLength(), self.blockchain.getLastBlock(), self.id, blockData)
-        Log.info("Minted new block", "MINTING", self.id)
-        print(block)
+        Metrics.increment("blocks_minted_total", self.id)
+        Metrics.stop("mint_seconds", start)
+        if verbose:
+            Log.info("Minted new block", "MINTING", self.id)
+            if Log.isEnabled(Log.INFO, "MINTING"):
+                Log.output(block)
         return block
 
-    # Transaction validation
-    # Receive Coins Transaction
-    #   Is assumed to be valid since it is initiated by the network
-    #
-    # Land Declaration Transaction
-    #   Is invalid if the land is already declared by someone else
-    #
-    # Land Transfer Transaction
-    #   Is invalid if the land is not registered
-    #   Is invalid if the seller is not the owner of the land
-    #   Is invalid if the buyer and seller is the same
-    #
-    # Stake Increase Transaction
-    #   Is invalid if the user's balance is less than the amount they are trying to stake 
-    #   Is invalid if the amount specified is negative or 0
-    def validate(self, transaction: Transaction, landOwners: dict[str, str], balances: dict[str, int]) -> bool:
-        if transaction.type == Transaction.RC_TRANSACTION:
-            pass
-        elif transaction.type == Transaction.LD_TRANSACTION:
-            if transaction.input["land_id"] in landOwners:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as land is already registered",
-                    "MINTING",
-                    self.id
-                )
-                return False
-        elif transaction.type == Transaction.LT_TRANSACTION:
-            trueLandOwners = self.blockchain.getLandOwners()
-            if transaction.input["land_id"] not in trueLandOwners:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as land is not registered",
-                    "MINTING",
-                    self.id
-                )
-                return False
-            if not transaction.input["user_id"] == trueLandOwners[transaction.input["land_id"]] == landOwners[transaction.input["land_id"]]:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as seller does not own this land",
-                    "MINTING",
-                    self.id
-                )
-                return False
-            if transaction.input["user_id"] == transaction.output["user_id"]:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as buyer and seller cannot be the same",
-                    "MINTING",
-                    self.id
-                )
-                return False
-        elif transaction.type == Transaction.ST_TRANSACTION:
-            nodeId = transaction.input["user_id"]
-            if nodeId not in balances:
-                balance = 0
-            else:
-                balance = balances[nodeId]
-            if balance < transaction.input["amount"]:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as user does not have sufficient balance",
-                    "MINTING",
-                    self.id
-                )
-                return False
-            elif transaction.input["amount"] <= 0:
-                Log.info(
-                    f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('invalid', 'red', attrs=['bold'])} as stake needs to be a positive amount",
-                    "MINTING",
-                    self.id
-                )
-                return False
-        else:
-            Log.error(f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is of invalid type {transaction.type}")
-            return False
-        
-        Log.info(f"Transaction {colored(transaction.id, 'yellow')}: {str(transaction)} is {colored('valid', 'green')}", "MINTING", self.id)
-        return True
-    
-    # Adds a block to the transaction and empties the transaction pool
+    # Adds a block to the blockchain and evicts the transactions it includes (or invalidates) from the transaction pool
+    # When the block makes the blockchain switch to another branch, the pool is rebuilt from the transactions of the
+    # dropped blocks and the pending transactions, against the new tip
     def addBlock(self, block: Block | None) -> None:
-        self.transactionPool = []
-
         if block is None:
             return
         
-        self.blockchain.addBlock(block)
-        Log.info(f"Added block {self.id} to blockchain", nodeId = self.id)
+        previousTip = self.blockchain.getLastBlock()
+        if self.blockchain.addBlock(block) is None:
+            return
+        if block.previousBlockHash != previousTip.hash:
+            dropped = [transaction for droppedBlock in self.blockchain.getDroppedBlocks(previousTip) for transaction in droppedBlock.data]
+            self.transactionPool = Mempool.fromTransactions(dropped + list(self.transactionPool), self.blockchain)
+            Log.info(lambda: f"Switched to the branch of block {block.id}, {len(self.transactionPool)} pending transactions", "BLOCK", self.id)
+            return
+        Log.info(lambda: f"Added block {block.id} to blockchain", "BLOCK", self.id)
+        for transaction, reason in self.transactionPool.removeBlock(block, self.blockchain):
+            self.logInvalid(transaction, reason)
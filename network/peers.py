@@ -0,0 +1,22 @@
+from itertools import count
+from typing import Iterable
+
+# The Peers class is the list of the IDs of the nodes of a network, in the order they joined
+#
+# The list is immutable: a node joining or leaving gives a new list (see Network.addNode), which takes the next version
+# number. Two lists with the same version therefore hold the same peers, which lets the elections be cached by version
+# instead of hashing every ID (see Election)
+class Peers(tuple):
+    versions = count()
+
+    def __new__(cls, ids: Iterable[str] = ()) -> 'Peers':
+        peers = super().__new__(cls, ids)
+        peers.version = next(Peers.versions)
+        peers.positions = None
+        return peers
+
+    # Returns the position of every peer in the list, computed once per list
+    def getPositions(self) -> dict[str, int]:
+        if self.positions is None:
+            self.positions = {peer: position for position, peer in enumerate(self)}
+        return self.positions
@@ -0,0 +1,107 @@
+import socket
+import struct
+
+from blockchain.block import Block
+from blockchain.codec import Codec
+from blockchain.transaction import Transaction
+
+# The Protocol class holds the messages exchanged between the controller of a Cluster and its worker processes
+#
+# Every message is a frame made of the length of the body (4 bytes), the message type (1 byte) and the body
+# Bodies are encoded with the binary format of blocks and transactions (see Codec)
+#   HELLO: Sent by a worker once connected. Its index followed by the IDs of all nodes it loaded, in order
+#   PEERS: The IDs of all nodes of the cluster, in the order they joined
+#   COMMAND: A command to run on the nodes of the worker (see Network.handle), as UTF-8 text
+#   JOIN: ID and balance of a new node, followed by a flag and, if it is set, the blocks and pool to start from
+#   SYNC: Height of the first block requested
+#   TRANSACTIONS: Transactions to add to the pools of all nodes of the worker
+#   BLOCK: A block to add to the blockchains of all nodes of the worker
+#   NODES: Requests the nodes hosted by the worker, the REPLY holds the ID, chain length and pool of each of them
+#   SAVE: Directory, followed by the ID, chain length and pool of every node hosted by the other workers (as in NODES)
+#   STOP: Stops the worker, it is not replied to
+#   REPLY: Sent by a worker for every other message. Blocks (minted or requested), transactions (created or pending)
+#          and the output printed while handling the message. The reply to TRANSACTIONS starts with the number of
+#          transactions rejected by the pool of the first node of the cluster, as (reason, count) pairs
+#   ERROR: Sent by a worker instead of REPLY when handling the message failed, with the error as UTF-8 text
+class Protocol:
+    HELLO = 1
+    PEERS = 2
+    COMMAND = 3
+    JOIN = 4
+    SYNC = 5
+    TRANSACTIONS = 6
+    BLOCK = 7
+    NODES = 8
+    SAVE = 9
+    STOP = 10
+    REPLY = 11
+    ERROR = 12
+
+    HEADER_FORMAT = struct.Struct(">IB")
+
+    @staticmethod
+    def send(connection: socket.socket, type: int, body: bytes = b"") -> None:
+        connection.sendall(Protocol.HEADER_FORMAT.pack(len(body), type) + body)
+
+    # Returns the type and body of the next message, or None if the connection was closed
+    @staticmethod
+    def receive(connection: socket.socket) -> tuple[int, memoryview] | None:
+        header = Protocol.receiveExactly(connection, Protocol.HEADER_FORMAT.size)
+        if header is None:
+            return None
+        length, type = Protocol.HEADER_FORMAT.unpack(header)
+        body = Protocol.receiveExactly(connection, length)
+        if body is None:
+            return None
+        return type, memoryview(body)
+
+    @staticmethod
+    def receiveExactly(connection: socket.socket, length: int) -> bytearray | None:
+        data = bytearray(length)
+        view = memoryview(data)
+        received = 0
+        while received < length:
+            count = connection.recv_into(view[received:])
+            if count == 0:
+                return None
+            received += count
+        return data
+
+    @staticmethod
+    def encodeStrings(values: list[str]) -> bytes:
+        return Codec.encodeCount(len(values)) + b"".join(Codec.encodeString(value) for value in values)
+
+    @staticmethod
+    def decodeStrings(view: memoryview, offset: int) -> tuple[list[str], int]:
+        count, offset = Codec.decodeCount(view, offset)
+        values = []
+        for _ in range(count):
+            value, offset = Codec.decodeString(view, offset)
+            values.append(value)
+        return values, offset
+
+    @staticmethod
+    def encodeRejections(rejected: dict[str, int]) -> bytes:
+        return Codec.encodeCount(len(rejected)) + b"".join(
+            Codec.encodeString(reason) + Codec.encodeCount(count) for reason, count in rejected.items()
+        )
+
+    @staticmethod
+    def decodeRejections(view: memoryview, offset: int) -> tuple[dict[str, int], int]:
+        count, offset = Codec.decodeCount(view, offset)
+        rejected = {}
+        for _ in range(count):
+            reason, offset = Codec.decodeString(view, offset)
+            rejected[reason], offset = Codec.decodeCount(view, offset)
+        return rejected, offset
+
+    @staticmethod
+    def encodeReply(blocks: bytes, transactions: list[Transaction], output: str) -> bytes:
+        return blocks + Transaction.encodeMany(transactions) + output.encode("utf-8")
+
+    # Returns the blocks, transactions and output of a REPLY
+    @staticmethod
+    def decodeReply(view: memoryview, offset: int = 0) -> tuple[list[Block], list[Transaction], str]:
+        blocks, offset = Block.decodeMany(view, offset)
+        transactions, offset = Transaction.decodeMany(view, offset)
+        return blocks, transactions, str(view[offset:], "utf-8")
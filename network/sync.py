@@ -0,0 +1,130 @@
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from blockchain.codec import Codec
+from blockchain.constants import MAX_REORG_DEPTH
+from blockchain.merkle_tree import MerkleTree
+from blockchain.transaction import Transaction
+from network.mempool import Mempool
+from network.node import Node
+from utils.utils import Metrics
+
+# The Sync class brings the blockchain of a node up to date with the blockchain of a peer, sending only the blocks it misses
+#
+#   1. The tips are compared: a node whose tip is in the chain of the peer only misses the blocks after it
+#   2. Otherwise the common ancestor is found with a binary search on the hashes of the blocks at the same height, since
+#      a block commits to every block before it through the hash links
+#   3. Only a peer whose chain is longer is followed, as in the choice of branch (see Blockchain.addBranchBlock), and
+#      never a peer whose chain starts with another genesis block, which would hand it every balance, land and stake
+#   4. The peer sends the blocks after the common ancestor in batches of BATCH_SIZE blocks in the binary format, which are
+#      added to a candidate blockchain sharing the store of the node and rewound to the common ancestor
+#   5. Every block is verified before it is added: its ID, its hash link to the tip, its merkle root and the validity of
+#      its transactions on top of the tip (see Mempool.check). The hash of the last block must be the tip hash announced
+#      by the peer, which through the hash links covers every block sent
+#   6. Only once the whole suffix is valid does the node take the candidate blockchain, keeping the blocks it dropped in
+#      its tree. A batch which fails verification leaves the chain and pool of the node as they were
+#   7. The transaction pool of the node is rebuilt from the transactions of the blocks it dropped, its own pending
+#      transactions and those of the peer, validated against the new tip
+# Besides the log(length) hashes compared to find the common ancestor, the work only depends on the number of missing blocks
+class Sync:
+    BATCH_SIZE = 100
+
+    # Returns the number of blocks the two blockchains have in common
+    @staticmethod
+    def findCommonLength(blockchain: Blockchain, peerBlockchain: Blockchain) -> int:
+        length = min(blockchain.getLength(), peerBlockchain.getLength())
+        if length == 0 or blockchain.store.blocks[0].hash != peerBlockchain.store.blocks[0].hash:
+            return 0
+        if blockchain.store.blocks[length - 1].hash == peerBlockchain.store.blocks[length - 1].hash:
+            return length
+        low, high = 1, length - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if blockchain.store.blocks[middle - 1].hash == peerBlockchain.store.blocks[middle - 1].hash:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    # Returns the blocks of a blockchain between two heights in the binary format, as they are sent to the node
+    @staticmethod
+    def encodeBlocks(blockchain: Blockchain, start: int, end: int) -> bytes:
+        return Codec.encodeCount(end - start) + b"".join([blockchain.store.getEncodedBlock(height) for height in range(start, end)])
+
+    # Returns the reasons a block cannot be added on top of the tip of the blockchain
+    @staticmethod
+    def verifyBlock(blockchain: Blockchain, block: Block) -> list[str]:
+        errors = []
+        if block.id != blockchain.getLength():
+            errors.append(f"Block {block.id} is not the next block (height {blockchain.getLength()})")
+        if block.previousBlockHash != blockchain.getLastBlock().hash:
+            errors.append(f"Block {block.id} does not hold the hash of the tip")
+        if block.merkleRoot != MerkleTree.getMerkleRoot(block.data):
+            errors.append(f"Block {block.id} does not hold the merkle root of its transactions")
+        mempool = Mempool()
+        for transaction in block.data:
+            reason = mempool.admit(transaction, blockchain)
+            if reason is not None:
+                errors.append(f"Transaction {transaction.id} in block {block.id} is invalid as {reason}")
+        return errors
+
+    # Brings the blockchain of the node up to date with the blockchain of the peer
+    # Returns the length of the common chain, the number of blocks added and the errors which stopped the sync
+    @staticmethod
+    def sync(node: Node, peer: Node) -> tuple[int, int, list[str]]:
+        length = node.blockchain.getLength()
+        peerLength = peer.blockchain.getLength()
+        peerTipHash = peer.blockchain.getLastBlock().hash
+        commonLength = Sync.findCommonLength(node.blockchain, peer.blockchain)
+        if peerTipHash == node.blockchain.getLastBlock().hash:
+            return commonLength, 0, []
+        if commonLength == 0:
+            return commonLength, 0, [f"The blockchain of {peer.id} does not start with the genesis block of {node.id}"]
+        if peerLength <= length:
+            return commonLength, 0, [f"The blockchain of {peer.id} is not longer than the blockchain of {node.id}"]
+
+        candidate = node.blockchain.share()
+        candidate.rewind(commonLength)
+        droppedBlocks = list(node.blockchain.iterBlocks(commonLength))
+        errors = []
+        for start in range(candidate.getLength(), peerLength, Sync.BATCH_SIZE):
+            blocks, _ = Block.decodeMany(memoryview(Sync.encodeBlocks(peer.blockchain, start, min(start + Sync.BATCH_SIZE, peerLength))), 0)
+            for block in blocks:
+                errors = Sync.verifyBlock(candidate, block)
+                if len(errors) > 0:
+                    break
+                candidate.appendBlock(block, peerLength)
+            if len(errors) > 0:
+                break
+        if len(errors) == 0 and candidate.getLastBlock().hash != peerTipHash:
+            errors = [f"The tip of the blockchain is not the tip announced by {peer.id}"]
+        if len(errors) > 0:
+            Sync.restore(node, candidate, commonLength, droppedBlocks, length)
+            return commonLength, 0, errors
+
+        candidate.tree = node.blockchain.tree
+        for block in droppedBlocks:
+            candidate.tree.add(block)
+        candidate.tree.prune(candidate.getLength() - MAX_REORG_DEPTH)
+        node.blockchain = candidate
+        if len(droppedBlocks) > 0:
+            Metrics.increment("reorganizations_total")
+            Metrics.increment("blocks_dropped_total", amount=len(droppedBlocks))
+        Sync.reconcilePool(node, peer, [transaction for block in droppedBlocks for transaction in block.data])
+        return commonLength, peerLength - commonLength, []
+
+    # Puts the blocks the node dropped back in the store the candidate blockchain switched to its blocks (see
+    # BlockStore.diverge), which leaves the chain of the node as it was before the sync
+    @staticmethod
+    def restore(node: Node, candidate: Blockchain, commonLength: int, droppedBlocks: list[Block], length: int) -> None:
+        candidate.rewind(commonLength)
+        node.blockchain.rewind(commonLength)
+        for block in droppedBlocks:
+            node.blockchain.appendBlock(block, length)
+
+    # Rebuilds the pool of the node from the transactions of the dropped blocks, its pending transactions and those of the
+    # peer, in that order. Transactions included in the new blocks or no longer valid on top of the new tip are left out
+    @staticmethod
+    def reconcilePool(node: Node, peer: Node, dropped: list[Transaction]) -> None:
+        node.transactionPool = Mempool.fromTransactions(
+            dropped + list(node.transactionPool) + list(peer.transactionPool), node.blockchain
+        )
@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from blockchain.block import Block
+from blockchain.block_store import BlockStore
+from blockchain.blockchain import Blockchain
+from blockchain.codec import Codec
+from blockchain.merkle_tree import MerkleTree
+from network.mempool import Mempool
+from utils.utils import Log
+
+# Checks the blocks of a range which are given in the binary format, starting at the given height
+#   Every block has the ID of its height
+#   Every block holds the hash of the previous block of the range
+#   Every block holds the merkle root of its transactions
+# Returns the previous block hash of the first block, the hash of the last block, the number of transactions and the errors found
+# This runs in the worker processes of the Verifier, so it only takes and returns plain values
+def verifyBlocks(data: bytes, start: int) -> tuple[str, str, int, list[str]]:
+    blocks, _ = Block.decodeMany(memoryview(data), 0)
+    errors = []
+    transactions = 0
+    for height, block in enumerate(blocks, start):
+        transactions += len(block.data)
+        if block.id != height:
+            errors.append(f"Block {height} has ID {block.id}")
+        if height > start and block.previousBlockHash != blocks[height - start - 1].hash:
+            errors.append(f"Block {height} does not hold the hash of block {height - 1}")
+        if height > 0 and block.merkleRoot != MerkleTree.getMerkleRoot(block.data):
+            errors.append(f"Block {height} does not hold the merkle root of its transactions")
+    return blocks[0].previousBlockHash, blocks[-1].hash, transactions, errors
+
+
+# The Verifier class checks a whole blockchain
+#   The hash links and merkle roots of all blocks are recomputed in a pool of processes, in ranges of blocks
+#   At the same time, all transactions are executed again in order under the validation rules of the transaction pool
+#   (see Mempool.check), starting from the genesis block, and the resulting state is compared to the materialized state
+# A range which cannot be read or decoded (for example a corrupt segment or a truncated record on disk) is reported as an
+# error of its blocks, and the replay stops at the first range it cannot read
+class Verifier:
+    BLOCKS_PER_TASK = 1000
+    MAX_REPORTED_ERRORS = 20
+
+    def __init__(self, workers: int | None = None) -> None:
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+
+    # Returns whether the blockchain is valid, and logs the errors found and the throughput
+    def verify(self, blockchain: Blockchain) -> bool:
+        start = time.perf_counter()
+        length = blockchain.getLength()
+        ranges = [(height, min(height + Verifier.BLOCKS_PER_TASK, length)) for height in range(0, length, Verifier.BLOCKS_PER_TASK)]
+        errors = []
+        replayErrors = []
+        transactions = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # At most two ranges per worker are in flight so that the encoded blocks of the whole chain are never held in memory
+            futures: dict[int, Future | Exception] = {}
+            submitted = 0
+            results = []
+            replayedLength = 0
+            replay = Blockchain(BlockStore([blockchain.getBlockFromHeight(0)]))
+            while len(results) < len(ranges):
+                while submitted < len(ranges) and len(futures) < 2 * self.workers:
+                    first, last = ranges[submitted]
+                    try:
+                        data = Codec.encodeCount(last - first) + b"".join(
+                            [blockchain.store.getEncodedBlock(height) for height in range(first, last)]
+                        )
+                        futures[submitted] = executor.submit(verifyBlocks, data, first)
+                    except Exception as error:
+                        futures[submitted] = error
+                    submitted += 1
+
+                # Replay the next range while the workers hash
+                first, last = ranges[len(results)]
+                if replayedLength is not None:
+                    try:
+                        for height in range(max(first, replayedLength, 1), last):
+                            replayErrors += self.replayBlock(replay, blockchain.getBlockFromHeight(height))
+                        replayedLength = last
+                    except Exception as error:
+                        replayErrors.append(f"Blocks {first} to {last - 1} could not be replayed ({type(error).__name__}: {error})")
+                        replayedLength = None
+
+                future = futures.pop(len(results))
+                try:
+                    if isinstance(future, Exception):
+                        raise future
+                    results.append(future.result())
+                except Exception as error:
+                    results.append((None, None, 0, [f"Blocks {first} to {last - 1} could not be verified ({type(error).__name__}: {error})"]))
+
+        previousHash = None
+        for (first, _), (firstPreviousHash, lastHash, count, rangeErrors) in zip(ranges, results):
+            if previousHash is not None and firstPreviousHash is not None and firstPreviousHash != previousHash:
+                rangeErrors = [f"Block {first} does not hold the hash of block {first - 1}"] + rangeErrors
+            errors += rangeErrors
+            previousHash = lastHash
+            transactions += count
+
+        errors += replayErrors
+        if replayedLength is not None and replay.state != blockchain.state:
+            errors.append("The materialized state does not match the replayed state")
+
+        elapsed = time.perf_counter() - start
+        for error in errors[:Verifier.MAX_REPORTED_ERRORS]:
+            Log.error(error)
+        if len(errors) > Verifier.MAX_REPORTED_ERRORS:
+            Log.error(f"... and {len(errors) - Verifier.MAX_REPORTED_ERRORS} more errors")
+        Log.info(
+            f"Verified {length} blocks ({transactions} transactions) in {elapsed:.3f}s using {self.workers} processes: "
+            f"{length / elapsed:.0f} blocks/s, {transactions / elapsed:.0f} transactions/s",
+            "VERIFY"
+        )
+        return len(errors) == 0
+
+    # Executes the transactions of a block in order on top of the replayed chain, then appends the block to it
+    def replayBlock(self, replay: Blockchain, block: Block) -> list[str]:
+        errors = []
+        mempool = Mempool()
+        for transaction in block.data:
+            reason = mempool.add(transaction, replay)
+            if reason is not None:
+                errors.append(f"Transaction {transaction.id} in block {block.id} is invalid as {reason}")
+        # The hash links are checked by the workers, so the block is appended without checking them again
+        replay.store.append(block)
+        replay.length += 1
+        return errors
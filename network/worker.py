@@ -0,0 +1,214 @@
+import contextlib
+import io
+import socket
+import traceback
+
+from blockchain.block import Block
+from blockchain.blockchain import Blockchain
+from blockchain.codec import Codec
+from blockchain.transaction import Transaction
+from network.mempool import Mempool
+from network.network import Network
+from network.node import Node
+from network.peers import Peers
+from network.protocol import Protocol
+from utils.utils import Log, Metrics
+
+# ClusterWorker is the network of the nodes hosted by one worker process of a Cluster
+#
+# The worker handles the messages of the controller one at a time (see Protocol) and replies with the output printed
+# while handling them. Commands run on the hosted nodes as they would in a Network, but the transactions they create are
+# returned to the controller, which broadcasts them to every worker. When a hosted node is chosen as the validator the
+# block is minted, added to the hosted nodes and returned to the controller, which sends it to the other workers
+class ClusterWorker(Network):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.created: list[Transaction] = []
+
+    # A worker only hosts some of the nodes, the others are looked up in the peers sent by the controller
+    def nodeExists(self, nodeId: str | None = None) -> bool:
+        if nodeId is None:
+            if len(self.peers) <= 0:
+                Log.error(f"At least one node needs to be connected to the network")
+                return False
+            return True
+
+        if nodeId not in self.peers.getPositions():
+            Log.error(f"Node ID {nodeId} is invalid")
+            return False
+        return True
+
+    # Transactions created by commands are returned to the controller instead of being broadcast
+    def broadcastTransaction(self, transaction: Transaction) -> None:
+        self.created.append(transaction)
+
+    # Adds transactions to the pools of the hosted nodes, then mints if a hosted node is chosen as the validator
+    # Returns the blocks minted and, as in Network.ingest, the number of transactions rejected by the pool of the first node
+    # of the cluster by reason (empty when another worker hosts it)
+    def addTransactions(self, transactions: list[Transaction]) -> tuple[list[Block], dict[str, int]]:
+        rejected = {}
+        first = self.peers[0] if len(self.peers) > 0 else None
+        for transaction in transactions:
+            for node in self.nodes.values():
+                node.addTransaction(transaction, self.peers, rejected if node.id == first else None)
+        return self.mintBlocks(), rejected
+
+    # Adds a block to the blockchains of the hosted nodes, then mints if a hosted node is chosen as the validator of the new tip
+    def addBlock(self, block: Block) -> list[Block]:
+        for node in self.nodes.values():
+            node.addBlock(block)
+        return self.mintBlocks()
+
+    # Returns the blocks minted by the hosted nodes, which are already added to their blockchains
+    def mintBlocks(self) -> list[Block]:
+        blocks = []
+        validator = next((node for node in self.nodes.values() if node.isValidator(self.peers)), None)
+        while validator is not None:
+            Node.logValidator(validator.id)
+            block = validator.mint()
+            if block is None:
+                break
+            for node in self.nodes.values():
+                node.addBlock(block)
+            blocks.append(block)
+            validator = next((node for node in self.nodes.values() if node.isValidator(self.peers)), None)
+        return blocks
+
+    # Hosts a new node
+    # The node shares the blockchain and copies the pool of a hosted node, otherwise it starts from the given blocks and pool
+    # The first node of the cluster starts a new blockchain
+    def join(self, nodeId: str, balance: int, blocks: list[Block] | None, pool: list[Transaction]) -> None:
+        Log.info(f"Node {nodeId} is trying to join the network", "NEW NODE")
+        if len(self.nodes) > 0:
+            existingNode = list(self.nodes.values())[0]
+            node = Node(nodeId, existingNode.blockchain.share(), existingNode.transactionPool.copy())
+        elif blocks is not None:
+            node = Node(nodeId, Blockchain.fromBlocks(blocks), Mempool())
+            for transaction in pool:
+                node.transactionPool.add(transaction, node.blockchain)
+        else:
+            node = Node(nodeId, Blockchain(), Mempool())
+        self.nodes[nodeId] = node
+        self.broadcastTransaction(node.registerCoins(balance))
+
+    # Returns the encoded blocks of the blockchain from a height, and the pool of the first hosted node
+    def sync(self, height: int) -> tuple[bytes, list[Transaction]]:
+        node = list(self.nodes.values())[0]
+        store = node.blockchain.store
+        length = node.blockchain.getLength()
+        blocks = Codec.encodeCount(max(length - height, 0)) + b"".join(
+            [store.getEncodedBlock(h) for h in range(height, length)]
+        )
+        return blocks, list(node.transactionPool)
+
+    # Saves the whole cluster as a network
+    # The nodes hosted by other workers follow the same blockchain, so they share the blockchain of a hosted node
+    def saveCluster(self, directory: str, others: list[tuple[str, int, list[Transaction]]]) -> None:
+        store = list(self.nodes.values())[0].blockchain.store
+        nodes = dict(self.nodes)
+        for nodeId, length, transactions in others:
+            node = Node(nodeId, Blockchain(store, length), Mempool())
+            for transaction in transactions:
+                node.transactionPool.add(transaction, node.blockchain)
+            nodes[nodeId] = node
+        network = Network()
+        network.addNodes([nodes[nodeId] for nodeId in self.peers])
+        network.save(directory)
+
+    # Handles a message of the controller and returns the type and body of the reply
+    def receive(self, type: int, body: memoryview) -> tuple[int, bytes]:
+        blocks = Block.encodeMany([])
+        rejections = b""
+        pending = []
+        output = io.StringIO()
+        self.created = []
+        try:
+            with contextlib.redirect_stdout(output):
+                try:
+                    match type:
+                        case Protocol.PEERS:
+                            peers, _ = Protocol.decodeStrings(body, 0)
+                            self.peers = Peers(peers)
+                        case Protocol.COMMAND:
+                            self.handle(str(body, "utf-8").split(" "))
+                        case Protocol.JOIN:
+                            nodeId, offset = Codec.decodeString(body, 0)
+                            balance, offset = Codec.decodeInteger(body, offset)
+                            hasBlocks, offset = Codec.decodeCount(body, offset)
+                            chain, pool = None, []
+                            if hasBlocks:
+                                chain, offset = Block.decodeMany(body, offset)
+                                pool, offset = Transaction.decodeMany(body, offset)
+                            self.join(nodeId, balance, chain, pool)
+                        case Protocol.SYNC:
+                            height, _ = Codec.decodeCount(body, 0)
+                            blocks, pending = self.sync(height)
+                        case Protocol.TRANSACTIONS:
+                            transactions, _ = Transaction.decodeMany(body, 0)
+                            minted, rejected = self.addTransactions(transactions)
+                            blocks = Block.encodeMany(minted)
+                            rejections = Protocol.encodeRejections(rejected)
+                        case Protocol.BLOCK:
+                            block, _ = Block.decode(body, 0)
+                            blocks = Block.encodeMany(self.addBlock(block))
+                        case Protocol.NODES:
+                            return Protocol.REPLY, self.describeNodes()
+                        case Protocol.SAVE:
+                            directory, offset = Codec.decodeString(body, 0)
+                            count, offset = Codec.decodeCount(body, offset)
+                            others = []
+                            for _ in range(count):
+                                nodeId, offset = Codec.decodeString(body, offset)
+                                length, offset = Codec.decodeCount(body, offset)
+                                transactions, offset = Transaction.decodeMany(body, offset)
+                                others.append((nodeId, length, transactions))
+                            self.saveCluster(directory, others)
+                        case _:
+                            raise ValueError(f"Unknown message type {type}")
+                finally:
+                    # The buffered output is written to the output of the message
+                    Log.flush()
+        except Exception:
+            return Protocol.ERROR, (output.getvalue() + traceback.format_exc()).encode("utf-8")
+        return Protocol.REPLY, rejections + Protocol.encodeReply(blocks, pending + self.created, output.getvalue())
+
+    # Returns the ID, chain length and pool of every hosted node
+    def describeNodes(self) -> bytes:
+        data = [Codec.encodeCount(len(self.nodes))]
+        for node in self.nodes.values():
+            data.append(Codec.encodeString(node.id))
+            data.append(Codec.encodeCount(node.blockchain.getLength()))
+            data.append(Transaction.encodeMany(list(node.transactionPool)))
+        return b"".join(data)
+
+
+# Entry point of a worker process
+# Connects to the controller at the address (a Unix socket path), optionally loads a saved network keeping every
+# count-th node starting at the index, then handles messages until it is stopped
+# If the network cannot be loaded, the error is sent to the controller instead of HELLO
+def runWorker(address: str, index: int, count: int, directory: str | None) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(address)
+        worker = ClusterWorker()
+        loaded = []
+        if directory is not None:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    network = Network.load(directory)
+                    Log.flush()
+            except Exception:
+                Protocol.send(connection, Protocol.ERROR, traceback.format_exc().encode("utf-8"))
+                return
+            loaded = network.getPeers()
+            worker.peers = loaded
+            worker.nodes = {nodeId: network.nodes[nodeId] for nodeId in loaded[index::count]}
+
+        Metrics.dumpSuffix = f".worker-{index}"
+        Protocol.send(connection, Protocol.HELLO, Codec.encodeCount(index) + Protocol.encodeStrings(loaded))
+        while True:
+            message = Protocol.receive(connection)
+            if message is None or message[0] == Protocol.STOP:
+                break
+            Protocol.send(connection, *worker.receive(*message))
+        Metrics.stopDumping()
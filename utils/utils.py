@@ -1,4 +1,14 @@
+import atexit
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import tracemalloc
 import uuid
+from typing import Callable, TextIO
 from termcolor import colored
 
 class Command:
@@ -7,17 +17,385 @@ class Command:
         self.syntax = syntax
         self.help = help
 
+# The Log class writes the events of the network and the output of the commands
+#
+# Levels: Every event has a level (DEBUG, INFO, WARNING or ERROR) and a type, which is the tag printed before it
+#   (INFO, MINTING, VALIDATION, ...). Events below the level of their type (see setLevel) are dropped
+#   The message of an event can be a function returning the message, which is only called if the event is written,
+#   so that disabled events cost a level check
+# Output: Lines are buffered and written BUFFER_SIZE lines at a time or when flush() is called (before every prompt
+#   and when the program exits). With asynchronous output a thread writes the buffered lines
+#   The output of the commands (tables, blocks, ...) goes through output() so that it stays in order with the events
+# JSON lines: The events which are written can also be written to a file as JSON objects, without colors
 class Log:
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+    OFF = 100
+
+    LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": OFF}
+    NAMES = {value: name for name, value in LEVELS.items()}
+    BUFFER_SIZE = 256
+    COLORS = re.compile(r"\x1b\[[0-9;]*m")
+
+    level = INFO
+    typeLevels: dict[str, int] = {}
+    buffer: list[str] = []
+    stream: TextIO | None = None
+    jsonPath: str | None = None
+    jsonFile: TextIO | None = None
+    writer: threading.Thread | None = None
+    pending: queue.Queue = queue.Queue()
+
+    # Sets the level of the events of a type, or of all events without a level of their own if type is None
+    @staticmethod
+    def setLevel(level: str | int, type: str | None = None) -> None:
+        if isinstance(level, str):
+            if level.lower() not in Log.LEVELS:
+                raise ValueError(f"Unknown log level {level}")
+            level = Log.LEVELS[level.lower()]
+        if type is None:
+            Log.level = level
+        else:
+            Log.typeLevels[type.upper()] = level
+
+    @staticmethod
+    def isEnabled(level: int, type: str) -> bool:
+        return level >= Log.typeLevels.get(type, Log.level)
+
+    # Writes every event to a file of JSON lines as well (None stops writing to the file)
+    @staticmethod
+    def setJsonFile(path: str | None) -> None:
+        if Log.jsonFile is not None:
+            Log.jsonFile.close()
+        Log.jsonPath = path
+        Log.jsonFile = open(path, "a", encoding="utf-8") if path is not None else None
+
+    # Writes the buffered lines with a thread, so that the network does not wait on the terminal
+    @staticmethod
+    def setAsynchronous(asynchronous: bool) -> None:
+        Log.flush()
+        if asynchronous and Log.writer is None:
+            Log.writer = threading.Thread(target=Log.write, daemon=True)
+            Log.writer.start()
+        elif not asynchronous and Log.writer is not None:
+            Log.pending.put(None)
+            Log.writer.join()
+            Log.writer = None
+
+    @staticmethod
+    def debug(message: str | Callable[[], str], type: str = 'DEBUG', nodeId: str = "", end="\n") -> None:
+        Log.event(Log.DEBUG, message, type, nodeId, end)
+
+    @staticmethod
+    def info(message: str | Callable[[], str], type: str = 'INFO', nodeId: str = "", end="\n") -> None:
+        Log.event(Log.INFO, message, type, nodeId, end)
+
     @staticmethod
-    def info(message: str, type: str = 'INFO', nodeId: str = "", end="\n") -> None:
-        infoMessage = f"{colored(type, 'blue', attrs=['bold'])}: {message}"
+    def warning(message: str | Callable[[], str], type: str = 'WARNING', nodeId: str = "", end="\n") -> None:
+        Log.event(Log.WARNING, message, type, nodeId, end)
+
+    @staticmethod
+    def error(message: str | Callable[[], str]) -> None:
+        Log.event(Log.ERROR, message, 'ERROR', "", "\n")
+
+    @staticmethod
+    def event(level: int, message: str | Callable[[], str], type: str, nodeId: str, end: str) -> None:
+        if not Log.isEnabled(level, type):
+            return
+        if callable(message):
+            message = message()
+        if Log.jsonFile is not None:
+            Log.jsonFile.write(json.dumps({
+                "time": time.time(),
+                "level": Log.NAMES[level],
+                "type": type,
+                "node": nodeId,
+                "message": Log.COLORS.sub("", message)
+            }) + "\n")
+
+        if level >= Log.ERROR:
+            infoMessage = f"{colored(type, 'red', attrs=['bold'])}: {message}"
+        else:
+            infoMessage = f"{colored(type, 'blue', attrs=['bold'])}: {message}"
         if nodeId != "":
             infoMessage = f"[{colored(nodeId, 'yellow', attrs=['bold'])}] " + infoMessage
-        print(infoMessage, end=end)
-    
+        Log.output(infoMessage, end=end)
+
+    # Writes the output of a command, whatever the levels
+    @staticmethod
+    def output(text: object = "", end: str = "\n") -> None:
+        # Lines buffered for another stream (for example before sys.stdout was redirected) are written first
+        if sys.stdout is not Log.stream:
+            Log.flush()
+            Log.stream = sys.stdout
+        Log.buffer.append(f"{text}{end}")
+        if len(Log.buffer) >= Log.BUFFER_SIZE:
+            Log.flush(wait=False)
+
+    # Writes the buffered lines
+    # When wait is set, returns once they are written (by the thread when the output is asynchronous)
     @staticmethod
-    def error(message: str) -> None:
-        print(f"{colored('ERROR', 'red', attrs=['bold'])}: {message}")
+    def flush(wait: bool = True) -> None:
+        if len(Log.buffer) > 0 and Log.stream is not None:
+            start = Metrics.start()
+            text = "".join(Log.buffer)
+            Log.buffer = []
+            if Log.writer is not None:
+                Log.pending.put((Log.stream, text))
+            else:
+                Log.stream.write(text)
+            Metrics.stop("output_seconds", start)
+        if not wait:
+            return
+        if Log.writer is not None:
+            Log.pending.join()
+        if Log.stream is not None:
+            Log.stream.flush()
+        if Log.jsonFile is not None:
+            Log.jsonFile.flush()
+
+    # Writes the lines given to the thread of the asynchronous output
+    @staticmethod
+    def write() -> None:
+        while True:
+            item = Log.pending.get()
+            if item is None:
+                Log.pending.task_done()
+                return
+            stream, text = item
+            stream.write(text)
+            Log.pending.task_done()
+
+    # The buffers are written before forking, and a forked process (see Cluster) starts with an empty buffer,
+    # its own JSON lines file handle and synchronous output
+    @staticmethod
+    def resetAfterFork() -> None:
+        Log.buffer = []
+        Log.stream = None
+        Log.pending = queue.Queue()
+        Log.writer = None
+        if Log.jsonPath is not None:
+            Log.jsonFile = open(Log.jsonPath, "a", encoding="utf-8")
+
+# The Metrics class holds the counters, timers and gauges of the network
+#
+# Counters: Number of events (blocks minted, transactions admitted and rejected by reason, hashes computed, ...)
+# Timers: Count, total and maximum duration of an operation (elections, minting, broadcasts, ...)
+# Gauges: Values read when the metrics are reported (pool depth and chain length of every node, memory)
+# Every metric has at most one label (node, reason, ...), see DEFINITIONS
+#
+# Instrumentation is off by default: the recording functions return at once and timed code only reads the clock when
+#   it is on, so the hot paths pay an attribute check
+# Memory is traced with tracemalloc, which is only started on request as it slows every allocation down. tracemalloc
+#   attributes memory to the code which allocated it, so memory is reported by source file (the nodes share their blocks,
+#   see BlockStore), and the pool depth and chain length by node
+# The metrics can be written to a file in the Prometheus text format (or as JSON for a .json file), once or periodically by a thread
+class Metrics:
+    PREFIX = "landpos_"
+    MEMORY_FILES = 10
+
+    DEFINITIONS: dict[str, tuple[str, str, str]] = {
+        "transactions_broadcast_total": ("counter", "", "Transactions broadcast to all nodes"),
+        "transactions_admitted_total": ("counter", "", "Transactions admitted to a transaction pool"),
+        "transactions_rejected_total": ("counter", "reason", "Transactions rejected by a transaction pool"),
+        "transactions_evicted_total": ("counter", "reason", "Pending transactions evicted from a transaction pool by a new block"),
+        "blocks_minted_total": ("counter", "node", "Blocks minted"),
+        "blocks_added_total": ("counter", "", "Blocks added to a blockchain"),
+        "branch_blocks_total": ("counter", "", "Blocks kept on a competing branch of a blockchain"),
+        "reorganizations_total": ("counter", "", "Switches of a blockchain to a longer branch"),
+        "blocks_dropped_total": ("counter", "", "Blocks dropped from a blockchain by a switch to a longer branch"),
+        "hashes_computed_total": ("counter", "kind", "SHA-256 hashes computed for block headers and merkle trees"),
+        "elections_total": ("counter", "result", "Validator elections, computed or read from the cache"),
+        "broadcast_seconds": ("timer", "", "Time to broadcast a transaction to all nodes, including the blocks it leads to"),
+        "validation_seconds": ("timer", "", "Time to validate a transaction and add it to a transaction pool"),
+        "election_seconds": ("timer", "", "Time to compute the validator of a block"),
+        "mint_seconds": ("timer", "", "Time to mint a block"),
+        "block_apply_seconds": ("timer", "", "Time to apply a block to the state and indexes of a block store"),
+        "output_seconds": ("timer", "", "Time to write the output"),
+        "pool_depth": ("gauge", "node", "Transactions in the transaction pool of a node"),
+        "chain_length": ("gauge", "node", "Length of the blockchain of a node"),
+        "memory_current_bytes": ("gauge", "", "Memory traced by tracemalloc"),
+        "memory_peak_bytes": ("gauge", "", "Peak memory traced by tracemalloc"),
+        "memory_bytes": ("gauge", "file", "Memory allocated by a source file and still in use")
+    }
+
+    enabled = False
+    counters: dict[str, dict[str, int]] = {}
+    timers: dict[str, dict[str, list[float]]] = {}
+    collector: Callable[[], list[tuple[str, str, float]]] | None = None
+    dumper: threading.Thread | None = None
+    dumpStop = threading.Event()
+    dumpPath: str | None = None
+    dumpSuffix = ""
+
+    # Turns instrumentation on or off, memory tracing is only on when requested
+    @staticmethod
+    def setEnabled(enabled: bool, memory: bool = False) -> None:
+        Metrics.enabled = enabled
+        if enabled and memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not (enabled and memory) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def reset() -> None:
+        Metrics.counters = {}
+        Metrics.timers = {}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    @staticmethod
+    def increment(name: str, label: str = "", amount: int = 1) -> None:
+        if not Metrics.enabled:
+            return
+        values = Metrics.counters.setdefault(name, {})
+        values[label] = values.get(label, 0) + amount
+
+    # Returns the start time of a timed operation, or None when instrumentation is off
+    @staticmethod
+    def start() -> float | None:
+        return time.perf_counter() if Metrics.enabled else None
+
+    # Records the duration of an operation which started at start (see start())
+    @staticmethod
+    def stop(name: str, start: float | None, label: str = "") -> None:
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        timer = Metrics.timers.setdefault(name, {}).setdefault(label, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += duration
+        timer[2] = max(timer[2], duration)
+
+    # Returns a copy of the counters and timers along with the gauges read from the network (see collector) and tracemalloc
+    # The copy can be taken by the thread writing the metrics while the network records new ones
+    @staticmethod
+    def collect() -> tuple[dict[str, dict[str, int]], dict[str, dict[str, list[float]]], dict[str, dict[str, float]]]:
+        counters = {name: dict(values) for name, values in list(Metrics.counters.items())}
+        timers = {name: {label: list(timer) for label, timer in list(values.items())} for name, values in list(Metrics.timers.items())}
+        gauges: dict[str, dict[str, float]] = {}
+        if Metrics.collector is not None:
+            for name, label, value in Metrics.collector():
+                gauges.setdefault(name, {})[label] = value
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            gauges["memory_current_bytes"] = {"": current}
+            gauges["memory_peak_bytes"] = {"": peak}
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            gauges["memory_bytes"] = {
+                os.path.relpath(statistic.traceback[0].filename): statistic.size
+                for statistic in snapshot.statistics("filename")[:Metrics.MEMORY_FILES]
+            }
+        return counters, timers, gauges
+
+    # Returns a row for every value of every metric: name, label, value (count, average and maximum for timers)
+    @staticmethod
+    def getRows() -> list[list[str]]:
+        counters, timers, gauges = Metrics.collect()
+        rows = []
+        for name, (kind, _, _) in Metrics.DEFINITIONS.items():
+            if kind == "timer":
+                for label, (count, total, maximum) in sorted(timers.get(name, {}).items()):
+                    rows.append([name, label, f"{count} x {total / count * 1e6:.1f}us (max {maximum * 1e6:.1f}us)"])
+            else:
+                values = (counters if kind == "counter" else gauges).get(name, {})
+                for label, value in sorted(values.items()):
+                    rows.append([name, label, f"{value:,}"])
+        return rows
+
+    # Returns the metrics in the Prometheus text format, timers are summaries (count and sum) with a gauge for the maximum
+    @staticmethod
+    def toPrometheus() -> str:
+        counters, timers, gauges = Metrics.collect()
+        lines = []
+        for name, (kind, labelName, help) in Metrics.DEFINITIONS.items():
+            metric = Metrics.PREFIX + name
+            if kind == "timer":
+                values = timers.get(name, {})
+                lines += [f"# HELP {metric} {help}", f"# TYPE {metric} summary"]
+                for label, (count, total, _) in values.items():
+                    lines.append(f"{metric}_count{Metrics.formatLabel(labelName, label)} {count}")
+                    lines.append(f"{metric}_sum{Metrics.formatLabel(labelName, label)} {total}")
+                lines += [f"# HELP {metric}_max Maximum of {help[0].lower()}{help[1:]}", f"# TYPE {metric}_max gauge"]
+                for label, (_, _, maximum) in values.items():
+                    lines.append(f"{metric}_max{Metrics.formatLabel(labelName, label)} {maximum}")
+            else:
+                lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+                for label, value in (counters if kind == "counter" else gauges).get(name, {}).items():
+                    lines.append(f"{metric}{Metrics.formatLabel(labelName, label)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def formatLabel(labelName: str, label: str) -> str:
+        if labelName == "":
+            return ""
+        label = label.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        return f'{{{labelName}="{label}"}}'
+
+    @staticmethod
+    def toJson() -> dict:
+        counters, timers, gauges = Metrics.collect()
+        return {
+            "time": time.time(),
+            "counters": counters,
+            "timers": {
+                name: {label: {"count": count, "sum": total, "max": maximum} for label, (count, total, maximum) in values.items()}
+                for name, values in timers.items()
+            },
+            "gauges": gauges
+        }
+
+    # Writes the metrics to a file, as JSON if its name ends with .json and in the Prometheus text format otherwise
+    # The file is replaced at once, so that readers never see a partial file. dumpSuffix is added before the extension
+    # (workers of a Cluster write a file each). Returns the path of the file
+    @staticmethod
+    def dump(path: str) -> str:
+        root, extension = os.path.splitext(path)
+        path = f"{root}{Metrics.dumpSuffix}{extension}"
+        text = json.dumps(Metrics.toJson(), indent=2) if extension == ".json" else Metrics.toPrometheus()
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    # Writes the metrics to a file every interval seconds with a thread, and once more when stopped
+    @staticmethod
+    def startDumping(path: str, interval: float) -> None:
+        Metrics.stopDumping()
+        Metrics.dumpPath = path
+        Metrics.dumpStop = threading.Event()
+        Metrics.dumper = threading.Thread(target=Metrics.dumpPeriodically, args=(path, interval, Metrics.dumpStop), daemon=True)
+        Metrics.dumper.start()
+
+    @staticmethod
+    def dumpPeriodically(path: str, interval: float, stop: threading.Event) -> None:
+        while not stop.wait(interval):
+            Metrics.dump(path)
+
+    @staticmethod
+    def stopDumping() -> None:
+        if Metrics.dumper is None:
+            return
+        Metrics.dumpStop.set()
+        Metrics.dumper.join()
+        Metrics.dumper = None
+        if Metrics.dumpPath is not None:
+            Metrics.dump(Metrics.dumpPath)
+            Metrics.dumpPath = None
+
+    # A forked process (see Cluster) keeps the metrics settings but not the thread writing them
+    @staticmethod
+    def resetAfterFork() -> None:
+        Metrics.dumper = None
+        Metrics.dumpPath = None
+        Metrics.dumpStop = threading.Event()
+
+atexit.register(Log.flush)
+atexit.register(Metrics.stopDumping)
+os.register_at_fork(before=Log.flush, after_in_child=Log.resetAfterFork)
+os.register_at_fork(after_in_child=Metrics.resetAfterFork)
 
 def id() -> str:
     return str(uuid.uuid4())